@@ -40,20 +40,31 @@ from bot_in import bot, dp
 
 # Config & logging
 from config import settings as s
-from db.database import async_session_maker
+from db.database import async_session_maker, engine, primary_session_maker, replica_engine, use_primary
+from db.slow_queries import SlowQueryLog
+from db.worker_session import WorkerSession
+from db.migrations import run_migrations
 from db.models import Base
 from logger_setup import logger
 from midllewares.db import DatabaseMiddleware
 from misc.bot_setup import SUB_EXPIRED_TEXT, SUB_WILL_EXPIRE
+from misc.metrics import get_metrics
+from cache import invalidation_listener
+from misc.cache_notify import cache_notify_listener
+from misc.outbox import outbox_relay_worker
+from misc.payment_partitions import payment_exists, payment_partition_worker
 
 # Utils / workers
 from misc.utils import (
     db_worker,
     get_links_of_panels,
+    incremental_cache_refresh_worker,
+    known_ids_worker,
     marzban_worker,
-    nightly_cache_refresh_worker,
     payment_wrk,
     pub_listner,
+    registration_worker,
+    rolling_cache_refresh_worker,
     trial_activation_worker,
     worker_exsists,
 )
@@ -83,19 +94,45 @@ async def lifespan(app: Litestar):
     #         await conn.run_sync(Base.metadata.create_all)
     print("✅ Database tables created")
 
+    await run_migrations(engine)
+    print("✅ Migrations applied")
 
-    # ✅ Создаём долгоживущую сессию для воркеров
-    worker_session = async_session_maker()
+
+    # ✅ Долгоживущие сессии воркеров (пишут - только primary), по одной на воркер:
+    # WorkerSession чистит identity map между задачами своего воркера
+    db_session = WorkerSession(primary_session_maker, name="db_worker")
+    trial_session = WorkerSession(primary_session_maker, name="trial_worker")
+    payment_session = WorkerSession(primary_session_maker, name="payment_wrk")
     
     # ✅ СОХРАНЯЕМ ссылки на задачи
     worker_tasks = [
-        asyncio.create_task(db_worker(redis_cli=redis, session=worker_session), name="db_worker"), # type: ignore
-        asyncio.create_task(trial_activation_worker(redis_cli=redis, session=worker_session), name="trial_worker"),
-        asyncio.create_task(nightly_cache_refresh_worker(redis_cache=redis, session_maker=async_session_maker), name="cache_worker"),
+        asyncio.create_task(db_worker(redis_cli=redis, session=db_session), name="db_worker"), # type: ignore
+        asyncio.create_task(trial_activation_worker(redis_cli=redis, session=trial_session), name="trial_worker"),
+        asyncio.create_task(rolling_cache_refresh_worker(redis_cache=redis, session_maker=async_session_maker), name="cache_worker"),
         asyncio.create_task(marzban_worker(redis_cli=redis), name="marzban_worker"),
         asyncio.create_task(pub_listner(redis_cli=redis), name="pub_listner"),
-        asyncio.create_task(payment_wrk(redis_cli=redis), name="payment_wrk"),
+        asyncio.create_task(payment_wrk(redis_cli=redis, session=payment_session), name="payment_wrk"),
+        asyncio.create_task(invalidation_listener(redis_cli=redis), name="invalidation_listener"),
+        asyncio.create_task(outbox_relay_worker(redis_cli=redis, session_maker=primary_session_maker), name="outbox_relay"),
+        asyncio.create_task(registration_worker(redis_cli=redis, session_maker=primary_session_maker), name="registration_worker"),
+        asyncio.create_task(known_ids_worker(engine=engine), name="known_ids"),
+        asyncio.create_task(incremental_cache_refresh_worker(redis_cache=redis, session_maker=primary_session_maker), name="incremental_cache"),
+        asyncio.create_task(cache_notify_listener(redis_cache=redis, engine=engine, session_maker=primary_session_maker), name="cache_notify"),
+        asyncio.create_task(payment_partition_worker(engine=engine, retention_months=s.PAYMENT_RETENTION_MONTHS, archive_dir=s.PAYMENT_ARCHIVE_DIR), name="payment_partitions"),
     ]
+
+    # ✅ Лог медленных запросов - только если задан порог
+    if s.SLOW_QUERY_MS:
+        for db_engine in (engine, replica_engine):
+            if db_engine is None:
+                continue
+            slow_log = SlowQueryLog(
+                db_engine,
+                threshold_ms=s.SLOW_QUERY_MS,
+                explain_path=s.SLOW_QUERY_EXPLAIN_PATH
+            ).install()
+            worker_tasks.append(asyncio.create_task(slow_log.run(), name="slow_query_explain"))
+
     print(f"✅ Workers started: {len(worker_tasks)}")
     
     
@@ -112,7 +149,9 @@ async def lifespan(app: Litestar):
 
     
     # Закрываем сессию воркеров
-    await worker_session.close()
+    await db_session.close()
+    await trial_session.close()
+    await payment_session.close()
     # print("✅ Worker session closed")
     # try:
     #     async with engine.begin() as conn:
@@ -182,6 +221,12 @@ async def root() -> dict:
     return {"status": "running"}
 
 
+@get("/metrics")
+async def metrics(redis_cli: Redis) -> dict:
+    """Счётчики воркеров и кешей (hit rate и т.п.)"""
+    return await get_metrics(redis_cli)
+
+
 # Route handler
 @get("/vpn-guide/{user_id:str}")
 async def vpn_guide(
@@ -342,12 +387,11 @@ async def yoo_webhook(
 
     status = event.split(".")[1]
 
-    from db.models import PaymentData
-    
-    repo = BaseRepository(session=session, model=PaymentData)
-    existing_payment = await repo.get_one(payment_id=order_id)
-    
-    if existing_payment:
+    # payment_wrk мог только что записать этот платёж - реплика его ещё не видит
+    with use_primary():
+        duplicate = await payment_exists(session, payment_id=order_id)
+
+    if duplicate:
         logger.warning(f"⏭️  Duplicate webhook (payment exists in DB): order={order_id}")
         return Response(
             content=json.dumps({"status": "duplicate"}),
@@ -389,10 +433,10 @@ async def yoo_webhook(
 
 # Subscription redirect
 @get("/sub/{uuid:str}")
-async def process_sub(uuid: str) -> Redirect:
+async def process_sub(uuid: str, redis_cli: Redis) -> Redirect:
     """Проверяем все панели параллельно"""
     
-    links = await get_links_of_panels(uuid=uuid)
+    links = await get_links_of_panels(uuid=uuid, redis_cli=redis_cli)
     logger.debug(f'Ссылки {links}')
     
     if not links:
@@ -464,6 +508,7 @@ app = Litestar(
         webhook_marz,
         bot_webhook,
         root,
+        metrics,
         yoo_webhook,
         vpn_guide,
         process_sub
@@ -0,0 +1,80 @@
+"""
+Кеш первого уровня (в памяти процесса) поверх Redis
+и схлопывание одновременных промахов (singleflight,
+аренды на заполнение через Lua), отрицательный кеш, Bloom-фильтр
+известных user/uuid, компактный снимок пользователя
+stale-while-revalidate и последняя активность пользователей
+"""
+from cache.activity import LAST_SEEN_KEY, active_user_ids, touch_user
+from cache.bloom import BloomFilter, known, user_member, uuid_member
+from cache.invalidation import (
+    INVALIDATION_CHANNEL,
+    filled_message,
+    invalidation_listener,
+    invalidation_message,
+    known_message,
+    publish_filled,
+    publish_invalidation,
+    publish_known,
+)
+from cache.leases import (
+    get_or_lease,
+    lease_key,
+    lease_many,
+    release_lease,
+    release_many,
+    store_and_release,
+    store_many_if_leased,
+    store_tombstone,
+)
+from cache.memory import MISSING, L1Cache, l1
+from cache.negative import NEGATIVE_TTL, TOMBSTONE, clear_tombstones, negative_key
+from cache.stale import STALE_GRACE, dumps_with_soft_ttl, hard_ttl, is_stale, revalidate, with_soft_ttl
+from cache.snapshot import USER_SNAPSHOT_FIELDS, decode_user, encode_user
+from cache.singleflight import SingleFlight, fill_waiters, flights, wait_for_key
+
+__all__ = [
+    "INVALIDATION_CHANNEL",
+    "LAST_SEEN_KEY",
+    "MISSING",
+    "NEGATIVE_TTL",
+    "STALE_GRACE",
+    "TOMBSTONE",
+    "USER_SNAPSHOT_FIELDS",
+    "BloomFilter",
+    "active_user_ids",
+    "L1Cache",
+    "SingleFlight",
+    "clear_tombstones",
+    "decode_user",
+    "dumps_with_soft_ttl",
+    "encode_user",
+    "fill_waiters",
+    "filled_message",
+    "flights",
+    "get_or_lease",
+    "hard_ttl",
+    "invalidation_listener",
+    "invalidation_message",
+    "is_stale",
+    "known",
+    "known_message",
+    "l1",
+    "lease_key",
+    "lease_many",
+    "negative_key",
+    "publish_filled",
+    "publish_invalidation",
+    "publish_known",
+    "release_lease",
+    "release_many",
+    "revalidate",
+    "store_and_release",
+    "store_many_if_leased",
+    "store_tombstone",
+    "touch_user",
+    "user_member",
+    "uuid_member",
+    "wait_for_key",
+    "with_soft_ttl",
+]
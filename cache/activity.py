@@ -0,0 +1,43 @@
+"""
+Последняя активность пользователей: ZSET USER_LAST_SEEN (user_id -> unix-время)
+
+Пишет DatabaseMiddleware (не чаще раза в LAST_SEEN_THROTTLE секунд
+на пользователя в процессе), читает скользящий обновлятель кеша:
+свежие - первыми, не заходившие дольше срока - пропускаются и
+вычищаются из множества.
+"""
+import time
+
+from redis.asyncio import Redis
+
+from cache.memory import MISSING, L1Cache
+from logger_setup import logger
+
+LAST_SEEN_KEY: str = "USER_LAST_SEEN"
+LAST_SEEN_THROTTLE: float = 60.0
+
+_recently_seen = L1Cache(maxsize=100_000, ttl=LAST_SEEN_THROTTLE)
+
+
+async def touch_user(redis_cli: Redis, user_id: int) -> None:
+    """Отметка активности; повторные апдейты в течение минуты - без Redis"""
+    if _recently_seen.get(str(user_id)) is not MISSING:
+        return
+    _recently_seen.set(str(user_id), True)
+
+    try:
+        await redis_cli.zadd(LAST_SEEN_KEY, {str(user_id): int(time.time())})
+    except Exception as e:
+        logger.debug(f"⚠️  Last seen not written: user_id={user_id}, error={e}")
+
+
+async def active_user_ids(redis_cli: Redis, active_seconds: int) -> list[int]:
+    """
+    Пользователи, заходившие за active_seconds, от самых свежих
+
+    Спящие (старше срока) заодно удаляются из множества.
+    """
+    since = int(time.time()) - active_seconds
+    await redis_cli.zremrangebyscore(LAST_SEEN_KEY, "-inf", f"({since}")
+    members = await redis_cli.zrevrangebyscore(LAST_SEEN_KEY, "+inf", since)
+    return [int(member) for member in members]
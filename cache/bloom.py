@@ -0,0 +1,59 @@
+"""
+Bloom-фильтр известных user_id и uuid
+
+Отсекает заведомые промахи (сканеры /sub/<random>, чужие user_id)
+до любого обращения к Redis и БД. Ложноположительный ответ означает
+лишь обычный путь через кеш; ложноотрицательных быть не должно,
+поэтому пока фильтр не прогрет (или подписка на канал рвалась) -
+он отвечает «может быть» на всё.
+"""
+import hashlib
+import math
+
+KNOWN_CAPACITY: int = 2_000_000
+KNOWN_ERROR_RATE: float = 0.01
+
+
+class BloomFilter:
+    def __init__(self, capacity: int = KNOWN_CAPACITY, error_rate: float = KNOWN_ERROR_RATE):
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+        # False - ещё не прогрет: might_contain() отвечает True
+        self.ready = False
+
+    def _positions(self, item: str):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.hashes):
+            yield (h1 + i * h2) % self.size
+
+    def add(self, *items: str) -> None:
+        for item in items:
+            for pos in self._positions(item):
+                self._bits[pos >> 3] |= 1 << (pos & 7)
+            self.count += 1
+
+    def __contains__(self, item: str) -> bool:
+        return all(self._bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+    def might_contain(self, item: str) -> bool:
+        return not self.ready or item in self
+
+    def invalidate(self) -> None:
+        """Могли пропустить добавления - не отсекаем, пока не прогреют заново"""
+        self.ready = False
+
+
+def user_member(user_id) -> str:
+    return f"user:{user_id}"
+
+
+def uuid_member(uuid: str) -> str:
+    return f"uuid:{uuid}"
+
+
+# Один фильтр на процесс
+known = BloomFilter()
@@ -0,0 +1,117 @@
+import asyncio
+import json
+
+from redis.asyncio import Redis
+
+from cache.bloom import known
+from cache.memory import l1
+from cache.singleflight import fill_waiters
+from logger_setup import logger
+
+INVALIDATION_CHANNEL: str = "CACHE_INVALIDATE"
+
+
+def invalidation_message(*keys: str) -> str:
+    """Сообщение канала: {"op": "del", "keys": [...]}"""
+    return json.dumps({"op": "del", "keys": list(keys)})
+
+
+def filled_message(*keys: str) -> str:
+    """Сообщение канала: {"op": "filled", "keys": [...]} - ключи заполнены"""
+    return json.dumps({"op": "filled", "keys": list(keys)})
+
+
+def known_message(*members: str) -> str:
+    """Сообщение канала: {"op": "known", "keys": [...]} - новые user/uuid для Bloom-фильтра"""
+    return json.dumps({"op": "known", "keys": list(members)})
+
+
+async def publish_invalidation(redis_cli: Redis, *keys: str) -> None:
+    """
+    Сбрасывает ключи в L1 всех процессов
+
+    Вызывать после того, как новое значение уже записано в Redis,
+    иначе другой процесс успеет перечитать старое.
+    """
+    if not keys:
+        return
+    l1.delete(*keys)
+    try:
+        await redis_cli.publish(INVALIDATION_CHANNEL, invalidation_message(*keys))
+    except Exception as e:
+        logger.error(f"❌ Invalidation not published: keys={keys}, error={e}")
+
+
+async def publish_filled(redis_cli: Redis, *keys: str) -> None:
+    """Будит ожидающих этих ключей во всех процессах"""
+    if not keys:
+        return
+    fill_waiters.notify(*keys)
+    try:
+        await redis_cli.publish(INVALIDATION_CHANNEL, filled_message(*keys))
+    except Exception as e:
+        logger.error(f"❌ Filled not published: keys={keys}, error={e}")
+
+
+async def publish_known(redis_cli: Redis, *members: str) -> None:
+    """Добавляет user/uuid в Bloom-фильтр всех процессов"""
+    if not members:
+        return
+    known.add(*members)
+    try:
+        await redis_cli.publish(INVALIDATION_CHANNEL, known_message(*members))
+    except Exception as e:
+        logger.error(f"❌ Known not published: keys={members}, error={e}")
+        # Другие процессы могли не узнать - пусть не отсекают, пока не прогреют заново
+        known.invalidate()
+
+
+def apply_invalidation(raw: str) -> None:
+    try:
+        message = json.loads(raw)
+    except ValueError:
+        logger.error(f"❌ Bad invalidation message: {raw!r}")
+        return
+
+    op = message.get("op")
+    if op == "del":
+        l1.delete(*message.get("keys", []))
+    elif op == "filled":
+        fill_waiters.notify(*message.get("keys", []))
+    elif op == "known":
+        known.add(*message.get("keys", []))
+    elif op == "flush":
+        l1.clear()
+    else:
+        logger.warning(f"⚠️  Unknown invalidation op: {op}")
+
+
+async def invalidation_listener(redis_cli: Redis):
+    """
+    Подписка на CACHE_INVALIDATE: сброс L1, побудка ожидающих "filled",
+    пополнение Bloom-фильтра известных user/uuid
+
+    После (пере)подключения L1 очищается целиком, а фильтр перестаёт
+    отсекать до следующего прогрева - сообщения, пришедшие пока
+    подписки не было, потеряны.
+    """
+    logger.info("🚀 invalidation_listener started")
+
+    while True:
+        pubsub = redis_cli.pubsub()
+        try:
+            await pubsub.subscribe(INVALIDATION_CHANNEL)
+            l1.clear()
+            known.invalidate()
+
+            async for message in pubsub.listen():
+                if message.get("type") == "message":
+                    apply_invalidation(message["data"])
+
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"❌ Invalidation listener error: {e}")
+            await asyncio.sleep(1)
+        finally:
+            await pubsub.aclose()
@@ -0,0 +1,266 @@
+"""
+Атомарные операции заполнения кеша на Lua
+
+get_or_lease      - значение, надгробие или аренда на заполнение одним вызовом
+store_and_release - запись значения + снятие аренды и надгробия + "filled"/"del" в канал
+store_tombstone   - «в БД нет» на NEGATIVE_TTL + снятие аренды + "filled"
+release_lease     - снять свою аренду (заполнить не получилось)
+
+Пакетные (фоновые обновления кеша, по pipeline на пачку):
+lease_many        - аренды на пачку ключей, занятые пропускаются
+store_many_if_leased - запись только тех ключей, чья аренда всё ещё наша
+release_many      - снять оставшиеся свои аренды
+
+Запись «владельца» значения (db_worker, outbox) идёт через
+store_and_release(token=None) и снимает любую аренду: обновление,
+прочитавшее БД до его коммита, свою запись уже не сделает.
+
+Скрипты регистрируются один раз на клиента и вызываются через EVALSHA
+(при NOSCRIPT redis-py сам догружает скрипт).
+"""
+import uuid
+from weakref import WeakKeyDictionary
+
+from redis.asyncio import Redis
+from redis.commands.core import AsyncScript
+
+from cache.invalidation import INVALIDATION_CHANNEL, filled_message, invalidation_message
+from cache.memory import l1
+from cache.negative import NEGATIVE_TTL, TOMBSTONE, negative_key
+from cache.singleflight import fill_waiters
+
+LEASE_TTL_MS: int = 5000
+
+GET_OR_LEASE_LUA = """
+-- KEYS[1] - значение, KEYS[2] - аренда, KEYS[3] - надгробие
+-- ARGV[1] - токен, ARGV[2] - TTL аренды (мс), ARGV[3] = '1' - не отдавать текущее значение
+if ARGV[3] ~= '1' then
+    local value = redis.call('GET', KEYS[1])
+    if value then
+        return {'hit', value}
+    end
+    if redis.call('EXISTS', KEYS[3]) == 1 then
+        return {'neg'}
+    end
+end
+if redis.call('SET', KEYS[2], ARGV[1], 'NX', 'PX', ARGV[2]) then
+    return {'lease'}
+end
+return {'wait'}
+"""
+
+STORE_AND_RELEASE_LUA = """
+-- KEYS[1] - значение, KEYS[2] - аренда, KEYS[3] - надгробие
+-- ARGV[1] - значение, ARGV[2] - TTL (с, 0 - без TTL), ARGV[3] - токен ('' - снять любую)
+-- ARGV[4] - канал, ARGV[5] - сообщение ('' - не публиковать)
+if tonumber(ARGV[2]) > 0 then
+    redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[2])
+else
+    redis.call('SET', KEYS[1], ARGV[1])
+end
+redis.call('DEL', KEYS[3])
+if ARGV[3] == '' or redis.call('GET', KEYS[2]) == ARGV[3] then
+    redis.call('DEL', KEYS[2])
+end
+if ARGV[5] ~= '' then
+    redis.call('PUBLISH', ARGV[4], ARGV[5])
+end
+return 1
+"""
+
+STORE_TOMBSTONE_LUA = """
+-- KEYS[1] - надгробие, KEYS[2] - аренда
+-- ARGV[1] - TTL надгробия (с), ARGV[2] - токен, ARGV[3] - канал, ARGV[4] - сообщение
+redis.call('SET', KEYS[1], '1', 'EX', ARGV[1])
+if redis.call('GET', KEYS[2]) == ARGV[2] then
+    redis.call('DEL', KEYS[2])
+end
+redis.call('PUBLISH', ARGV[3], ARGV[4])
+return 1
+"""
+
+STORE_IF_LEASED_LUA = """
+-- KEYS[1] - значение, KEYS[2] - аренда, KEYS[3] - надгробие
+-- ARGV[1] - значение, ARGV[2] - TTL (с), ARGV[3] - токен
+if redis.call('GET', KEYS[2]) ~= ARGV[3] then
+    return 0
+end
+redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[2])
+redis.call('DEL', KEYS[2], KEYS[3])
+return 1
+"""
+
+RELEASE_LUA = """
+-- KEYS[1] - аренда, ARGV[1] - токен
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+_SCRIPTS = {
+    "get_or_lease": GET_OR_LEASE_LUA,
+    "store_and_release": STORE_AND_RELEASE_LUA,
+    "store_tombstone": STORE_TOMBSTONE_LUA,
+    "store_if_leased": STORE_IF_LEASED_LUA,
+    "release": RELEASE_LUA,
+}
+_registered: WeakKeyDictionary[Redis, dict[str, AsyncScript]] = WeakKeyDictionary()
+
+
+def _script(redis_cli: Redis, name: str) -> AsyncScript:
+    scripts = _registered.get(redis_cli)
+    if scripts is None:
+        scripts = {key: redis_cli.register_script(lua) for key, lua in _SCRIPTS.items()}
+        _registered[redis_cli] = scripts
+    return scripts[name]
+
+
+def lease_key(key: str) -> str:
+    return f"LEASE:{key}"
+
+
+def _text(value) -> str:
+    return value.decode() if isinstance(value, bytes) else value
+
+
+async def get_or_lease(
+    redis_cli: Redis,
+    key: str,
+    lease_ttl_ms: int = LEASE_TTL_MS,
+    refresh: bool = False
+) -> tuple[str | None, str | None]:
+    """
+    Один вызов вместо GET + SET NX + повторного GET
+
+    Returns:
+        (значение, None) - попадание
+        (TOMBSTONE, None) - недавно искали, в БД нет
+        (None, токен)    - аренда наша, заполняем и зовём store_and_release
+        (None, None)     - заполняет другой, ждём wait_for_key
+    """
+    token = uuid.uuid4().hex
+    res = await _script(redis_cli, "get_or_lease")(
+        keys=[key, lease_key(key), negative_key(key)],
+        args=[token, lease_ttl_ms, "1" if refresh else "0"]
+    )
+    status = _text(res[0])
+
+    if status == "hit":
+        return _text(res[1]), None
+    if status == "neg":
+        return TOMBSTONE, None
+    if status == "lease":
+        return None, token
+    return None, None
+
+
+async def store_and_release(
+    redis_cli: Redis,
+    key: str,
+    value: str,
+    ttl: int | None,
+    token: str | None,
+    notify: str | None = "filled"
+) -> None:
+    """
+    Записывает значение и снимает аренду одним вызовом
+
+    token=None снимает аренду, чья бы она ни была (заполняет воркер,
+    который токена не знает). notify: "filled" - будит ожидающих,
+    "del" - значение поменялось, сбросить L1, None - молчим.
+    """
+    if notify == "filled":
+        message = filled_message(key)
+    elif notify == "del":
+        message = invalidation_message(key)
+    else:
+        message = ""
+
+    await _script(redis_cli, "store_and_release")(
+        keys=[key, lease_key(key), negative_key(key)],
+        args=[value, ttl or 0, token or "", INVALIDATION_CHANNEL, message]
+    )
+
+    # Свой процесс - не дожидаясь сообщения из канала
+    if notify == "filled":
+        fill_waiters.notify(key)
+    elif notify == "del":
+        l1.delete(key)
+
+
+async def store_tombstone(
+    redis_cli: Redis,
+    key: str,
+    token: str,
+    ttl: int = NEGATIVE_TTL
+) -> None:
+    """
+    Записывает «в БД нет» и снимает аренду
+
+    Ожидающие будятся "filled" и, увидев надгробие, сразу получают None.
+    """
+    await _script(redis_cli, "store_tombstone")(
+        keys=[negative_key(key), lease_key(key)],
+        args=[ttl, token, INVALIDATION_CHANNEL, filled_message(key)]
+    )
+    fill_waiters.notify(key)
+
+
+async def release_lease(redis_cli: Redis, key: str, token: str) -> None:
+    """Снимает аренду, если она всё ещё наша"""
+    await _script(redis_cli, "release")(keys=[lease_key(key)], args=[token])
+
+
+async def lease_many(
+    redis_cli: Redis,
+    keys: list[str],
+    lease_ttl_ms: int = LEASE_TTL_MS
+) -> tuple[str, list[str]]:
+    """
+    Аренды на пачку ключей одним pipeline (SET NX PX)
+
+    Returns:
+        (токен, ключи, чьи аренды взяли) - остальные сейчас заполняет кто-то другой
+    """
+    token = uuid.uuid4().hex
+    async with redis_cli.pipeline(transaction=False) as pipe:
+        for key in keys:
+            pipe.set(lease_key(key), token, nx=True, px=lease_ttl_ms)
+        res = await pipe.execute()
+    return token, [key for key, ok in zip(keys, res) if ok]
+
+
+async def store_many_if_leased(
+    redis_cli: Redis,
+    entries: list[tuple[str, str, int]],
+    token: str
+) -> list[str]:
+    """
+    Пишет (ключ, значение, TTL) одним pipeline, но только там, где аренда
+    всё ещё с нашим токеном; аренда и надгробие снимаются
+
+    Returns:
+        Записанные ключи
+    """
+    if not entries:
+        return []
+
+    script = _script(redis_cli, "store_if_leased")
+    async with redis_cli.pipeline(transaction=False) as pipe:
+        for key, value, ttl in entries:
+            await script(keys=[key, lease_key(key), negative_key(key)], args=[value, ttl, token], client=pipe)
+        res = await pipe.execute()
+    return [key for (key, _, _), ok in zip(entries, res) if ok]
+
+
+async def release_many(redis_cli: Redis, keys: list[str], token: str) -> None:
+    """Снимает свои аренды пачки (записанные уже сняты - no-op)"""
+    if not keys:
+        return
+
+    script = _script(redis_cli, "release")
+    async with redis_cli.pipeline(transaction=False) as pipe:
+        for key in keys:
+            await script(keys=[lease_key(key)], args=[token], client=pipe)
+        await pipe.execute()
@@ -0,0 +1,59 @@
+import time
+from collections import OrderedDict
+from typing import Any
+
+# Отличает «нет в кеше» от закешированного None
+MISSING: Any = object()
+
+L1_MAXSIZE: int = 10_000
+# Страховка на случай потерянного сообщения инвалидации
+L1_TTL: float = 30.0
+
+
+class L1Cache:
+    """
+    In-process кеш: TTL + LRU
+
+    Хранит уже распарсенные объекты (UserModel, uuid, UserLinksModel),
+    так что повторный клик не ходит в Redis и не парсит JSON.
+    Когерентность между процессами - через invalidation_listener.
+    """
+
+    def __init__(self, maxsize: int = L1_MAXSIZE, ttl: float = L1_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Any:
+        entry = self._data.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self._data[key]
+            self.misses += 1
+            return MISSING
+
+        self._data.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key: str, value: Any, ttl: float | None = None) -> None:
+        self._data[key] = (time.monotonic() + (ttl or self.ttl), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def delete(self, *keys: str) -> None:
+        for key in keys:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+# Один кеш на процесс
+l1 = L1Cache()
@@ -0,0 +1,24 @@
+"""
+Отрицательный кеш: «такого ключа в БД нет»
+
+Надгробие - отдельный ключ NEG:<ключ> с коротким TTL, само значение
+не трогаем (SET NX в register_user и запись db_worker работают как
+раньше). get_or_lease видит надгробие тем же Lua-вызовом, db_worker
+удаляет его при создании строки.
+"""
+from redis.asyncio import Redis
+
+NEGATIVE_TTL: int = 60
+
+# Что get_or_lease возвращает вместо значения, если стоит надгробие
+TOMBSTONE: str = "\x00tombstone"
+
+
+def negative_key(key: str) -> str:
+    return f"NEG:{key}"
+
+
+async def clear_tombstones(redis_cli: Redis, *keys: str) -> None:
+    """Снимает надгробия ключей (строка только что появилась в БД)"""
+    if keys:
+        await redis_cli.delete(*(negative_key(key) for key in keys))
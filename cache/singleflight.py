@@ -0,0 +1,104 @@
+import asyncio
+from collections import defaultdict
+from typing import Any, Awaitable, Callable
+
+from redis.asyncio import Redis
+
+from cache.negative import negative_key
+
+# Как часто ожидающий всё же перечитывает ключ сам (если "filled" потерялось)
+FILL_RECHECK: float = 1.0
+
+
+class SingleFlight:
+    """
+    Один загрузчик на ключ в процессе
+
+    Первый вызов do() запускает fn() задачей, остальные с тем же ключом
+    ждут ту же задачу. Отмена одного ожидающего не отменяет загрузку.
+    """
+
+    def __init__(self):
+        self._calls: dict[str, asyncio.Task] = {}
+
+    def _done(self, key: str, task: asyncio.Task) -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # Ошибку уже могли не забрать (все ожидающие отменены)
+        if not task.cancelled():
+            task.exception()
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda t: self._done(key, t))
+        return await asyncio.shield(task)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._calls
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+
+class FillWaiters:
+    """Future'ы, которые будит сообщение "filled" из канала кеша"""
+
+    def __init__(self):
+        self._waiters: dict[str, set[asyncio.Future]] = defaultdict(set)
+
+    def register(self, key: str) -> asyncio.Future:
+        fut = asyncio.get_running_loop().create_future()
+        self._waiters[key].add(fut)
+        return fut
+
+    def unregister(self, key: str, fut: asyncio.Future) -> None:
+        waiters = self._waiters.get(key)
+        if waiters is not None:
+            waiters.discard(fut)
+            if not waiters:
+                del self._waiters[key]
+
+    def notify(self, *keys: str) -> None:
+        for key in keys:
+            for fut in self._waiters.pop(key, ()):
+                if not fut.done():
+                    fut.set_result(None)
+
+
+flights = SingleFlight()
+fill_waiters = FillWaiters()
+
+
+async def wait_for_key(redis_cli: Redis, key: str, timeout: float) -> str | None:
+    """
+    Ждёт, пока другой процесс заполнит ключ
+
+    Вместо опроса каждые 100 мс - спим до сообщения "filled"
+    (invalidation_listener) и перечитываем ключ раз в FILL_RECHECK
+    на случай потерянного сообщения. Надгробие вместо значения -
+    сразу None: ждать нечего.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+
+    while True:
+        # Регистрируемся до GET - иначе "filled" между ними потеряется
+        fut = fill_waiters.register(key)
+        try:
+            value, tombstone = await redis_cli.mget(key, negative_key(key))
+            if value is not None or tombstone is not None:
+                return value
+
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return None
+
+            try:
+                await asyncio.wait_for(fut, min(remaining, FILL_RECHECK))
+            except asyncio.TimeoutError:
+                pass
+        finally:
+            fill_waiters.unregister(key, fut)
@@ -0,0 +1,46 @@
+"""
+Компактный снимок пользователя для USER_DATA
+
+Вместо {"user_id": ..., "username": ..., "trial_used": ..., "subscription_end": ...}
+пишем {"i": ..., "n": ..., "t": ..., "e": ...} без пробелов и без null-полей:
+короткие ключи - вторые имена (AliasChoices) полей UserModel.
+
+Разбор - UserModel.model_validate_json: JSON читается и проверяется
+за один проход в pydantic-core, без json.loads и промежуточного dict.
+Старые снимки с полными именами полей читаются тем же вызовом.
+Мягкий срок stale-while-revalidate ("s", cache/stale.py) идёт первым
+ключом и валидацией игнорируется.
+"""
+from datetime import datetime
+import json
+from typing import Any, Mapping
+
+from cache.stale import with_soft_ttl
+from schemas.schem import UserModel
+
+# Порядок - порядок колонок снимка; короткий ключ - последнее имя в AliasChoices
+USER_SNAPSHOT_FIELDS: tuple[str, ...] = tuple(UserModel.model_fields)
+_SHORT_KEYS: tuple[tuple[str, str], ...] = tuple(
+    (name, field.validation_alias.choices[-1]) # type: ignore
+    for name, field in UserModel.model_fields.items()
+)
+
+
+def encode_user(data: Mapping[str, Any], soft_ttl: int | None = None) -> str:
+    """Снимок из строки БД / as_dict() / model_dump() в компактный JSON"""
+    snapshot = {}
+    for name, short in _SHORT_KEYS:
+        value = data.get(name)
+        if value is None:
+            continue  # username/subscription_end по умолчанию None
+        if isinstance(value, datetime):
+            value = value.isoformat()
+        snapshot[short] = value
+
+    payload = json.dumps(snapshot, separators=(",", ":"), ensure_ascii=False)
+    return with_soft_ttl(payload, soft_ttl) if soft_ttl is not None else payload
+
+
+def decode_user(raw: str | bytes) -> UserModel:
+    """Снимок из Redis (компактный или старый) в UserModel"""
+    return UserModel.model_validate_json(raw)
@@ -0,0 +1,72 @@
+"""
+Stale-while-revalidate для USER_DATA и LINKS
+
+Два срока жизни:
+- мягкий - в самом значении, первым ключом: {"s": <unix-время>, ...};
+- жёсткий - TTL ключа в Redis, мягкий + STALE_GRACE.
+
+После мягкого срока значение ещё отдаётся сразу, а обновление уходит
+в фон (одно на ключ в процессе - через flights, одно на ключ во всех
+процессах - через аренду get_or_lease). Ждать БД/Marzban приходится
+только после жёсткого срока.
+"""
+import asyncio
+import json
+import time
+from typing import Any, Awaitable, Callable
+
+from cache.singleflight import flights
+from logger_setup import logger
+
+STALE_GRACE: int = 3 * 86400
+
+_PREFIX = '{"s":'
+_background: set[asyncio.Task] = set()
+
+
+def hard_ttl(soft_ttl: int) -> int:
+    """TTL ключа в Redis для значения с мягким сроком soft_ttl"""
+    return soft_ttl + STALE_GRACE
+
+
+def with_soft_ttl(payload: str, soft_ttl: int) -> str:
+    """Дописывает мягкий срок первым ключом JSON-объекта"""
+    deadline = int(time.time()) + soft_ttl
+    if payload == "{}":
+        return f'{_PREFIX}{deadline}}}'
+    return f'{_PREFIX}{deadline},{payload[1:]}'
+
+
+def is_stale(raw: str | None) -> bool:
+    """Прошёл ли мягкий срок (значения без срока - свежие до жёсткого TTL)"""
+    if not raw or not raw.startswith(_PREFIX):
+        return False
+    end = raw.find(",", len(_PREFIX))
+    try:
+        deadline = int(raw[len(_PREFIX):end if end != -1 else -1])
+    except ValueError:
+        return False
+    return deadline < time.time()
+
+
+def dumps_with_soft_ttl(data: Any, soft_ttl: int) -> str:
+    return with_soft_ttl(json.dumps(data, default=str), soft_ttl)
+
+
+def _finished(task: asyncio.Task) -> None:
+    _background.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error(f"❌ Background revalidate failed: {task.get_name()}, error={task.exception()}")
+
+
+def revalidate(key: str, fn: Callable[[], Awaitable[Any]]) -> None:
+    """Фоновое обновление ключа, если для него ещё не запущено"""
+    flight_key = f"{key}:revalidate"
+    if flight_key in flights:
+        return
+
+    task = asyncio.ensure_future(flights.do(flight_key, fn))
+    task.set_name(flight_key)
+    _background.add(task)
+    task.add_done_callback(_finished)
+    logger.debug(f"♻️  Stale, revalidating in background: {key}")
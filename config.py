@@ -38,6 +38,23 @@ class Settings(BaseSettings):
     DB_PASSWORD: str
     DB_NAME: str
 
+    # Read-реплика (опционально, без хоста все запросы идут в primary)
+    DB_REPLICA_HOST: str | None = None
+    DB_REPLICA_PORT: int | None = None
+
+    # Лог медленных запросов (опционально, без порога выключен)
+    SLOW_QUERY_MS: float | None = None
+    SLOW_QUERY_EXPLAIN_PATH: str = str(BASE_DIR / "logs" / "slow_query_plans.log")
+
+    # Архив секций payment_data: сколько месяцев держим в БД и куда выгружаем
+    PAYMENT_RETENTION_MONTHS: int = 24
+    PAYMENT_ARCHIVE_DIR: str = str(BASE_DIR / "archive" / "payment_data")
+
+    # Скользящее обновление USER_DATA: за какое окно обходим всех активных
+    # и сколько дней без захода пользователь считается спящим
+    CACHE_REFRESH_WINDOW: int = 86400
+    ACTIVE_USER_DAYS: int = 30
+
 
     REDIS_HOST: str
     REDIS_PORT: int
@@ -57,6 +74,16 @@ class Settings(BaseSettings):
             f"@{self.DB_HOST}:{self.DB_PORT}/{self.DB_NAME}"
         )
 
+    @property
+    def DATABASE_REPLICA_URL(self) -> str | None:
+        """Асинхронный URL read-реплики (те же креды, что у primary)"""
+        if not self.DB_REPLICA_HOST:
+            return None
+        return (
+            f"postgresql+asyncpg://{self.DB_USER}:{self.DB_PASSWORD}"
+            f"@{self.DB_REPLICA_HOST}:{self.DB_REPLICA_PORT or self.DB_PORT}/{self.DB_NAME}"
+        )
+
     @property
     def DATABASE_URL_aiosqlite(self):
         return f"sqlite+aiosqlite:///{self.DB_NAME}"
@@ -1,11 +1,83 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from sqlalchemy import Select, event
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.dml import UpdateBase
 from config import settings
 
 engine = create_async_engine(
     url=settings.DATABASE_URL
 )
 
+replica_engine = (
+    create_async_engine(url=settings.DATABASE_REPLICA_URL)
+    if settings.DATABASE_REPLICA_URL
+    else None
+)
+
+# Read-your-writes: внутри use_primary() все чтения идут в primary
+_force_primary: ContextVar[bool] = ContextVar("force_primary", default=False)
+
+
+@contextmanager
+def use_primary():
+    """
+    Escape hatch для кода, который только что записал/поставил в очередь
+    запись и должен сразу же её прочитать без лага реплики
+    """
+    token = _force_primary.set(True)
+    try:
+        yield
+    finally:
+        _force_primary.reset(token)
+
+
+def _is_write(clause) -> bool:
+    """INSERT/UPDATE/DELETE или SELECT ... FOR UPDATE"""
+    if isinstance(clause, UpdateBase):
+        return True
+    return isinstance(clause, Select) and clause._for_update_arg is not None
+
+
+class RoutingSession(Session):
+    """
+    Чистые SELECT'ы - в реплику, всё остальное - в primary
+
+    После записи (DML, FOR UPDATE, flush) сессия до конца транзакции
+    «прилипает» к primary, чтобы повторное чтение видело свои изменения.
+    text() и вызовы без выражения идут в primary, но не прилепляют сессию.
+    """
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        if replica_engine is None:
+            return engine.sync_engine
+
+        if self._flushing or _is_write(clause):
+            self.info["wrote"] = True
+            return engine.sync_engine
+
+        if isinstance(clause, Select) and not self.info.get("wrote") and not _force_primary.get():
+            return replica_engine.sync_engine
+
+        return engine.sync_engine
+
+
+@event.listens_for(RoutingSession, "after_commit")
+@event.listens_for(RoutingSession, "after_rollback")
+def _reset_wrote(session: Session) -> None:
+    # Транзакция закончилась - следующие чтения снова могут идти в реплику
+    session.info.pop("wrote", None)
+
+
 async_session_maker = async_sessionmaker(
+    sync_session_class=RoutingSession,
+    expire_on_commit=False
+)
+
+# Для долгоживущих пишущих воркеров (db_worker и т.п.) - всегда primary
+primary_session_maker = async_sessionmaker(
     bind=engine,
     expire_on_commit=False
-)
\ No newline at end of file
+)
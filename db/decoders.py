@@ -0,0 +1,50 @@
+from datetime import datetime
+
+from sqlalchemy import DateTime
+
+# Служебные поля задач очереди DB, не колонки модели
+SERVICE_FIELDS = frozenset({"model", "type", "filter"})
+
+
+class UnknownFieldsError(ValueError):
+    """В задаче есть поля, которых нет в модели"""
+    pass
+
+
+class TaskDecoder:
+    """
+    Декодер задач очереди DB для одной модели
+
+    Набор колонок и datetime-колонок берётся из таблицы один раз.
+    В datetime превращаются только поля, которые ими являются,
+    неизвестные поля отбрасывают задачу целиком до любой работы.
+    """
+
+    def __init__(self, model: type):
+        columns = model.__table__.columns # type: ignore
+        self.model_name = model.__name__
+        self.fields = frozenset(c.key for c in columns)
+        self.datetime_fields = frozenset(
+            c.key for c in columns if isinstance(c.type, DateTime)
+        )
+
+    def _decode_fields(self, data: dict, allowed: frozenset) -> dict:
+        unknown = data.keys() - allowed
+        if unknown:
+            raise UnknownFieldsError(f"{self.model_name}: unknown fields {sorted(unknown)}")
+
+        result = dict(data)
+        for key in self.datetime_fields & result.keys():
+            value = result[key]
+            if isinstance(value, str):
+                result[key] = datetime.fromisoformat(value)
+        return result
+
+    def __call__(self, data: dict) -> dict:
+        result = self._decode_fields(data, self.fields | SERVICE_FIELDS)
+
+        task_filter = result.get("filter")
+        if isinstance(task_filter, dict):
+            result["filter"] = self._decode_fields(task_filter, self.fields)
+
+        return result
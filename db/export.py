@@ -0,0 +1,162 @@
+"""
+Потоковая выгрузка таблиц для аналитики
+
+Строки идут через серверный курсор (stream + yield_per) пачками
+по chunk_rows, каждая пачка сразу пишется в файл - память не зависит
+от размера таблицы. Читаем из реплики, если она настроена.
+
+Запуск:
+    python -m db.export --tables users payment_data --out exports
+    python -m db.export --tables payment_data --since 2026-01-01T00:00:00 --format parquet
+
+--since работает для таблиц с колонкой-водяным знаком (WATERMARK_COLUMNS),
+новый водяной знак (максимум колонки в выгрузке) пишется в лог.
+"""
+import argparse
+import asyncio
+import csv
+from datetime import datetime
+from pathlib import Path
+
+from sqlalchemy import Table, select
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from db.models import PaymentData, User, UserLinks
+from logger_setup import logger
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # parquet - только если установлен pyarrow
+    pa = None
+    pq = None
+
+EXPORT_TABLES: dict[str, Table] = {
+    "users": User.__table__, # type: ignore
+    "links": UserLinks.__table__, # type: ignore
+    "payment_data": PaymentData.__table__, # type: ignore
+}
+
+# Колонка для инкрементальной выгрузки (--since)
+WATERMARK_COLUMNS: dict[str, str] = {
+    "users": "updated_at",
+    "links": "updated_at",
+    "payment_data": "created_at",
+}
+
+CHUNK_ROWS: int = 10_000
+
+
+class ExportError(ValueError):
+    """Неверные параметры выгрузки"""
+    pass
+
+
+def _arrow_schema(table: Table):
+    types = {int: pa.int64(), str: pa.string(), bool: pa.bool_(), datetime: pa.timestamp("us")} # type: ignore
+    return pa.schema([(c.name, types[c.type.python_type]) for c in table.columns]) # type: ignore
+
+
+async def export_table(
+    engine: AsyncEngine,
+    name: str,
+    out_dir: str,
+    since: datetime | None = None,
+    fmt: str = "csv",
+    chunk_rows: int = CHUNK_ROWS
+) -> tuple[Path, int, datetime | None]:
+    """
+    Выгружает одну таблицу, возвращает (файл, число строк, новый водяной знак)
+    """
+    table = EXPORT_TABLES[name]
+    watermark_col = WATERMARK_COLUMNS.get(name)
+
+    if fmt == "parquet" and pa is None:
+        raise ExportError("parquet export requires pyarrow")
+    if since is not None and watermark_col is None:
+        raise ExportError(f"{name}: no watermark column, --since is not supported")
+
+    stmt = select(table).order_by(table.c.id)
+    if since is not None:
+        stmt = stmt.where(table.c[watermark_col] > since)
+    stmt = stmt.execution_options(yield_per=chunk_rows)
+
+    Path(out_dir).mkdir(parents=True, exist_ok=True)
+    stamp = datetime.now().strftime("%Y%m%dT%H%M%S")
+    path = Path(out_dir) / f"{name}-{stamp}.{fmt}"
+    columns = [c.name for c in table.columns]
+
+    total = 0
+    watermark: datetime | None = None
+
+    async with engine.connect() as conn:
+        result = await conn.stream(stmt)
+
+        if fmt == "parquet":
+            schema = _arrow_schema(table)
+            writer = pq.ParquetWriter(path, schema) # type: ignore
+        else:
+            fh = open(path, "w", newline="", encoding="utf-8")
+            writer = csv.writer(fh)
+            writer.writerow(columns)
+
+        try:
+            async for rows in result.partitions():
+                if fmt == "parquet":
+                    writer.write_table(pa.Table.from_pylist([r._asdict() for r in rows], schema=schema)) # type: ignore
+                else:
+                    writer.writerows(rows)
+
+                total += len(rows)
+                if watermark_col is not None:
+                    chunk_max = max((getattr(r, watermark_col) for r in rows), default=None)
+                    if chunk_max is not None and (watermark is None or chunk_max > watermark):
+                        watermark = chunk_max
+
+                logger.debug(f"📤 Export {name}: {total} rows")
+        finally:
+            if fmt == "parquet":
+                writer.close() # type: ignore
+            else:
+                fh.close()
+
+    logger.info(f"✅ Exported {name}: {total} rows -> {path}, watermark={watermark}")
+    return path, total, watermark
+
+
+async def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(prog="python -m db.export", description="Streaming table export")
+    parser.add_argument("--tables", nargs="+", choices=sorted(EXPORT_TABLES), default=sorted(EXPORT_TABLES))
+    parser.add_argument("--out", default="exports")
+    parser.add_argument("--since", type=datetime.fromisoformat, default=None)
+    parser.add_argument("--format", choices=("csv", "parquet"), default="csv")
+    parser.add_argument("--chunk", type=int, default=CHUNK_ROWS)
+    args = parser.parse_args(argv)
+
+    if args.since is not None:
+        unsupported = [name for name in args.tables if name not in WATERMARK_COLUMNS]
+        if unsupported:
+            parser.error(f"--since is not supported for: {', '.join(unsupported)}")
+
+    from db.database import engine, replica_engine
+
+    source = replica_engine or engine
+    try:
+        for name in args.tables:
+            path, total, watermark = await export_table(
+                source,
+                name,
+                out_dir=args.out,
+                since=args.since,
+                fmt=args.format,
+                chunk_rows=args.chunk
+            )
+            print(f"✅ {name}: {total} rows -> {path} (next --since: {watermark.isoformat() if watermark else '-'})")
+    finally:
+        await engine.dispose()
+        if replica_engine is not None:
+            await replica_engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
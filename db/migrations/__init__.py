@@ -0,0 +1,80 @@
+"""
+Версионные миграции схемы (только PostgreSQL)
+
+Каждая миграция - модуль mNNNN_<name>.py c:
+    VERSION: int        - номер, применяются по возрастанию
+    DESCRIPTION: str    - что делает
+    UPGRADE: list[str]  - SQL по одному выражению на элемент
+
+Применённые версии лежат в таблице schema_version.
+Каждая миграция идёт в своей транзакции, параллельный запуск
+из нескольких процессов сериализуется advisory lock'ом.
+
+Запуск вручную: python -m db.migrations
+"""
+import importlib
+import pkgutil
+from types import ModuleType
+
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from logger_setup import logger
+
+MIGRATION_LOCK_ID: int = 742001
+
+
+def load_migrations() -> list[ModuleType]:
+    """Все модули mNNNN_* пакета, отсортированные по VERSION"""
+    modules = [
+        importlib.import_module(f"{__name__}.{info.name}")
+        for info in pkgutil.iter_modules(__path__)
+        if info.name.startswith("m") and info.name[1:5].isdigit()
+    ]
+    return sorted(modules, key=lambda m: m.VERSION)
+
+
+async def run_migrations(engine: AsyncEngine) -> list[int]:
+    """Применяет недостающие миграции, возвращает список применённых версий"""
+    if engine.dialect.name != "postgresql":
+        logger.info(f"⏭️  Migrations skipped: dialect={engine.dialect.name}")
+        return []
+
+    applied: list[int] = []
+
+    async with engine.connect() as conn:
+        await conn.exec_driver_sql(f"SELECT pg_advisory_lock({MIGRATION_LOCK_ID})")
+        try:
+            await conn.exec_driver_sql(
+                "CREATE TABLE IF NOT EXISTS schema_version ("
+                "version INTEGER PRIMARY KEY, "
+                "description TEXT, "
+                "applied_at TIMESTAMP NOT NULL DEFAULT now())"
+            )
+            res = await conn.exec_driver_sql("SELECT version FROM schema_version")
+            done = {row[0] for row in res}
+            await conn.commit()
+
+            for migration in load_migrations():
+                if migration.VERSION in done:
+                    continue
+
+                logger.info(f"🛠️  Applying migration {migration.VERSION}: {migration.DESCRIPTION}")
+                try:
+                    async with conn.begin():
+                        for stmt in migration.UPGRADE:
+                            logger.debug(f"  └─ {stmt[:120]}")
+                            await conn.exec_driver_sql(stmt)
+                        await conn.exec_driver_sql(
+                            "INSERT INTO schema_version (version, description) VALUES ($1, $2)",
+                            (migration.VERSION, migration.DESCRIPTION)
+                        )
+                except Exception as e:
+                    logger.error(f"❌ Migration {migration.VERSION} failed, rolled back: {e}")
+                    raise
+                applied.append(migration.VERSION)
+                logger.info(f"✅ Migration {migration.VERSION} applied")
+        finally:
+            await conn.exec_driver_sql(f"SELECT pg_advisory_unlock({MIGRATION_LOCK_ID})")
+            await conn.commit()
+
+    return applied
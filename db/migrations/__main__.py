@@ -0,0 +1,14 @@
+import asyncio
+
+from db.database import engine
+from db.migrations import run_migrations
+
+
+async def main():
+    applied = await run_migrations(engine)
+    print(f"✅ Applied migrations: {applied or 'none'}")
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
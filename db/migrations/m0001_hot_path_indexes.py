@@ -0,0 +1,46 @@
+"""
+Индексы горячих путей
+
+- links.uuid: /sub/{uuid} на каждый опрос клиента подписки
+- links.user_id: уникальный, одна запись ссылок на пользователя
+- payment_data.user_id: FK без индекса
+- users.subscription_end: частичный, для выборок по истечению
+
+У links до этой миграции уникальности не было: если дубли uuid/user_id
+уже есть, миграция падает с их списком до создания индексов - какую
+из строк оставить, решает человек, а не миграция.
+"""
+
+VERSION = 1
+DESCRIPTION = "hot path indexes for links, payment_data and subscription_end"
+
+UPGRADE = [
+    """
+    DO $$
+    DECLARE
+        dup_uuid text;
+        dup_user text;
+    BEGIN
+        SELECT string_agg(format('%s (x%s)', uuid, n), ', ') INTO dup_uuid
+        FROM (SELECT uuid, count(*) AS n FROM links GROUP BY uuid HAVING count(*) > 1 LIMIT 20) d;
+        SELECT string_agg(format('%s (x%s)', user_id, n), ', ') INTO dup_user
+        FROM (SELECT user_id, count(*) AS n FROM links GROUP BY user_id HAVING count(*) > 1 LIMIT 20) d;
+
+        IF dup_uuid IS NOT NULL OR dup_user IS NOT NULL THEN
+            RAISE EXCEPTION 'links has duplicate rows, remove them before unique indexes: uuid=[%], user_id=[%]',
+                COALESCE(dup_uuid, ''), COALESCE(dup_user, '');
+        END IF;
+    END $$
+    """,
+    "CREATE UNIQUE INDEX IF NOT EXISTS ix_links_uuid ON links (uuid)",
+    "CREATE UNIQUE INDEX IF NOT EXISTS ix_links_user_id ON links (user_id)",
+    "CREATE INDEX IF NOT EXISTS ix_payment_data_user_id ON payment_data (user_id)",
+    "CREATE INDEX IF NOT EXISTS ix_payment_data_payment_id ON payment_data (payment_id)",
+    (
+        "CREATE INDEX IF NOT EXISTS ix_users_subscription_end ON users (subscription_end) "
+        "WHERE subscription_end IS NOT NULL"
+    ),
+    "ANALYZE users",
+    "ANALYZE links",
+    "ANALYZE payment_data",
+]
@@ -0,0 +1,21 @@
+"""
+Таблица outbox для атомарной постановки задач в очереди Redis
+"""
+
+VERSION = 2
+DESCRIPTION = "outbox table"
+
+UPGRADE = [
+    (
+        "CREATE TABLE IF NOT EXISTS outbox ("
+        "id SERIAL PRIMARY KEY, "
+        "dedupe_key VARCHAR NOT NULL UNIQUE, "
+        "action VARCHAR NOT NULL, "
+        "target VARCHAR NOT NULL, "
+        "payload VARCHAR NOT NULL, "
+        "ttl INTEGER, "
+        "created_at TIMESTAMP NOT NULL DEFAULT now(), "
+        "sent_at TIMESTAMP)"
+    ),
+    "CREATE INDEX IF NOT EXISTS ix_outbox_pending ON outbox (id) WHERE sent_at IS NULL",
+]
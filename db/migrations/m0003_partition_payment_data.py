@@ -0,0 +1,74 @@
+"""
+Помесячное секционирование payment_data по created_at
+
+- старая таблица переименовывается в payment_data_legacy, её индексы
+  и PK удаляются/переименовываются, чтобы освободить имена
+- новая payment_data: PARTITION BY RANGE (created_at), PK (id, created_at),
+  id продолжает ту же последовательность
+- секции payment_data_YYYYMM от первого платежа до now() + 2 месяца,
+  payment_data_default ловит всё, что не попало в секции
+- payment_data_ensure_partition(date) создаёт секцию месяца (для воркера
+  обслуживания секций)
+"""
+
+VERSION = 3
+DESCRIPTION = "monthly range partitioning of payment_data"
+
+UPGRADE = [
+    "ALTER TABLE payment_data RENAME TO payment_data_legacy",
+    "DROP INDEX IF EXISTS ix_payment_data_payment_id",
+    "DROP INDEX IF EXISTS ix_payment_data_user_id",
+    "ALTER TABLE payment_data_legacy RENAME CONSTRAINT payment_data_pkey TO payment_data_legacy_pkey",
+    (
+        "CREATE TABLE payment_data ("
+        "id INTEGER NOT NULL, "
+        "payment_id VARCHAR NOT NULL, "
+        "user_id BIGINT NOT NULL REFERENCES users (user_id), "
+        "status VARCHAR NOT NULL DEFAULT 'succeeded', "
+        "amount INTEGER NOT NULL, "
+        "created_at TIMESTAMP NOT NULL DEFAULT now(), "
+        "PRIMARY KEY (id, created_at)"
+        ") PARTITION BY RANGE (created_at)"
+    ),
+    """
+    DO $$
+    DECLARE seq text := pg_get_serial_sequence('payment_data_legacy', 'id');
+    BEGIN
+        EXECUTE format('ALTER TABLE payment_data ALTER COLUMN id SET DEFAULT nextval(%L)', seq);
+        EXECUTE format('ALTER SEQUENCE %s OWNED BY payment_data.id', seq);
+    END $$
+    """,
+    "CREATE INDEX ix_payment_data_payment_id ON payment_data (payment_id)",
+    "CREATE INDEX ix_payment_data_user_id ON payment_data (user_id)",
+    """
+    CREATE OR REPLACE FUNCTION payment_data_ensure_partition(month_start date) RETURNS text AS $$
+    DECLARE
+        part text := 'payment_data_' || to_char(month_start, 'YYYYMM');
+    BEGIN
+        EXECUTE format(
+            'CREATE TABLE IF NOT EXISTS %I PARTITION OF payment_data FOR VALUES FROM (%L) TO (%L)',
+            part, month_start, (month_start + interval '1 month')::date
+        );
+        RETURN part;
+    END $$ LANGUAGE plpgsql
+    """,
+    """
+    DO $$
+    DECLARE m date := date_trunc(
+        'month', COALESCE((SELECT min(created_at) FROM payment_data_legacy), now())
+    )::date;
+    BEGIN
+        WHILE m <= date_trunc('month', now() + interval '2 month')::date LOOP
+            PERFORM payment_data_ensure_partition(m);
+            m := (m + interval '1 month')::date;
+        END LOOP;
+    END $$
+    """,
+    "CREATE TABLE payment_data_default PARTITION OF payment_data DEFAULT",
+    (
+        "INSERT INTO payment_data (id, payment_id, user_id, status, amount, created_at) "
+        "SELECT id, payment_id, user_id, status, amount, created_at FROM payment_data_legacy"
+    ),
+    "DROP TABLE payment_data_legacy",
+    "ANALYZE payment_data",
+]
@@ -0,0 +1,35 @@
+"""
+updated_at на users и links для инкрементального обновления кеша
+
+- колонка с DEFAULT now(); существующим строкам достаётся время миграции
+- BEFORE UPDATE триггер ставит clock_timestamp(): ловит и то, что идёт
+  мимо ORM onupdate (ON CONFLICT DO UPDATE, ручные UPDATE)
+- индекс (updated_at, id) под keyset-опрос «что поменялось после водяного знака»
+"""
+
+VERSION = 4
+DESCRIPTION = "updated_at columns and triggers on users and links"
+
+UPGRADE = [
+    "ALTER TABLE users ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP NOT NULL DEFAULT now()",
+    "ALTER TABLE links ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP NOT NULL DEFAULT now()",
+    """
+    CREATE OR REPLACE FUNCTION set_updated_at() RETURNS trigger AS $$
+    BEGIN
+        NEW.updated_at := clock_timestamp();
+        RETURN NEW;
+    END $$ LANGUAGE plpgsql
+    """,
+    "DROP TRIGGER IF EXISTS users_set_updated_at ON users",
+    (
+        "CREATE TRIGGER users_set_updated_at BEFORE UPDATE ON users "
+        "FOR EACH ROW WHEN (OLD IS DISTINCT FROM NEW) EXECUTE FUNCTION set_updated_at()"
+    ),
+    "DROP TRIGGER IF EXISTS links_set_updated_at ON links",
+    (
+        "CREATE TRIGGER links_set_updated_at BEFORE UPDATE ON links "
+        "FOR EACH ROW WHEN (OLD IS DISTINCT FROM NEW) EXECUTE FUNCTION set_updated_at()"
+    ),
+    "CREATE INDEX IF NOT EXISTS ix_users_updated_at ON users (updated_at, id)",
+    "CREATE INDEX IF NOT EXISTS ix_links_updated_at ON links (updated_at, id)",
+]
@@ -0,0 +1,42 @@
+"""
+NOTIFY cache_changes на изменения users и links
+
+- AFTER INSERT/UPDATE/DELETE триггер шлёт '<таблица>:<user_id>';
+  UPDATE без изменений не шлёт ничего
+- если UPDATE поменял user_id, уходят оба - старый и новый
+- одинаковые уведомления в одной транзакции Postgres схлопывает сам,
+  массовый UPDATE одного пользователя даёт одно сообщение
+- слушает misc.cache_notify.cache_notify_listener: ловит то, что идёт
+  мимо db_worker (ручной SQL, правки админов, repo.create в хендлерах)
+"""
+
+VERSION = 5
+DESCRIPTION = "NOTIFY cache_changes triggers on users and links"
+
+UPGRADE = [
+    """
+    CREATE OR REPLACE FUNCTION notify_cache_change() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'UPDATE' AND OLD IS NOT DISTINCT FROM NEW THEN
+            RETURN NULL;
+        END IF;
+        IF TG_OP <> 'INSERT' THEN
+            PERFORM pg_notify('cache_changes', TG_TABLE_NAME || ':' || OLD.user_id);
+        END IF;
+        IF TG_OP = 'INSERT' OR (TG_OP = 'UPDATE' AND NEW.user_id IS DISTINCT FROM OLD.user_id) THEN
+            PERFORM pg_notify('cache_changes', TG_TABLE_NAME || ':' || NEW.user_id);
+        END IF;
+        RETURN NULL;
+    END $$ LANGUAGE plpgsql
+    """,
+    "DROP TRIGGER IF EXISTS users_notify_cache ON users",
+    (
+        "CREATE TRIGGER users_notify_cache AFTER INSERT OR UPDATE OR DELETE ON users "
+        "FOR EACH ROW EXECUTE FUNCTION notify_cache_change()"
+    ),
+    "DROP TRIGGER IF EXISTS links_notify_cache ON links",
+    (
+        "CREATE TRIGGER links_notify_cache AFTER INSERT OR UPDATE OR DELETE ON links "
+        "FOR EACH ROW EXECUTE FUNCTION notify_cache_change()"
+    ),
+]
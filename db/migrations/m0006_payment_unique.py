@@ -0,0 +1,35 @@
+"""
+Уникальный платёж: (payment_id, created_at) в payment_data
+
+- outbox доставляет задачу PaymentData at-least-once, db_worker вставляет
+  её ON CONFLICT DO NOTHING по этому ключу
+- payment_data секционирована по created_at, уникальный индекс обязан
+  включать ключ секционирования; created_at проставляется в задаче,
+  поэтому у повторной доставки он тот же
+- если дубли уже есть, миграция падает с их списком до создания индекса
+"""
+
+VERSION = 6
+DESCRIPTION = "unique (payment_id, created_at) on payment_data"
+
+UPGRADE = [
+    """
+    DO $$
+    DECLARE dup text;
+    BEGIN
+        SELECT string_agg(format('%s @ %s (x%s)', payment_id, created_at, n), ', ') INTO dup
+        FROM (
+            SELECT payment_id, created_at, count(*) AS n FROM payment_data
+            GROUP BY payment_id, created_at HAVING count(*) > 1 LIMIT 20
+        ) d;
+
+        IF dup IS NOT NULL THEN
+            RAISE EXCEPTION 'payment_data has duplicate payments, remove them before unique index: [%]', dup;
+        END IF;
+    END $$
+    """,
+    (
+        "CREATE UNIQUE INDEX IF NOT EXISTS uq_payment_data_payment_id "
+        "ON payment_data (payment_id, created_at)"
+    ),
+]
@@ -1,28 +1,38 @@
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 from datetime import datetime
+import json
 from sqlalchemy import DateTime, BigInteger
-from sqlalchemy.inspection import inspect
-from sqlalchemy import ForeignKey, func
+from sqlalchemy import ForeignKey, func, Index, UniqueConstraint, text
 
 
 class Base(DeclarativeBase):
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
 
+    # (ключ атрибута, имя колонки) - считается один раз при создании класса
+    __serialize_columns__: tuple[tuple[str, str], ...] = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        table = getattr(cls, "__table__", None)
+        if table is not None:
+            cls.__serialize_columns__ = tuple((c.key, c.name) for c in table.columns)
+
     def as_dict(self):
         """
         Безопасное преобразование в dict - только загруженные атрибуты
+
+        Загруженные значения берутся прямо из __dict__ экземпляра
+        (это и есть state.dict), без inspect() на каждую колонку.
         """
-        # ✅ Используем inspect чтобы получить только загруженные атрибуты
-        result = {}
-        for c in self.__table__.columns:
-            # Проверяем что атрибут загружен (не вызовет lazy load)
-            state = inspect(self)
-            if c.key in state.dict:
-                result[c.name] = state.dict[c.key]
-            else:
-                # Если не загружен - используем прямой доступ (может быть None)
-                result[c.name] = getattr(self, c.key, None)
-        return result
+        loaded = self.__dict__
+        return {
+            name: loaded[key] if key in loaded else getattr(self, key, None)
+            for key, name in self.__serialize_columns__
+        }
+
+    def as_json(self) -> str:
+        """Payload для кеша Redis за один проход"""
+        return json.dumps(self.as_dict(), default=str)
 
 
 class User(Base):
@@ -32,31 +42,84 @@ class User(Base):
     username:         Mapped[str | None]
     trial_used:       Mapped[bool] = mapped_column(default=False)
     subscription_end: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+    # onupdate - для ORM/Core update, триггер (миграция 4) - для всего остального
+    updated_at:       Mapped[datetime] = mapped_column(server_default=func.now(), onupdate=func.now())
 
     payments: Mapped[list["PaymentData"]] = relationship(back_populates="user")
 
     links: Mapped['UserLinks'] = relationship(back_populates='user')
 
+    __table_args__ = (
+        # Только для запросов по истечению подписки, пустые не индексируем
+        Index(
+            "ix_users_subscription_end",
+            "subscription_end",
+            postgresql_where=text("subscription_end IS NOT NULL"),
+            sqlite_where=text("subscription_end IS NOT NULL"),
+        ),
+        # Инкрементальное обновление кеша: WHERE (updated_at, id) > водяной знак
+        Index("ix_users_updated_at", "updated_at", "id"),
+    )
+
 
 class UserLinks(Base):
     __tablename__ = "links"
 
-    user_id:  Mapped[int] = mapped_column(BigInteger, ForeignKey('users.user_id'))
-    uuid:     Mapped[str]
+    user_id:  Mapped[int] = mapped_column(BigInteger, ForeignKey('users.user_id'), unique=True, index=True)
+    uuid:     Mapped[str] = mapped_column(unique=True, index=True)
     panel1:   Mapped[str | None]
     panel2:   Mapped[str | None]
+    updated_at: Mapped[datetime] = mapped_column(server_default=func.now(), onupdate=func.now())
 
     user: Mapped['User'] = relationship(back_populates='links')
 
+    __table_args__ = (
+        Index("ix_links_updated_at", "updated_at", "id"),
+    )
+
 
 class PaymentData(Base):
+    # В PostgreSQL секционирована по месяцам created_at, PK там (id, created_at)
+    # (миграция 3); id по-прежнему уникален, для ORM ключом остаётся он
     __tablename__ = 'payment_data'
     
     payment_id: Mapped[str] = mapped_column(index=True)
-    user_id: Mapped[str] = mapped_column(BigInteger, ForeignKey('users.user_id'))
+    user_id: Mapped[str] = mapped_column(BigInteger, ForeignKey('users.user_id'), index=True)
     status: Mapped[str] = mapped_column(server_default='succeeded')
     amount: Mapped[int]
     created_at: Mapped[datetime] = mapped_column(server_default=func.now())
     
     # Опционально: relationship для удобства
-    user: Mapped["User"] = relationship(back_populates="payments")
\ No newline at end of file
+    user: Mapped["User"] = relationship(back_populates="payments")
+
+    __table_args__ = (
+        # Повторная доставка задачи из outbox не должна дать второй платёж:
+        # created_at проставляется в задаче, ключ секционирования входит в индекс (миграция 6)
+        UniqueConstraint("payment_id", "created_at", name="uq_payment_data_payment_id"),
+    )
+
+
+class Outbox(Base):
+    """
+    Transactional outbox: побочные эффекты в Redis (очереди, ключи кеша),
+    записанные в той же транзакции, что и изменения состояния.
+    Отправляет их outbox_relay_worker пачками.
+    """
+    __tablename__ = 'outbox'
+
+    dedupe_key: Mapped[str] = mapped_column(unique=True)
+    action:     Mapped[str]                     # lpush | set
+    target:     Mapped[str]                     # очередь или ключ
+    payload:    Mapped[str]
+    ttl:        Mapped[int | None]
+    created_at: Mapped[datetime] = mapped_column(server_default=func.now())
+    sent_at:    Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index(
+            "ix_outbox_pending",
+            "id",
+            postgresql_where=text("sent_at IS NULL"),
+            sqlite_where=text("sent_at IS NULL"),
+        ),
+    )
@@ -0,0 +1,168 @@
+import asyncio
+import logging
+import time
+from contextvars import ContextVar
+from logging.handlers import RotatingFileHandler
+from pathlib import Path
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from logger_setup import logger
+
+# Кто выполняет запрос: хендлер (ставит DatabaseMiddleware), иначе - имя asyncio task
+query_caller: ContextVar[str | None] = ContextVar("query_caller", default=None)
+
+EXPLAIN_PREFIX: dict[str, str] = {
+    "postgresql": "EXPLAIN ",
+    "sqlite": "EXPLAIN QUERY PLAN ",
+}
+EXPLAINABLE = ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH")
+EXPLAIN_QUEUE_MAX: int = 100
+EXPLAIN_IDLE_SLEEP: float = 1.0
+
+
+def _param_shape(parameters, executemany: bool) -> str:
+    """Форма параметров без значений: типы по позициям/ключам"""
+    if executemany:
+        rows = list(parameters or [])
+        first = _param_shape(rows[0], False) if rows else "()"
+        return f"{len(rows)}x{first}"
+    if isinstance(parameters, dict):
+        return "{" + ", ".join(f"{k}: {type(v).__name__}" for k, v in parameters.items()) + "}"
+    return "(" + ", ".join(type(v).__name__ for v in parameters or ()) + ")"
+
+
+def _current_caller() -> str:
+    caller = query_caller.get()
+    if caller:
+        return caller
+    try:
+        task = asyncio.current_task()
+    except RuntimeError:
+        task = None
+    return task.get_name() if task else "sync"
+
+
+class SlowQueryLog:
+    """
+    Опциональный лог медленных запросов движка
+
+    before/after_cursor_execute меряют каждый запрос. Дольше порога -
+    предупреждение в лог с формой параметров, вызывающим и временем.
+    Для каждого нового текста запроса EXPLAIN (без ANALYZE) снимается
+    один раз фоновой задачей run() на отдельном соединении - чтобы
+    не ломать транзакцию вызывающего - и пишется в ротируемый файл.
+    """
+
+    def __init__(
+        self,
+        engine: AsyncEngine,
+        threshold_ms: float,
+        explain_path: str,
+        max_bytes: int = 1_000_000,
+        backup_count: int = 3
+    ):
+        self.engine = engine
+        self.threshold_ms = threshold_ms
+        self._seen: set[str] = set()
+        self._pending: list[tuple[str, object, float, str]] = []
+
+        Path(explain_path).parent.mkdir(parents=True, exist_ok=True)
+        self.plan_logger = logging.getLogger(f"slow_query_plans.{explain_path}")
+        self.plan_logger.setLevel(logging.INFO)
+        self.plan_logger.propagate = False
+        if not self.plan_logger.handlers:
+            handler = RotatingFileHandler(explain_path, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8")
+            handler.setFormatter(logging.Formatter("[%(asctime)s] %(message)s"))
+            self.plan_logger.addHandler(handler)
+
+    def install(self) -> "SlowQueryLog":
+        sync_engine = self.engine.sync_engine
+        event.listen(sync_engine, "before_cursor_execute", self._before)
+        event.listen(sync_engine, "after_cursor_execute", self._after)
+        event.listen(sync_engine, "handle_error", self._error)
+        logger.info(f"🐢 Slow query log on: {sync_engine.url.host}, threshold={self.threshold_ms}ms")
+        return self
+
+    def uninstall(self) -> None:
+        sync_engine = self.engine.sync_engine
+        event.remove(sync_engine, "before_cursor_execute", self._before)
+        event.remove(sync_engine, "after_cursor_execute", self._after)
+        event.remove(sync_engine, "handle_error", self._error)
+
+    def _before(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    def _error(self, exception_context):
+        # Упавший запрос не доходит до after - снимаем его отметку
+        conn = exception_context.connection
+        if conn is not None and conn.info.get("query_start"):
+            conn.info["query_start"].pop()
+
+    def _after(self, conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get("query_start")
+        if not starts:
+            return
+        started = starts.pop()
+        if context is not None and context.execution_options.get("slow_query_skip"):
+            return
+
+        duration_ms = (time.perf_counter() - started) * 1000
+        if duration_ms < self.threshold_ms:
+            return
+
+        caller = _current_caller()
+        logger.warning(
+            f"🐢 Slow query {duration_ms:.1f}ms caller={caller} "
+            f"params={_param_shape(parameters, executemany)}: {' '.join(statement.split())[:300]}"
+        )
+
+        if (
+            statement not in self._seen
+            and not executemany
+            and statement.lstrip().upper().startswith(EXPLAINABLE)
+            and len(self._pending) < EXPLAIN_QUEUE_MAX
+        ):
+            self._seen.add(statement)
+            self._pending.append((statement, parameters, duration_ms, caller))
+
+    async def explain_pending(self) -> int:
+        """Снимает EXPLAIN для накопленных запросов, пишет в файл"""
+        if not self._pending:
+            return 0
+
+        batch, self._pending = self._pending, []
+        prefix = EXPLAIN_PREFIX.get(self.engine.dialect.name)
+        if prefix is None:
+            return 0
+
+        async with self.engine.connect() as conn:
+            for statement, parameters, duration_ms, caller in batch:
+                try:
+                    res = await conn.exec_driver_sql(
+                        prefix + statement,
+                        parameters, # type: ignore
+                        execution_options={"slow_query_skip": True}
+                    )
+                    plan = "\n".join(" ".join(str(col) for col in row) for row in res.all())
+                except Exception as e:
+                    await conn.rollback()
+                    plan = f"EXPLAIN failed: {e}"
+
+                self.plan_logger.info(
+                    f"{duration_ms:.1f}ms caller={caller}\n{statement}\n{plan}\n"
+                )
+
+        return len(batch)
+
+    async def run(self):
+        """Фоновая задача EXPLAIN"""
+        while True:
+            try:
+                await self.explain_pending()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Slow query EXPLAIN error: {e}")
+            await asyncio.sleep(EXPLAIN_IDLE_SLEEP)
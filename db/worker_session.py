@@ -0,0 +1,76 @@
+import time
+
+from redis.asyncio import Redis
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from logger_setup import logger
+from misc.metrics import incr_metric, set_metric
+
+# После стольких объектов в identity map сессия очищается (expunge_all)
+MAX_IDENTITY_MAP: int = 1000
+# Раз в столько секунд сессия пересоздаётся целиком (и отпускает соединение)
+MAX_SESSION_AGE: float = 3600
+
+
+class WorkerSession:
+    """
+    Долгоживущая сессия воркера с ограниченной памятью
+
+    Проксирует всё в текущую AsyncSession. С expire_on_commit=False
+    загруженные объекты остаются в identity map навсегда, поэтому между
+    задачами maintain() чистит карту по размеру и пересоздаёт сессию
+    по возрасту. Вызывать только между задачами - во время задачи
+    объекты ещё нужны обработчику.
+    """
+
+    def __init__(
+        self,
+        session_maker: async_sessionmaker,
+        name: str,
+        max_identity_map: int = MAX_IDENTITY_MAP,
+        max_age: float = MAX_SESSION_AGE
+    ):
+        self.session_maker = session_maker
+        self.name = name
+        self.max_identity_map = max_identity_map
+        self.max_age = max_age
+
+        self._session: AsyncSession = session_maker()
+        self._created_at = time.monotonic()
+
+    def __getattr__(self, item):
+        return getattr(self._session, item)
+
+    @property
+    def identity_map_size(self) -> int:
+        return len(self._session.identity_map)
+
+    async def rotate(self) -> None:
+        """Закрывает текущую сессию и открывает новую"""
+        old = self._session
+        self._session = self.session_maker()
+        self._created_at = time.monotonic()
+        await old.close()
+
+    async def maintain(self, redis_cli: Redis | None = None) -> None:
+        """Очистка/ротация по порогам + метрики"""
+        size = self.identity_map_size
+        event = None
+
+        if time.monotonic() - self._created_at > self.max_age:
+            await self.rotate()
+            event = "rotations"
+        elif size > self.max_identity_map:
+            self._session.expunge_all()
+            event = "expunges"
+
+        if event:
+            logger.info(f"🧹 {self.name} session {event[:-1]}: identity_map={size}")
+
+        if redis_cli is not None:
+            await set_metric(redis_cli, f"{self.name}_session_identity_map", size)
+            if event:
+                await incr_metric(redis_cli, f"{self.name}_session_{event}")
+
+    async def close(self) -> None:
+        await self._session.close()
@@ -1,33 +1,300 @@
+import asyncio
+import json
+
 from repositories.base import BaseRepository
 from db.models import UserLinks
-from db.database import async_session_maker
+from db.database import async_session_maker, use_primary
+from sqlalchemy.ext.asyncio import AsyncSession
 from redis.asyncio import Redis
+from core.marzban.Client import MarzbanClient
+from misc.utils import USER_UUID_TTL, is_cached, revalidate_user
+from cache import (
+    MISSING,
+    TOMBSTONE,
+    decode_user,
+    dumps_with_soft_ttl,
+    get_or_lease,
+    hard_ttl,
+    is_stale,
+    known,
+    l1,
+    negative_key,
+    publish_invalidation,
+    release_lease,
+    revalidate,
+    store_and_release,
+    store_tombstone,
+    user_member,
+    wait_for_key,
+)
+from schemas.schem import UserLinksModel, UserModel
 from logger_setup import logger
 
+# Мягкий срок LINKS: ссылки Marzban меняются редко
+LINKS_SOFT_TTL: int = 6 * 3600
 
-async def get_uuid_cache(
+
+def _decode_uuid(raw: str) -> str:
+    """USER_UUID хранит uuid как есть; кавычки - у старых записей db_worker (живут до USER_UUID_TTL)"""
+    return raw.replace('"', "")
+
+
+def _parse_links(user_json: str) -> UserLinksModel | None:
+    """
+    Парсит JSON строку в UserModel
+
+    Args:
+        user_json: JSON строка с данными пользователя
+
+    Returns:
+        UserLinksModel или None при ошибке парсинга
+    """
+    logger.debug(user_json)
+    try:
+        user_dict = json.loads(user_json)
+        logger.debug(f"Parsing user data: {user_dict}")
+        return UserLinksModel(**user_dict)
+    except Exception as e:
+        logger.error(f"JSON parse error: {e}")
+        return None
+
+
+async def _load_links(redis_cache: Redis, user_id) -> UserLinksModel | None:
+    """Ссылки из Marzban + запись в кеш LINKS"""
+    async with MarzbanClient() as client:
+        user = await client.get_user(username=str(user_id))
+
+        if not isinstance(user, dict):
+            logger.error(f"Ошибка Marzban {user}")
+            return None
+
+    marz_links: list = user.get('links', [])
+    links = _parse_links(json.dumps({
+        "user_id": user_id,
+        "links": marz_links
+    }))
+
+    if links is None:
+        return None
+
+    links_str = f"LINKS:{user_id}"
+    await redis_cache.set(
+        links_str,
+        dumps_with_soft_ttl(links.model_dump(), LINKS_SOFT_TTL),
+        ex=hard_ttl(LINKS_SOFT_TTL)
+    )
+    l1.set(links_str, links)
+    return links
+
+
+async def _revalidate_links(redis_cache: Redis, user_id) -> None:
+    """Фоновое обновление устаревших LINKS; аренда - чтобы Marzban спрашивал один процесс"""
+    links_str = f"LINKS:{user_id}"
+    _, token = await get_or_lease(redis_cache, links_str, lease_ttl_ms=30_000, refresh=True)
+    if token is None:
+        return
+
+    try:
+        if await _load_links(redis_cache=redis_cache, user_id=user_id) is not None:
+            await publish_invalidation(redis_cache, links_str)
+    finally:
+        await release_lease(redis_cache, links_str, token)
+
+
+def _revalidate_links_if_stale(redis_cache: Redis, user_id, raw: str | None) -> None:
+    if is_stale(raw):
+        revalidate(f"LINKS:{user_id}", lambda: _revalidate_links(redis_cache, user_id))
+
+
+async def get_links_cache(
     redis_cache: Redis,
     user_id
+) -> UserLinksModel | None:
+    links_str = f"LINKS:{user_id}"
+    local = l1.get(links_str)
+    if local is not MISSING:
+        return local
+
+    cache = await redis_cache.get(links_str)
+
+    if cache:
+        links = _parse_links(cache)
+        if links is not None:
+            l1.set(links_str, links)
+            _revalidate_links_if_stale(redis_cache, user_id, cache)
+        return links
+
+    return await _load_links(redis_cache=redis_cache, user_id=user_id)
+
+
+async def get_uuid_cache(
+    redis_cache: Redis,
+    user_id,
+    session: AsyncSession | None = None
 ):
     links_str_uuid = f"USER_UUID:{user_id}"
-    uuid_cache = await redis_cache.get(links_str_uuid)
-
-    if not uuid_cache:
-        async with async_session_maker() as session:
-            repo = BaseRepository(session=session, model=UserLinks)
-            uuid_data = await repo.get_one(user_id=int(user_id))
-            if uuid_data is None:
-                # await callback.answer()
-                return None
-
-            uuid = uuid_data.uuid
-        
-        await redis_cache.set(
-            links_str_uuid,
-            uuid
-        )
+    local = l1.get(links_str_uuid)
+    if local is not MISSING:
+        return local
+
+    if not known.might_contain(user_member(user_id)):
+        return None
+
+    uuid_cache, token = await get_or_lease(redis_cache, links_str_uuid)
+
+    if uuid_cache is TOMBSTONE:
+        return None
+
+    if uuid_cache is None and token is None:
+        # uuid из БД уже достаёт другой процесс
+        uuid_cache = await wait_for_key(redis_cache, links_str_uuid, timeout=5)
+        if uuid_cache is None:
+            return None
+
+    elif uuid_cache is None:
+        try:
+            # Промах ляжет надгробием - читаем primary, а не отстающую реплику
+            with use_primary():
+                if session is not None:
+                    repo = BaseRepository(session=session, model=UserLinks)
+                    uuid_data = await repo.fetch_one(("uuid",), user_id=int(user_id))
+                else:
+                    async with async_session_maker() as own_session:
+                        repo = BaseRepository(session=own_session, model=UserLinks)
+                        uuid_data = await repo.fetch_one(("uuid",), user_id=int(user_id))
+        except Exception:
+            await release_lease(redis_cache, links_str_uuid, token)
+            raise
+
+        if uuid_data is None:
+            # await callback.answer()
+            await store_tombstone(redis_cache, links_str_uuid, token)
+            return None
+
+        uuid = uuid_data.uuid
+
+        await store_and_release(redis_cache, links_str_uuid, uuid, ttl=USER_UUID_TTL, token=token)
         uuid_cache = uuid
-    
+
     logger.info(uuid_cache)
-    uuid_cache = uuid_cache.replace('"', "")
-    return uuid_cache
\ No newline at end of file
+    uuid_cache = _decode_uuid(uuid_cache)
+    l1.set(links_str_uuid, uuid_cache)
+    return uuid_cache
+
+
+class UserDataLoader:
+    """
+    Данные пользователя в рамках одного апдейта
+
+    Кладётся в data DatabaseMiddleware. Первое обращение смотрит в L1,
+    затем забирает USER_DATA, USER_UUID и LINKS одним MGET; промахи по USER_DATA/USER_UUID
+    добираются параллельно через is_cached и get_uuid_cache - под их
+    арендами, как и одиночные чтения. Результат запоминается до конца апдейта.
+    """
+
+    def __init__(
+        self,
+        redis_cache: Redis,
+        user_id: int,
+        session: AsyncSession | None = None
+    ):
+        self.redis_cache = redis_cache
+        self.user_id = user_id
+        self.session = session
+
+        self._pending: asyncio.Future | None = None
+        self._user: UserModel | None = None
+        self._uuid: str | None = None
+        self._links_raw: str | None = None
+        self._links: UserLinksModel | None = None
+        self._links_loaded = False
+        self._keys = (
+            f"USER_DATA:{user_id}",
+            f"USER_UUID:{user_id}",
+            f"LINKS:{user_id}",
+        )
+
+    async def _ensure_loaded(self) -> None:
+        # Параллельные вызовы внутри апдейта ждут одну и ту же загрузку
+        if self._pending is None:
+            self._pending = asyncio.ensure_future(self._load())
+        await self._pending
+
+    async def _load(self) -> None:
+        user_key, uuid_key, links_key = self._keys
+        local_user, local_uuid = l1.get(user_key), l1.get(uuid_key)
+
+        # Повторный клик: всё уже в памяти процесса, Redis не нужен
+        if local_user is not MISSING and local_uuid is not MISSING:
+            self._user, self._uuid = local_user, local_uuid
+            return
+
+        if not known.might_contain(user_member(self.user_id)):
+            logger.debug(f"🚫 Unknown user (bloom): user_id={self.user_id}")
+            return
+
+        user_raw, uuid_raw, links_raw, tombstone = await self.redis_cache.mget(
+            user_key, uuid_key, links_key, negative_key(user_key)
+        )
+        self._links_raw = links_raw
+
+        if user_raw is None and tombstone is not None:
+            logger.debug(f"🪦 Negative cache HIT: user_id={self.user_id}")
+            return
+
+        if user_raw is not None:
+            try:
+                self._user = decode_user(user_raw)
+            except Exception as e:
+                logger.error(f"❌ JSON parse error: user_id={self.user_id}, error={e}")
+            else:
+                l1.set(user_key, self._user)
+                if is_stale(user_raw):
+                    revalidate(user_key, lambda: revalidate_user(self.redis_cache, self.user_id))
+        if uuid_raw is not None:
+            self._uuid = _decode_uuid(uuid_raw)
+            l1.set(uuid_key, self._uuid)
+
+        # Промахи - теми же путями, что и одиночные чтения: под арендой,
+        # с надгробием на «нет в БД» и едиными TTL записи
+        misses = []
+        if user_raw is None:
+            misses.append(self._fill_user())
+        if uuid_raw is None:
+            misses.append(self._fill_uuid())
+        if misses:
+            logger.debug(f"📊 Loader cache miss: user_id={self.user_id}, keys={len(misses)}")
+            await asyncio.gather(*misses)
+
+    async def _fill_user(self) -> None:
+        self._user = await is_cached(redis_cache=self.redis_cache, user_id=self.user_id, session=self.session) # type: ignore
+
+    async def _fill_uuid(self) -> None:
+        self._uuid = await get_uuid_cache(redis_cache=self.redis_cache, user_id=self.user_id, session=self.session)
+
+    async def user(self) -> UserModel | None:
+        await self._ensure_loaded()
+        return self._user
+
+    async def uuid(self) -> str | None:
+        await self._ensure_loaded()
+        return self._uuid
+
+    async def links(self) -> UserLinksModel | None:
+        """LINKS из кеша, при промахе - из Marzban (один раз за апдейт)"""
+        await self._ensure_loaded()
+
+        if not self._links_loaded:
+            local = l1.get(self._keys[2])
+            if local is not MISSING:
+                self._links = local
+            elif self._links_raw:
+                self._links = _parse_links(self._links_raw)
+                if self._links is not None:
+                    l1.set(self._keys[2], self._links)
+                    _revalidate_links_if_stale(self.redis_cache, self.user_id, self._links_raw)
+            else:
+                self._links = await _load_links(redis_cache=self.redis_cache, user_id=self.user_id)
+            self._links_loaded = True
+
+        return self._links
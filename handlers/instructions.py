@@ -4,23 +4,26 @@ from redis.asyncio import Redis
 
 from keyboards.markup import Instruction
 from repositories.base import BaseRepository
-from misc.utils import is_cached
 
 from db.models import UserLinks
 from aiogram import F
 from bot_in import dp
 
-from handlers.deps import get_uuid_cache
+from handlers.deps import UserDataLoader
 
 
 @dp.callback_query(F.data == 'instruction')
-async def menu(callback: CallbackQuery, session: AsyncSession, redis_cache: Redis):
+async def menu(
+    callback: CallbackQuery,
+    session: AsyncSession,
+    redis_cache: Redis,
+    loader: UserDataLoader | None = None
+):
     user_id = callback.from_user.id
-    user = await is_cached(
-        redis_cache=redis_cache,
-        session=session,
-        user_id=user_id
-    )
+    if loader is None:
+        loader = UserDataLoader(redis_cache=redis_cache, user_id=user_id, session=session)
+
+    user = await loader.user()
 
     if user is None:
         await callback.message.edit_text( #type: ignore
@@ -34,10 +37,7 @@ async def menu(callback: CallbackQuery, session: AsyncSession, redis_cache: Redi
         )
         return
     
-    uuid = await get_uuid_cache(
-        redis_cache=redis_cache,
-        user_id=user_id
-    )
+    uuid = await loader.uuid()
 
     await callback.message.edit_text( #type: ignore 
         text="🪞 Нажмите на кнопку ниже для просмотра инструкции:",
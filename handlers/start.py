@@ -1,9 +1,7 @@
 from aiogram.types import Message, CallbackQuery
 from keyboards.markup import MainKeyboard
 from sqlalchemy.ext.asyncio import AsyncSession
-from repositories.base import BaseRepository
-from db.models import User
-from misc.utils import is_cached
+from misc.utils import UserLookupError, find_user, register_user
 from redis.asyncio import Redis
 from bot_in import dp
 from aiogram import F
@@ -25,13 +23,19 @@ ERROR_TEXT = "❌ Произошла ошибка. Попробуйте позж
 async def start_command(message: Message, session: AsyncSession, redis_cache: Redis):
     user_id = message.from_user.id #type: ignore
     username = message.from_user.username #type: ignore
-    user = await is_cached(redis_cache=redis_cache, user_id=user_id, session=session)
-
     logger.info(f"ID : {user_id} | Нажал старт меню")
 
+    try:
+        user = await find_user(redis_cache=redis_cache, user_id=user_id)
+    except UserLookupError as e:
+        # Не знаем, есть ли он в БД - не регистрируем, пусть нажмёт ещё раз
+        logger.error(f"ID : {user_id} | Старт не удался: {e}")
+        await message.answer(ERROR_TEXT)
+        return
+
     if user is None:
-        repo = BaseRepository(session=session, model=User)
-        user = await repo.create(
+        user = await register_user(
+            redis_cache=redis_cache,
             user_id=user_id,
             username=username
         )
@@ -55,13 +59,19 @@ async def start_command(message: Message, session: AsyncSession, redis_cache: Re
 async def start_callback(callback: CallbackQuery, session: AsyncSession, redis_cache: Redis):
     user_id = callback.from_user.id #type: ignore
     username = callback.from_user.username #type: ignore
-    user = await is_cached(redis_cache=redis_cache, user_id=user_id, session=session)
-
     logger.info(f"ID : {user_id} | Нажал старт меню")
 
+    try:
+        user = await find_user(redis_cache=redis_cache, user_id=user_id)
+    except UserLookupError as e:
+        # Не знаем, есть ли он в БД - не регистрируем, пусть нажмёт ещё раз
+        logger.error(f"ID : {user_id} | Старт не удался: {e}")
+        await callback.answer(ERROR_TEXT, show_alert=True)
+        return
+
     if user is None:
-        repo = BaseRepository(session=session, model=User)
-        user = await repo.create(
+        user = await register_user(
+            redis_cache=redis_cache,
             user_id=user_id,
             username=username
         )
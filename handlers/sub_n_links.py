@@ -15,7 +15,7 @@ from logger_setup import logger
 import json
 from core.marzban.Client import MarzbanClient
 from config import settings as s
-from handlers.deps import get_uuid_cache
+from handlers.deps import UserDataLoader, get_links_cache
 
 text_pattern = """
 🔐 **Ваши подписки IV VPN**
@@ -24,83 +24,20 @@ text_pattern = """
 (Нажмите для копирования)
 """
 
-def _parse_links(user_json: str) -> UserLinksModel | None:
-    """
-    Парсит JSON строку в UserModel
-    
-    Args:
-        user_json: JSON строка с данными пользователя
-    
-    Returns:
-        UserLinksModel или None при ошибке парсинга
-    """
-    logger.debug(user_json)
-    try:
-        user_dict = json.loads(user_json)
-        logger.debug(f"Parsing user data: {user_dict}")
-        return UserLinksModel(**user_dict)
-    except Exception as e:
-        logger.error(f"JSON parse error: {e}")
-        return None
-
-
-async def get_links_cache(
-    redis_cache: Redis,
-    user_id
-) -> UserLinksModel | None:
-    links_str = f"LINKS:{user_id}"
-    cache = await redis_cache.get(links_str)
-
-    if cache:
-        links = _parse_links(cache)
-
-        if links is None:
-            return None
-        
-    else:
-        async with MarzbanClient() as client:
-            user = await client.get_user(username=str(user_id))
-
-            if not isinstance(user, dict):
-                logger.error(f"Ошибка Marzban {user}")
-                return None
-            
-        marz_links: list = user.get('links', [])
-        links = _parse_links(json.dumps({
-            "user_id": user_id,
-            "links": marz_links
-        }))
-
-        if links is None:
-            return None
-        
-        await redis_cache.set(
-            links_str,
-            json.dumps(
-                links.model_dump(),
-                default=str
-            )
-        )
-    
-    return links
-
-
 @dp.callback_query(F.data == 'subs')
 async def sub_n_links(
     callback: CallbackQuery,
-    redis_cache: Redis
+    redis_cache: Redis,
+    session: AsyncSession | None = None,
+    loader: UserDataLoader | None = None
 ):
     user_id = callback.from_user.id
 
-    uuid_cache = await get_uuid_cache(
-        redis_cache=redis_cache,
-        user_id=user_id
-    )
+    if loader is None:
+        loader = UserDataLoader(redis_cache=redis_cache, user_id=user_id, session=session)
 
-    links = await get_links_cache(
-        redis_cache=redis_cache,
-        user_id=user_id
-    )
+    uuid_cache = await loader.uuid()
+    links = await loader.links()
 
     if links is None or uuid_cache is None:
         await callback.answer()
@@ -121,7 +58,9 @@ async def sub_n_links(
 @dp.callback_query(F.data.startswith("sub_"))
 async def links(
     callback: CallbackQuery,
-    redis_cache: Redis
+    redis_cache: Redis,
+    session: AsyncSession | None = None,
+    loader: UserDataLoader | None = None
 ):
     prev = await redis_cache.get("PREV")
 
@@ -133,15 +72,11 @@ async def links(
 
     user_id = callback.from_user.id
 
-    uuid_cache = await get_uuid_cache(
-        redis_cache=redis_cache,
-        user_id=user_id
-    )
-    
-    links = await get_links_cache(
-        redis_cache=redis_cache,
-        user_id=user_id
-    )
+    if loader is None:
+        loader = UserDataLoader(redis_cache=redis_cache, user_id=user_id, session=session)
+
+    uuid_cache = await loader.uuid()
+    links = await loader.links()
 
     if links is None or uuid_cache is None:
         await callback.answer()
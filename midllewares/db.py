@@ -1,6 +1,9 @@
 from sqlalchemy.ext.asyncio import async_sessionmaker
 from aiogram import BaseMiddleware
 import app.redis_client as redis_module 
+from handlers.deps import UserDataLoader
+from cache import touch_user
+from db.slow_queries import query_caller
 
 class DatabaseMiddleware(BaseMiddleware):
     def __init__(self, session_maker: async_sessionmaker):
@@ -15,9 +18,27 @@ class DatabaseMiddleware(BaseMiddleware):
 
             if redis_cli is None:
                 print("❌ ERROR: redis_client is None in middleware!")
+
+            # Данные пользователя на весь апдейт: один MGET / один JOIN
+            from_user = data.get("event_from_user")
+            if from_user is not None and redis_cli is not None:
+                data["loader"] = UserDataLoader(
+                    redis_cache=redis_cli,
+                    user_id=from_user.id,
+                    session=session
+                )
+                # Для скользящего обновления кеша: активные - первыми, спящих не трогаем
+                await touch_user(redis_cli, from_user.id)
                 
+            # Имя хендлера для лога медленных запросов
+            handler_obj = data.get("handler")
+            callback = getattr(handler_obj, "callback", None)
+            caller_token = query_caller.set(getattr(callback, "__name__", None))
+
             try:
                 return await handler(event, data)
             except Exception:
                 await session.rollback()
-                raise
\ No newline at end of file
+                raise
+            finally:
+                query_caller.reset(caller_token)
\ No newline at end of file
@@ -0,0 +1,235 @@
+"""
+Инвалидация кеша по LISTEN/NOTIFY
+
+Триггеры users/links (миграция m0005) шлют в канал cache_changes
+'<таблица>:<user_id>'. Слушатель держит своё asyncpg-соединение вне пула,
+копит уведомления пачкой (до NOTIFY_BATCH или NOTIFY_WINDOW секунд)
+и переписывает USER_DATA/USER_UUID из primary под арендами
+(refresh_users/refresh_uuids): один SELECT ... IN + один pipeline
+на таблицу. Удалённые строки - DEL ключей. L1 всех процессов
+сбрасывается через канал CACHE_INVALIDATE. Отпечатки DB_STATE этих
+пользователей удаляются: строка поменялась мимо db_worker, и его быстрый
+путь is_unchanged не должен пропустить задачу, возвращающую старые значения.
+
+Слушает один процесс - лидер CACHE_NOTIFY_LEADER. Соединение считается
+живым, пока asyncpg не сообщил о его закрытии и в простое отвечает на
+SELECT 1 (полуоткрытое TCP-соединение иначе молчало бы вечно).
+
+Пока соединения нет, уведомления теряются. Вставки и изменения догоняет
+incremental_cache_refresh_worker по водяному знаку updated_at; удаление
+updated_at не оставляет, поэтому при каждом (пере)подключении
+purge_deleted проходит все ключи USER_DATA/USER_UUID и удаляет те,
+чьих строк в БД больше нет.
+"""
+import asyncio
+from contextlib import suppress
+
+import asyncpg
+from redis.asyncio import Redis
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from cache import publish_invalidation
+from db.database import use_primary
+from db.models import User, UserLinks
+from logger_setup import logger
+from misc.leader import hold_leadership, resign_leadership
+from misc.metrics import incr_metric
+from misc.utils import LEADER_TTL_TICKS, forget_state, refresh_changed_users, refresh_uuids
+
+CACHE_NOTIFY_CHANNEL: str = "cache_changes"
+NOTIFY_BATCH: int = 500
+NOTIFY_WINDOW: float = 0.2
+# Как часто проверяем соединение (SELECT 1) и продлеваем лидерство, пока уведомлений нет
+NOTIFY_IDLE_CHECK: float = 5.0
+NOTIFY_PING_TIMEOUT: float = 5.0
+NOTIFY_RECONNECT_DELAY: float = 1.0
+CACHE_NOTIFY_LEADER: str = "cache_notify"
+
+# таблица -> (модель, обновление кеша по user_id, ключ кеша)
+_NOTIFY_TABLES = {
+    "users": (User, refresh_changed_users, "USER_DATA:{}"),
+    "links": (UserLinks, refresh_uuids, "USER_UUID:{}"),
+}
+
+# префикс ключа кеша -> колонка, по которой строка должна быть в БД
+_PURGE_KEYS = (
+    ("USER_DATA:", User.user_id),
+    ("USER_UUID:", UserLinks.user_id),
+)
+
+
+def parse_notifications(payloads: list[str]) -> dict[str, set[int]]:
+    """'<таблица>:<user_id>' -> {таблица: {user_id, ...}}, мусор пропускается"""
+    changed: dict[str, set[int]] = {name: set() for name in _NOTIFY_TABLES}
+    for payload in payloads:
+        table, _, user_id = payload.partition(":")
+        try:
+            changed[table].add(int(user_id))
+        except (KeyError, ValueError):
+            logger.warning(f"⚠️ Bad cache notification: {payload!r}")
+    return changed
+
+
+async def apply_cache_changes(redis_cache: Redis, session_maker, payloads: list[str]) -> int:
+    """
+    Переписывает кеш пользователей из пачки уведомлений
+
+    Читает primary (refresh_users/refresh_uuids сами включают use_primary):
+    с реплики можно записать в кеш ещё не доехавшие данные.
+    """
+    total = 0
+    for name, user_ids in parse_notifications(payloads).items():
+        if not user_ids:
+            continue
+
+        model, refresh, key_fmt = _NOTIFY_TABLES[name]
+        await forget_state(redis_cache, model, *user_ids)
+
+        stored, missing = await refresh(redis_cache, session_maker, sorted(user_ids))
+
+        gone = [key_fmt.format(user_id) for user_id in missing]
+        if gone:
+            await redis_cache.delete(*gone)
+            await publish_invalidation(redis_cache, *gone)
+
+        total += len(user_ids)
+        logger.debug(f"🔔 Cache notify: {name} refreshed={len(stored)} deleted={len(gone)}")
+
+    return total
+
+
+async def _purge_missing(redis_cache: Redis, session_maker, prefix: str, column, keys: list[str]) -> int:
+    """Удаляет из пачки ключей те, чьих строк нет в БД (один SELECT ... IN)"""
+    ids = {}
+    for key in keys:
+        with suppress(ValueError):
+            ids[int(key[len(prefix):])] = key
+    if not ids:
+        return 0
+
+    with use_primary():
+        async with session_maker() as session:
+            res = await session.execute(select(column).where(column.in_(list(ids))))
+            present = set(res.scalars())
+
+    gone = [key for user_id, key in ids.items() if user_id not in present]
+    if gone:
+        await redis_cache.delete(*gone)
+        await publish_invalidation(redis_cache, *gone)
+    return len(gone)
+
+
+async def purge_deleted(redis_cache: Redis, session_maker, batch: int = NOTIFY_BATCH) -> int:
+    """
+    Полный проход по USER_DATA/USER_UUID: удаляет ключи строк, которых нет в БД
+
+    Догоняет DELETE, чьи уведомления потерялись без соединения.
+    SCAN пачками по batch ключей, на пачку - один SELECT.
+    """
+    removed = 0
+    for prefix, column in _PURGE_KEYS:
+        keys: list[str] = []
+        async for key in redis_cache.scan_iter(match=f"{prefix}*", count=batch):
+            keys.append(key)
+            if len(keys) >= batch:
+                removed += await _purge_missing(redis_cache, session_maker, prefix, column, keys)
+                keys = []
+        if keys:
+            removed += await _purge_missing(redis_cache, session_maker, prefix, column, keys)
+
+    logger.info(f"🧹 Cache notify: purged {removed} keys of deleted rows")
+    return removed
+
+
+async def _next_batch(queue: asyncio.Queue, batch: int, window: float) -> list[str]:
+    """Первое уведомление ждём до NOTIFY_IDLE_CHECK, остальные - не дольше window"""
+    try:
+        payloads = [await asyncio.wait_for(queue.get(), timeout=NOTIFY_IDLE_CHECK)]
+    except asyncio.TimeoutError:
+        return []
+
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + window
+    while len(payloads) < batch:
+        try:
+            payloads.append(await asyncio.wait_for(queue.get(), timeout=max(0.0, deadline - loop.time())))
+        except asyncio.TimeoutError:
+            break
+    return payloads
+
+
+async def cache_notify_listener(
+    redis_cache: Redis,
+    engine: AsyncEngine,
+    session_maker,
+    batch: int = NOTIFY_BATCH,
+    window: float = NOTIFY_WINDOW
+):
+    """LISTEN cache_changes на отдельном соединении, с переподключением; только на лидере"""
+    if engine.dialect.name != "postgresql":
+        logger.info("⏭️ cache_notify_listener: not PostgreSQL, skipped")
+        return
+
+    dsn = engine.url.set(drivername="postgresql").render_as_string(hide_password=False)
+    queue: asyncio.Queue[str] = asyncio.Queue()
+    # Итерация в простое - ожидание уведомлений + SELECT 1
+    leader_ttl = int(LEADER_TTL_TICKS * (NOTIFY_IDLE_CHECK + NOTIFY_PING_TIMEOUT))
+    logger.info(f"🔔 cache_notify_listener started (batch={batch}, window={window}s)")
+
+    try:
+        while True:
+            if not await hold_leadership(redis_cache, CACHE_NOTIFY_LEADER, leader_ttl):
+                await asyncio.sleep(NOTIFY_IDLE_CHECK)
+                continue
+
+            conn = None
+            closed = asyncio.Event()
+            try:
+                conn = await asyncpg.connect(dsn)
+                conn.add_termination_listener(lambda _conn: closed.set())
+                await conn.add_listener(
+                    CACHE_NOTIFY_CHANNEL,
+                    lambda _conn, _pid, _channel, payload: queue.put_nowait(payload)
+                )
+                logger.info(f"👂 LISTEN {CACHE_NOTIFY_CHANNEL}")
+
+                # Уже слушаем - удаления, пропущенные без соединения, можно дочищать
+                await purge_deleted(redis_cache, session_maker, batch)
+
+                while not closed.is_set():
+                    if not await hold_leadership(redis_cache, CACHE_NOTIFY_LEADER, leader_ttl):
+                        logger.warning("⚠️ cache_notify_listener: leadership lost")
+                        break
+
+                    payloads = await _next_batch(queue, batch, window)
+                    if not payloads:
+                        # Тишина - проверяем, что соединение живо, а не полуоткрыто
+                        await asyncio.wait_for(conn.fetchval("SELECT 1"), timeout=NOTIFY_PING_TIMEOUT)
+                        continue
+                    try:
+                        changed = await apply_cache_changes(redis_cache, session_maker, payloads)
+                        await incr_metric(redis_cache, "cache_notify_users", changed)
+                    except asyncio.CancelledError:
+                        raise
+                    except Exception as e:
+                        # Пачка потеряна - её догонит incremental_cache_refresh_worker
+                        logger.error(f"❌ Cache notify batch failed: {len(payloads)} notifications, error={e}")
+
+                if closed.is_set():
+                    logger.warning("⚠️ cache_notify_listener: connection lost")
+
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ cache_notify_listener error: {type(e).__name__}: {e}")
+            finally:
+                if conn is not None and not conn.is_closed():
+                    with suppress(Exception):
+                        await asyncio.wait_for(conn.close(), timeout=NOTIFY_PING_TIMEOUT)
+                    if not conn.is_closed():
+                        conn.terminate()
+
+            await asyncio.sleep(NOTIFY_RECONNECT_DELAY)
+    finally:
+        await resign_leadership(redis_cache, CACHE_NOTIFY_LEADER)
@@ -6,6 +6,7 @@ import json
 from logger_setup import logger
 from config import settings as s
 from bot_in import bot
+from db.worker_session import WorkerSession
 
 
 class SkipTask(Exception):
@@ -119,6 +120,11 @@ def queue_worker(
                                 raise
                             
                             await asyncio.sleep(retry_delay)
-        
+
+                # Между задачами - чистим долгоживущие сессии воркера
+                for value in handler_kwargs.values():
+                    if isinstance(value, WorkerSession):
+                        await value.maintain(redis_cli)
+
         return wrapper
     return decorator
\ No newline at end of file
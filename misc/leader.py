@@ -0,0 +1,77 @@
+"""
+Одна копия фоновой задачи на все процессы
+
+Ключ LEADER:<имя> хранит токен процесса-лидера с TTL. Лидер продлевает
+его каждым вызовом hold_leadership (не реже, чем раз в ttl), остальные
+получают False и ждут. Упал лидер - ключ истекает, задачу подхватывает
+следующий процесс.
+"""
+import uuid
+from weakref import WeakKeyDictionary
+
+from redis.asyncio import Redis
+from redis.commands.core import AsyncScript
+
+from logger_setup import logger
+
+# Токен этого процесса - общий для всех его задач
+PROCESS_TOKEN: str = uuid.uuid4().hex
+
+HOLD_LEADERSHIP_LUA = """
+-- KEYS[1] - ключ лидера, ARGV[1] - токен, ARGV[2] - TTL (с)
+local current = redis.call('GET', KEYS[1])
+if current == ARGV[1] then
+    redis.call('EXPIRE', KEYS[1], ARGV[2])
+    return 1
+end
+if not current then
+    redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[2])
+    return 1
+end
+return 0
+"""
+
+RESIGN_LUA = """
+-- KEYS[1] - ключ лидера, ARGV[1] - токен
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+_registered: WeakKeyDictionary[Redis, tuple[AsyncScript, AsyncScript]] = WeakKeyDictionary()
+
+
+def _scripts(redis_cli: Redis) -> tuple[AsyncScript, AsyncScript]:
+    scripts = _registered.get(redis_cli)
+    if scripts is None:
+        scripts = (redis_cli.register_script(HOLD_LEADERSHIP_LUA), redis_cli.register_script(RESIGN_LUA))
+        _registered[redis_cli] = scripts
+    return scripts
+
+
+def leader_key(name: str) -> str:
+    return f"LEADER:{name}"
+
+
+async def hold_leadership(redis_cli: Redis, name: str, ttl: int, token: str = PROCESS_TOKEN) -> bool:
+    """
+    Стать лидером name или продлить своё лидерство на ttl секунд
+
+    Ошибка Redis - False: без подтверждения задачу не запускаем.
+    """
+    hold, _ = _scripts(redis_cli)
+    try:
+        return bool(await hold(keys=[leader_key(name)], args=[token, ttl]))
+    except Exception as e:
+        logger.error(f"❌ Leadership check failed: {name}, error={e}")
+        return False
+
+
+async def resign_leadership(redis_cli: Redis, name: str, token: str = PROCESS_TOKEN) -> None:
+    """Отдать лидерство (остановка процесса) - следующий не ждёт истечения TTL"""
+    _, resign = _scripts(redis_cli)
+    try:
+        await resign(keys=[leader_key(name)], args=[token])
+    except Exception as e:
+        logger.error(f"❌ Leadership not released: {name}, error={e}")
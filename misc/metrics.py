@@ -0,0 +1,41 @@
+from redis.asyncio import Redis
+
+from logger_setup import logger
+
+METRICS_KEY: str = "METRICS"
+
+
+async def incr_metric(redis_cli: Redis, name: str, amount: int = 1) -> None:
+    """Счётчик в общем хеше METRICS (виден всем процессам)"""
+    try:
+        await redis_cli.hincrby(METRICS_KEY, name, amount) # type: ignore
+    except Exception as e:
+        logger.debug(f"⚠️  Metric {name} not written: {e}")
+
+
+async def set_metric(redis_cli: Redis, name: str, value: int | float) -> None:
+    """Gauge - последнее значение"""
+    try:
+        await redis_cli.hset(METRICS_KEY, name, value) # type: ignore
+    except Exception as e:
+        logger.debug(f"⚠️  Metric {name} not written: {e}")
+
+
+def hit_rate(metrics: dict, prefix: str) -> float | None:
+    """Доля попаданий по парам счётчиков <prefix>_hit / <prefix>_miss"""
+    hits = int(metrics.get(f"{prefix}_hit", 0))
+    misses = int(metrics.get(f"{prefix}_miss", 0))
+    total = hits + misses
+    return round(hits / total, 4) if total else None
+
+
+async def get_metrics(redis_cli: Redis) -> dict:
+    """Все счётчики + посчитанные hit rate"""
+    raw: dict = await redis_cli.hgetall(METRICS_KEY) # type: ignore
+    metrics: dict = {k: float(v) if "." in v else int(v) for k, v in raw.items()}
+
+    prefixes = {k.rsplit("_", 1)[0] for k in metrics if k.endswith(("_hit", "_miss"))}
+    for prefix in prefixes:
+        metrics[f"{prefix}_hit_rate"] = hit_rate(metrics, prefix)
+
+    return metrics
@@ -0,0 +1,147 @@
+import asyncio
+import json
+from datetime import datetime, timedelta
+from typing import Any
+
+from redis.asyncio import Redis
+from sqlalchemy import delete, select, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from cache import INVALIDATION_CHANNEL, invalidation_message, l1, lease_key
+from db.models import Outbox
+from logger_setup import logger
+from repositories.base import BaseRepository
+
+RELAY_BATCH_SIZE: int = 100
+RELAY_IDLE_SLEEP: float = 0.5
+# Отправленные строки держим сутки - dedupe_key защищает от повторов цепочки
+SENT_RETENTION: timedelta = timedelta(days=1)
+
+
+def push_task(queue: str, data: dict, dedupe_key: str) -> dict[str, Any]:
+    """Сообщение outbox: LPUSH задачи в очередь"""
+    return {
+        "dedupe_key": dedupe_key,
+        "action": "lpush",
+        "target": queue,
+        "payload": json.dumps(data, sort_keys=True, default=str),
+        "ttl": None,
+    }
+
+
+def set_key(key: str, value: str, ttl: int | None, dedupe_key: str) -> dict[str, Any]:
+    """Сообщение outbox: SET ключа кеша"""
+    return {
+        "dedupe_key": dedupe_key,
+        "action": "set",
+        "target": key,
+        "payload": value,
+        "ttl": ttl,
+    }
+
+
+async def enqueue_outbox(session: AsyncSession, messages: list[dict[str, Any]]) -> int:
+    """
+    Пишет сообщения в outbox одной транзакцией
+
+    Всё, что сессия успела изменить до вызова, коммитится вместе с ними.
+    Повтор с теми же dedupe_key ничего не добавляет.
+    """
+    repo = BaseRepository(session=session, model=Outbox)
+    return await repo.bulk_upsert(messages, conflict_keys=["dedupe_key"], update_fields=[])
+
+
+async def relay_batch(redis_cli: Redis, session: AsyncSession, batch_size: int = RELAY_BATCH_SIZE) -> int:
+    """
+    Отправляет одну пачку outbox в Redis одним pipeline (MULTI/EXEC)
+
+    Строки блокируются FOR UPDATE SKIP LOCKED, так что несколько релеев
+    не отправят одно и то же. Доставка at-least-once: если коммит упадёт
+    после EXEC, пачка уйдёт ещё раз. Поэтому задачи из outbox пишутся
+    идемпотентными: Marzban и User получают абсолютный срок подписки,
+    а PaymentData вставляется ON CONFLICT DO NOTHING по
+    (payment_id, created_at) - created_at проставлен в самой задаче.
+    """
+    stmt = (
+        select(Outbox.id, Outbox.action, Outbox.target, Outbox.payload, Outbox.ttl)
+        .where(Outbox.sent_at.is_(None))
+        .order_by(Outbox.id)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    )
+    rows = (await session.execute(stmt)).all()
+
+    if not rows:
+        await session.commit()
+        return 0
+
+    rewritten: list[str] = []
+    try:
+        async with redis_cli.pipeline(transaction=True) as pipe:
+            for row in rows:
+                if row.action == "lpush":
+                    pipe.lpush(row.target, row.payload)
+                elif row.action == "set":
+                    pipe.set(row.target, row.payload, ex=row.ttl)
+                    # Как store_and_release(token=None): фоновое обновление,
+                    # прочитавшее БД раньше, не затрёт это значение
+                    pipe.delete(lease_key(row.target))
+                    rewritten.append(row.target)
+                else:
+                    logger.error(f"❌ Unknown outbox action: id={row.id}, action={row.action}")
+            if rewritten:
+                # Инвалидация L1 в той же транзакции, что и запись ключей
+                pipe.publish(INVALIDATION_CHANNEL, invalidation_message(*rewritten))
+            await pipe.execute()
+    except Exception:
+        await session.rollback()
+        raise
+
+    l1.delete(*rewritten)
+
+    await session.execute(
+        update(Outbox)
+        .where(Outbox.id.in_([row.id for row in rows]))
+        .values(sent_at=datetime.now())
+    )
+    await session.commit()
+
+    logger.debug(f"📤 Outbox relayed: {len(rows)} message(s)")
+    return len(rows)
+
+
+async def purge_sent(session: AsyncSession) -> int:
+    """Удаляет давно отправленные сообщения"""
+    res = await session.execute(
+        delete(Outbox).where(Outbox.sent_at < datetime.now() - SENT_RETENTION)
+    )
+    await session.commit()
+    return res.rowcount or 0 # type: ignore
+
+
+async def outbox_relay_worker(
+    redis_cli: Redis,
+    session_maker: async_sessionmaker
+):
+    """Воркер, переносящий outbox в очереди/ключи Redis"""
+    logger.info("🚀 outbox_relay_worker started")
+    last_purge = datetime.now()
+
+    while True:
+        try:
+            async with session_maker() as session:
+                sent = await relay_batch(redis_cli=redis_cli, session=session)
+
+                if datetime.now() - last_purge > timedelta(hours=1):
+                    purged = await purge_sent(session)
+                    last_purge = datetime.now()
+                    logger.info(f"🧹 Outbox purged: {purged} row(s)")
+
+            if sent < RELAY_BATCH_SIZE:
+                await asyncio.sleep(RELAY_IDLE_SLEEP)
+
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"❌ Outbox relay error: {e}")
+            await asyncio.sleep(1)
@@ -0,0 +1,179 @@
+import asyncio
+import gzip
+import os
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from sqlalchemy import bindparam, select
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+
+from db.models import PaymentData
+from logger_setup import logger
+
+# Повторные вебхуки приходят в пределах дней - двух месяцев хватает с запасом,
+# а планировщик оставляет от силы три секции payment_data
+PAYMENT_DEDUPE_WINDOW: timedelta = timedelta(days=62)
+PARTITIONS_AHEAD: int = 2
+
+_PAYMENT_EXISTS_STMT = (
+    select(PaymentData.id)
+    .where(
+        PaymentData.payment_id == bindparam("payment_id"),
+        PaymentData.created_at >= bindparam("since"),
+    )
+    .limit(1)
+)
+
+
+def payment_exists_stmt(payment_id: str, since: datetime):
+    """Запрос дедупликации платежа со значениями (payment_exists, EXPLAIN в тестах)"""
+    return _PAYMENT_EXISTS_STMT.params(payment_id=payment_id, since=since)
+
+
+async def payment_exists(session: AsyncSession, payment_id: str) -> bool:
+    """
+    Есть ли уже платёж (дедупликация вебхуков)
+
+    Условие по created_at отсекает все секции, кроме последних,
+    так что цена проверки не растёт вместе с историей.
+    """
+    res = await session.execute(
+        payment_exists_stmt(payment_id, since=datetime.now() - PAYMENT_DEDUPE_WINDOW)
+    )
+    return res.first() is not None
+
+
+def _month_start(dt: datetime, shift: int = 0) -> datetime:
+    month = dt.year * 12 + dt.month - 1 + shift
+    return datetime(month // 12, month % 12 + 1, 1)
+
+
+async def ensure_payment_partitions(engine: AsyncEngine, months_ahead: int = PARTITIONS_AHEAD) -> list[str]:
+    """Создаёт секции текущего и следующих месяцев, если их ещё нет"""
+    if engine.dialect.name != "postgresql":
+        return []
+
+    created = []
+    async with engine.begin() as conn:
+        for shift in range(months_ahead + 1):
+            month = _month_start(datetime.now(), shift).date()
+            res = await conn.exec_driver_sql("SELECT payment_data_ensure_partition($1)", (month,))
+            created.append(res.scalar_one())
+    return created
+
+
+def _fsync_dir(path: Path) -> None:
+    """fsync каталога: os.replace переживёт падение питания"""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+async def _export_partition(engine: AsyncEngine, name: str, tmp_path: Path) -> int:
+    """COPY секции (ещё присоединённой) в tmp_path, gzip + fsync; возвращает число строк"""
+    async with engine.connect() as conn:
+        raw = await conn.get_raw_connection()
+        with open(tmp_path, "wb") as raw_fh:
+            with gzip.GzipFile(fileobj=raw_fh, mode="wb") as fh:
+                async def _write(chunk: bytes):
+                    fh.write(chunk)
+
+                status = await raw.driver_connection.copy_from_table( # type: ignore
+                    name, output=_write, format="csv", header=True
+                )
+            raw_fh.flush()
+            os.fsync(raw_fh.fileno())
+    # asyncpg отдаёт статус команды: 'COPY <n>'
+    return int(status.rsplit(" ", 1)[1])
+
+
+async def archive_payment_partitions(
+    engine: AsyncEngine,
+    retention_months: int,
+    archive_dir: str
+) -> list[str]:
+    """
+    Выгружает секции старше retention_months в <archive_dir>/<секция>.csv.gz
+    и только потом удаляет их
+
+    1. COPY во временный файл, fsync, os.replace - архив на диске,
+       секция не тронута; при ошибке удаляется только tmp
+    2. отдельной транзакцией DETACH (блокирует секцию), сверка числа строк
+       с выгрузкой, DROP; расхождение - откат, секция остаётся на месте
+
+    Если шаг 2 упал, архив остаётся, а секция переархивируется
+    при следующем проходе.
+    """
+    if engine.dialect.name != "postgresql":
+        return []
+
+    cutoff = _month_start(datetime.now(), -retention_months).strftime("%Y%m")
+    Path(archive_dir).mkdir(parents=True, exist_ok=True)
+
+    async with engine.connect() as conn:
+        res = await conn.exec_driver_sql(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid "
+            "JOIN pg_class p ON p.oid = i.inhparent "
+            "WHERE p.relname = 'payment_data' AND c.relname ~ '^payment_data_[0-9]{6}$' "
+            "ORDER BY c.relname"
+        )
+        old = [name for (name,) in res if name.rsplit("_", 1)[1] < cutoff]
+
+    archived = []
+    for name in old:
+        path = Path(archive_dir) / f"{name}.csv.gz"
+        tmp_path = path.with_suffix(".gz.tmp")
+
+        try:
+            exported = await _export_partition(engine, name, tmp_path)
+            os.replace(tmp_path, path)
+            _fsync_dir(path.parent)
+        except Exception as e:
+            tmp_path.unlink(missing_ok=True)
+            logger.error(f"❌ Payment partition export failed: {name}, error={e}")
+            continue
+
+        try:
+            async with engine.begin() as conn:
+                await conn.exec_driver_sql(f'ALTER TABLE payment_data DETACH PARTITION "{name}"')
+                res = await conn.exec_driver_sql(f'SELECT count(*) FROM "{name}"')
+                rows = res.scalar_one()
+                if rows != exported:
+                    raise RuntimeError(f"{rows} rows in partition, {exported} in archive")
+                await conn.exec_driver_sql(f'DROP TABLE "{name}"')
+        except Exception as e:
+            # Архив на месте, секция тоже - следующий проход выгрузит её заново
+            logger.error(f"❌ Payment partition drop failed: {name}, archive kept at {path}, error={e}")
+            continue
+
+        archived.append(name)
+        logger.info(f"📦 Payment partition archived: {name} -> {path} ({exported} rows)")
+
+    return archived
+
+
+async def payment_partition_worker(
+    engine: AsyncEngine,
+    retention_months: int,
+    archive_dir: str
+):
+    """Раз в сутки: секции наперёд + архив старых"""
+    logger.info("🗂️  payment_partition_worker started")
+
+    while True:
+        try:
+            await ensure_payment_partitions(engine)
+            await archive_payment_partitions(
+                engine,
+                retention_months=retention_months,
+                archive_dir=archive_dir
+            )
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"❌ Payment partition maintenance error: {e}")
+
+        await asyncio.sleep(86400)
@@ -0,0 +1,36 @@
+"""
+Разовая пересборка USER_DATA всех пользователей
+
+    python -m misc.rebuild_cache [--chunk N]
+
+Например после FLUSHDB или смены формата снимка; регулярно кеш
+обновляет rolling_cache_refresh_worker. Запись идёт под арендами,
+так что запуск рядом с работающим ботом не затирает записи db_worker.
+"""
+import argparse
+import asyncio
+
+from misc.utils import REBUILD_CHUNK, rebuild_user_cache
+
+
+async def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(prog="python -m misc.rebuild_cache", description="Rebuild USER_DATA for all users")
+    parser.add_argument("--chunk", type=int, default=REBUILD_CHUNK)
+    args = parser.parse_args(argv)
+
+    from app.redis_client import close_redis, init_redis
+    from db.database import async_session_maker, engine, replica_engine
+
+    redis = await init_redis()
+    try:
+        total = await rebuild_user_cache(redis, async_session_maker, chunk_size=args.chunk)
+        print(f"✅ USER_DATA rebuilt: {total} users")
+    finally:
+        await close_redis()
+        await engine.dispose()
+        if replica_engine is not None:
+            await replica_engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -6,7 +6,10 @@
 import asyncio
 
 # Stdlib
+import hashlib
 import json
+import random
+import time
 import uuid
 from contextlib import suppress
 
@@ -14,14 +17,14 @@ from contextlib import suppress
 from datetime import datetime, timedelta
 
 # Typing
-from typing import Any, Dict, Type
+from typing import Any, Callable, Dict, Type
 
 import aiohttp
 
 # Redis
 from redis.asyncio import Redis
-from sqlalchemy import select, text
-from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import bindparam, func, select, text, tuple_
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
 
 # Bot
 from bot_in import bot
@@ -34,14 +37,49 @@ from core.marzban.Client import MarzbanClient
 
 # External services / clients
 from core.yoomoney.payment import YooPay
-from db.database import async_session_maker
+from db.database import async_session_maker, use_primary
+from db.decoders import TaskDecoder
 from db.models import PaymentData, User, UserLinks
 
 # Logging
 from logger_setup import logger
 
+# Cache
+from cache import (
+    MISSING,
+    NEGATIVE_TTL,
+    active_user_ids,
+    TOMBSTONE,
+    USER_SNAPSHOT_FIELDS,
+    clear_tombstones,
+    decode_user,
+    encode_user,
+    flights,
+    get_or_lease,
+    hard_ttl,
+    is_stale,
+    known,
+    l1,
+    lease_many,
+    negative_key,
+    publish_invalidation,
+    publish_known,
+    release_lease,
+    release_many,
+    revalidate,
+    store_and_release,
+    store_many_if_leased,
+    store_tombstone,
+    user_member,
+    uuid_member,
+    wait_for_key,
+)
+
 # Decorators
 from misc.decorators import SkipTask, queue_worker
+from misc.leader import hold_leadership, resign_leadership
+from misc.metrics import incr_metric, set_metric
+from misc.outbox import enqueue_outbox, push_task, set_key
 from repositories.base import BaseRepository
 
 # Schemas
@@ -63,8 +101,41 @@ MODEL_REGISTRY: Dict[str, Type] = {
     "PaymentData": PaymentData
 }
 
+# Декодеры задач очереди DB по типам колонок моделей
+MODEL_DECODERS: Dict[str, TaskDecoder] = {
+    name: TaskDecoder(model) for name, model in MODEL_REGISTRY.items()
+}
+
 UNIQUE_USER_ID_MODELS = {User, UserLinks}
 
+# CREATE этих моделей идёт через INSERT ... ON CONFLICT DO NOTHING по ключу:
+# outbox доставляет задачи at-least-once, повтор не должен дать вторую строку
+IDEMPOTENT_CREATE_KEYS: Dict[type, list[str]] = {
+    PaymentData: ["payment_id", "created_at"],
+}
+
+# Колонки users, которые попадают в кеш USER_DATA (ровно поля UserModel, в порядке снимка)
+USER_SNAPSHOT_COLUMNS: tuple[str, ...] = USER_SNAPSHOT_FIELDS
+
+# Сколько живут отпечатки последней записи db_worker
+DB_STATE_TTL: int = 3600
+
+# USER_UUID - uuid как есть (без JSON-кавычек) и этот TTL у всех, кто его пишет:
+# db_worker, промах get_uuid_cache, refresh_uuids
+USER_UUID_TTL: int = 3600
+
+# Что _fill_user_cache возвращает, когда БД подтвердила: пользователя нет
+USER_NOT_FOUND: Any = object()
+
+
+class UserLookupError(Exception):
+    """Не удалось узнать, есть ли пользователь: ошибка БД или не дождались чужой аренды"""
+
+
+# Очередь отложенной регистрации пользователей из /start
+REGISTER_QUEUE: str = "USER_REGISTER"
+REGISTER_BATCH_SIZE: int = 200
+
 
 # ============================================================================
 # UTILITY FUNCTIONS
@@ -76,27 +147,6 @@ async def notifyer_of_down_wrk(service: str):
     await bot.send_message(chat_id=s.ADMIN_ID, text=text)
 
 
-def deserialize_data(data: dict) -> dict:
-    """Конвертирует строковые datetime обратно в объекты datetime"""
-    result = {}
-    for key, value in data.items():
-        if key in ('model', 'type', 'filter'):
-            result[key] = value
-            continue
-        
-        if isinstance(value, str):
-            try:
-                result[key] = datetime.fromisoformat(value)
-            except (ValueError, AttributeError):
-                result[key] = value
-        elif isinstance(value, dict):
-            result[key] = deserialize_data(value)
-        else:
-            result[key] = value
-    
-    return result
-
-
 def normalize_for_comparison(data: dict) -> dict:
     """Нормализует данные для корректного сравнения"""
     normalized = {}
@@ -115,6 +165,54 @@ def normalize_for_comparison(data: dict) -> dict:
     return normalized
 
 
+def _fingerprint(value: Any) -> str:
+    """Короткий отпечаток нормализованного значения поля"""
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    elif isinstance(value, bool):
+        value = int(value)
+    return hashlib.blake2b(repr(value).encode(), digest_size=8).hexdigest()
+
+
+def _state_key(model: Type, user_id: int) -> str:
+    return f"DB_STATE:{model.__name__}:{user_id}"
+
+
+async def is_unchanged(redis_cli: Redis, model: Type, user_id: int, fields: dict) -> bool:
+    """
+    Совпадают ли поля задачи с последней записью db_worker
+
+    Отпечатки лежат в Redis-хеше DB_STATE:{model}:{user_id}.
+    Нет хеша или хоть одного поля - считаем, что изменения есть.
+    """
+    stored = await redis_cli.hmget(_state_key(model, user_id), list(fields)) # type: ignore
+    return all(
+        fp is not None and fp == _fingerprint(value)
+        for fp, value in zip(stored, fields.values())
+    )
+
+
+async def remember_state(redis_cli: Redis, model: Type, user_id: int, row: dict):
+    """Сохраняет отпечатки всех колонок строки после успешной записи"""
+    key = _state_key(model, user_id)
+    async with redis_cli.pipeline(transaction=True) as pipe:
+        pipe.delete(key)
+        pipe.hset(key, mapping={k: _fingerprint(v) for k, v in row.items()})
+        pipe.expire(key, DB_STATE_TTL)
+        await pipe.execute()
+
+
+async def forget_state(redis_cli: Redis, model: Type, *user_ids: int) -> None:
+    """
+    Сбрасывает отпечатки строк, записанных мимо db_worker
+
+    Иначе быстрый путь is_unchanged пропустит задачу, которая
+    возвращает строке значения из отпечатка.
+    """
+    if user_ids:
+        await redis_cli.delete(*(_state_key(model, int(user_id)) for user_id in user_ids))
+
+
 async def to_link(lst_data: dict):
     """Извлекает названия из ссылок"""
     from urllib.parse import unquote
@@ -136,15 +234,22 @@ async def to_link(lst_data: dict):
 
 
 def _parse_user(user_json: str) -> UserModel | None:
-    """Парсит JSON строку в UserModel"""
+    """Парсит снимок USER_DATA (компактный или старый JSON) в UserModel"""
     try:
-        user_dict = json.loads(user_json)
-        return UserModel(**user_dict)
+        return decode_user(user_json)
     except Exception as e:
         logger.error(f"❌ JSON parse error: {e}")
         return None
 
 
+def _remember_user(key: str, user_json: str) -> UserModel | None:
+    """Парсит снимок и кладёт его в L1"""
+    user = _parse_user(user_json)
+    if user is not None:
+        l1.set(key, user)
+    return user
+
+
 # ============================================================================
 # HEALTH CHECK FUNCTIONS
 # ============================================================================
@@ -186,152 +291,292 @@ async def is_cached(
     Args:
         redis_cache: Redis клиент
         user_id: ID пользователя
-        session: SQLAlchemy сессия
-        force_refresh: Принудительное обновление из БД (для ночного воркера)
+        session: SQLAlchemy сессия апдейта; загрузку делает задача flights.do
+            со своей сессией - апдейт может закончиться (и закрыть сессию) раньше
+            задачи, а её результат ждут и чужие апдейты
+        force_refresh: Принудительное обновление из БД (фоновое обновление устаревшего снимка)
     
-    TTL стратегия:
-        - force_refresh=True: 25 часов (90000 сек) - ночное обновление
+    TTL стратегия (мягкий срок; ключ живёт ещё STALE_GRACE и после
+    мягкого срока отдаётся сразу, обновляясь в фоне):
+        - force_refresh=True: 25 часов (90000 сек) - фоновое обновление
         - force_refresh=False: 1 час (3600 сек) - первое обращение
     
     Returns:
-        UserModel или None если пользователь не найден
+        UserModel или None - не найден или узнать не удалось (ошибка БД,
+        не дождались чужой аренды). Решать «регистрировать ли» по этому
+        None нельзя - для этого find_user
     """
     user_str = f"USER_DATA:{user_id}"
-    lock_key = f"USER_DATA_LOCK:{user_id}"
 
     logger.debug(f"🔍 is_cached: user_id={user_id}, force_refresh={force_refresh}")
     
-    # Если не force_refresh - пытаемся взять из кеша
+    # Если не force_refresh - сначала память процесса
     if not force_refresh:
-        user = await redis_cache.get(user_str)
-        if user is not None:
-            logger.info(f"✅ Cache HIT: user_id={user_id}")
-            return _parse_user(user)
-        logger.debug(f"⚠️  Cache MISS: user_id={user_id}")
-    else:
-        logger.debug(f"🔄 Force refresh: user_id={user_id}")
-    
-    # Нет кеша или force_refresh - берём lock
-    acquired = await redis_cache.set(lock_key, "1", nx=True, ex=5)
-    
-    if acquired:
-        logger.debug(f"🔒 Lock acquired: user_id={user_id}")
-        try:
-            # Double-check (если не force_refresh)
-            if not force_refresh:
-                user = await redis_cache.get(user_str)
-                if user is not None:
-                    logger.debug(f"✅ Cache filled by another task: user_id={user_id}")
-                    return _parse_user(user)
-            
-            # Загружаем из БД
-            logger.debug(f"📊 Loading from DB: user_id={user_id}")
-            repo = BaseRepository(session=session, model=User)
-            user_data = await repo.get_one(user_id=user_id)
-            
-            if not user_data:
-                logger.warning(f"❌ User NOT FOUND in DB: user_id={user_id}")
-                return None
-            
-            await session.refresh(user_data)
+        local = l1.get(user_str)
+        if local is not MISSING:
+            return local
 
-            # Сериализуем
-            json_user_data = json.dumps(user_data.as_dict(), default=str)
-            
-            # Определяем TTL
-            ttl = 90000 if force_refresh else 3600
-            
-            # Сохраняем в кеш
-            await redis_cache.set(user_str, json_user_data, ex=ttl)
-            logger.info(f"💾 Cached: user_id={user_id}, ttl={ttl}s, source={'nightly' if force_refresh else 'miss'}")
-            
-            return _parse_user(json_user_data)
-            
-        except Exception as e:
-            logger.error(f"❌ DB error: user_id={user_id}, error={e}")
+        # Заведомо неизвестный user_id - без Redis и БД
+        if not known.might_contain(user_member(user_id)):
+            logger.debug(f"🚫 Unknown user (bloom): user_id={user_id}")
             return None
-        finally:
-            await redis_cache.delete(lock_key)
-            logger.debug(f"🔓 Lock released: user_id={user_id}")
     else:
-        # Другой task заполняет кеш, ждём его
-        logger.debug(f"⏳ Waiting for lock: user_id={user_id}")
-        for attempt in range(50):
-            await asyncio.sleep(0.1)
-            user = await redis_cache.get(user_str)
-            if user is not None:
-                logger.debug(f"✅ Cache ready (attempt {attempt+1}): user_id={user_id}")
-                return _parse_user(user)
-        
-        logger.warning(f"⏱️  Timeout waiting for cache: user_id={user_id}")
+        logger.debug(f"🔄 Force refresh: user_id={user_id}")
+
+    # Дальше один загрузчик на процесс, остальные ждут его задачу
+    try:
+        user = await flights.do(
+            f"{user_str}:{'refresh' if force_refresh else 'miss'}",
+            lambda: _fill_user_cache_own_session(redis_cache, user_id, force_refresh)
+        )
+    except UserLookupError as e:
+        logger.warning(f"⚠️ is_cached: {e}")
         return None
+    return None if user is USER_NOT_FOUND else user
+
+
+async def find_user(redis_cache: Redis, user_id: int) -> UserModel | None:
+    """
+    Есть ли пользователь - для решения «регистрировать или нет» (/start)
+
+    В отличие от is_cached не верит блуму и надгробию (блум в процессе
+    может ещё не знать о свежей регистрации, надгробие - пережить вставку
+    мимо db_worker) и перепроверяет БД.
+
+    Returns:
+        UserModel или None - только если БД подтвердила, что его нет
+
+    Raises:
+        UserLookupError: ответа БД нет (ошибка, не дождались чужой аренды)
+    """
+    user_str = f"USER_DATA:{user_id}"
+
+    local = l1.get(user_str)
+    if local is not MISSING:
+        return local
+
+    user = await flights.do(
+        f"{user_str}:find",
+        lambda: _fill_user_cache_own_session(redis_cache, user_id, False, recheck_tombstone=True)
+    )
+    return None if user is USER_NOT_FOUND else user
+
+
+async def _fill_user_cache(
+    redis_cache: Redis,
+    user_id: int,
+    session: AsyncSession,
+    force_refresh: bool,
+    recheck_tombstone: bool = False
+) -> Any:
+    """
+    Значение или аренда одним Lua-вызовом, загрузка из БД,
+    запись + снятие аренды + "filled" - вторым
+
+    Returns:
+        UserModel или USER_NOT_FOUND - БД (сейчас или по надгробию) ответила «нет»
+
+    Raises:
+        UserLookupError: не дождались чужой аренды или БД ответила ошибкой
+    """
+    user_str = f"USER_DATA:{user_id}"
+
+    user, token = await get_or_lease(redis_cache, user_str, refresh=force_refresh)
+
+    if user is TOMBSTONE and recheck_tombstone:
+        # Надгробие ставили до вставки, о которой db_worker не знал, - спрашиваем БД
+        user, token = await get_or_lease(redis_cache, user_str, refresh=True)
+
+    if user is TOMBSTONE:
+        logger.debug(f"🪦 Negative cache HIT: user_id={user_id}")
+        return USER_NOT_FOUND
+
+    if user is not None:
+        logger.info(f"✅ Cache HIT: user_id={user_id}")
+        if is_stale(user):
+            # Отдаём как есть, свежий снимок догрузится в фоне
+            revalidate(user_str, lambda: revalidate_user(redis_cache, user_id))
+        return _remember_user(user_str, user)
+
+    if token is None:
+        # Другой процесс заполняет кеш, ждём его "filled"
+        logger.debug(f"⏳ Waiting for lease: user_id={user_id}")
+        user = await wait_for_key(redis_cache, user_str, timeout=5)
+        if user is not None:
+            logger.debug(f"✅ Cache ready: user_id={user_id}")
+            return _remember_user(user_str, user)
+
+        # None - либо надгробие от заполнявшего, либо так и не дождались
+        if await redis_cache.exists(negative_key(user_str)):
+            return USER_NOT_FOUND
+
+        logger.warning(f"⏱️  Timeout waiting for cache: user_id={user_id}")
+        raise UserLookupError(f"timeout waiting for cache: user_id={user_id}")
+
+    logger.debug(f"🔒 Lease acquired: user_id={user_id}")
+    stored = False
+    try:
+        # Загружаем из БД
+        logger.debug(f"📊 Loading from DB: user_id={user_id}")
+        repo = BaseRepository(session=session, model=User)
+        user_row = await repo.fetch_one(USER_SNAPSHOT_COLUMNS, user_id=user_id)
+        
+        if user_row is None:
+            logger.warning(f"❌ User NOT FOUND in DB: user_id={user_id}")
+            # Следующие клики этого user_id NEGATIVE_TTL секунд не дойдут до БД
+            await store_tombstone(redis_cache, user_str, token)
+            stored = True
+            return USER_NOT_FOUND
+
+        # Определяем мягкий TTL (жёсткий - на STALE_GRACE дольше)
+        ttl = 90000 if force_refresh else 3600
+
+        # Сериализуем; модель собираем из строки БД, а не из только что записанного JSON
+        row = user_row._mapping
+        json_user_data = encode_user(row, soft_ttl=ttl)
+        
+        # Сохраняем в кеш; при refresh значение могло поменяться - сбрасываем L1 других процессов
+        await store_and_release(
+            redis_cache,
+            user_str,
+            json_user_data,
+            ttl=hard_ttl(ttl),
+            token=token,
+            notify="del" if force_refresh else "filled"
+        )
+        stored = True
+        logger.info(f"💾 Cached: user_id={user_id}, soft_ttl={ttl}s, source={'refresh' if force_refresh else 'miss'}")
+
+        user = UserModel(**row)
+        l1.set(user_str, user)
+        return user
+        
+    except Exception as e:
+        logger.error(f"❌ DB error: user_id={user_id}, error={e}")
+        raise UserLookupError(f"DB error: user_id={user_id}, error={e}") from e
+    finally:
+        if not stored:
+            await release_lease(redis_cache, user_str, token)
+            logger.debug(f"🔓 Lease released: user_id={user_id}")
+
+
+async def _fill_user_cache_own_session(
+    redis_cache: Redis,
+    user_id: int,
+    force_refresh: bool,
+    recheck_tombstone: bool = False
+) -> Any:
+    # Из primary: промах по отстающей реплике сразу после поставленной
+    # в очередь записи лёг бы надгробием «нет в БД» на NEGATIVE_TTL
+    with use_primary():
+        async with async_session_maker() as session:
+            return await _fill_user_cache(redis_cache, user_id, session, force_refresh, recheck_tombstone)
+
+
+async def revalidate_user(redis_cache: Redis, user_id: int) -> None:
+    """Фоновое обновление устаревшего USER_DATA - своя сессия, запрос уже ответил"""
+    await _fill_user_cache_own_session(redis_cache, user_id, force_refresh=True)
+
+
+async def register_user(
+    redis_cache: Redis,
+    user_id: int,
+    username: str | None
+) -> UserModel:
+    """
+    Write-behind регистрация нового пользователя
+
+    Снимок сразу кладётся в USER_DATA (SET NX - не затираем чужой),
+    а вставка в БД уходит в очередь USER_REGISTER и делается
+    пачкой идемпотентным upsert'ом в registration_worker.
+    """
+    user = UserModel(user_id=user_id, username=username, trial_used=False)
+    user_str = f"USER_DATA:{user_id}"
+
+    created = await redis_cache.set(user_str, encode_user(user.model_dump(), soft_ttl=3600), nx=True, ex=hard_ttl(3600))
+    if not created:
+        cached = await redis_cache.get(user_str)
+        if cached is not None:
+            parsed = _parse_user(cached)
+            if parsed is not None:
+                return parsed
+
+    await redis_cache.lpush( # type: ignore
+        REGISTER_QUEUE,
+        json.dumps({"user_id": user_id, "username": username}, sort_keys=True)
+    )
+    # Пользователь есть (пока только в кеше) - снимаем «нет в БД»
+    await clear_tombstones(redis_cache, user_str)
+    await publish_known(redis_cache, user_member(user_id))
+    logger.info(f"➕ User registered (write-behind): user_id={user_id}")
+    return user
 
 
 async def cache_popular_pay_time(redis_cache: Redis, user_id: int) -> str | None:
     """Получить или создать платёж для популярной суммы (50₽)"""
     
     pay_str = f"POP_PAY_CHOOSE:{user_id}"
-    lock_key = f"POP_PAY_LOCK:{user_id}"
     
     logger.debug(f"💰 Payment request: user_id={user_id}")
 
-    # Проверяем кэш
-    pay_data = await redis_cache.get(pay_str)
-    
+    # Повторные нажатия в этом процессе ждут один и тот же запрос
+    pay_data = await flights.do(pay_str, lambda: _request_popular_payment(redis_cache, user_id))
     if pay_data is None:
-        # Атомарно берём lock
-        acquired = await redis_cache.set(lock_key, "1", nx=True, ex=60)
-        
-        if acquired:
-            logger.debug(f"🔒 Payment lock acquired: user_id={user_id}")
-            try:
-                # Double-check после получения lock
-                pay_data = await redis_cache.get(pay_str)
-                
-                if pay_data is None:
-                    # Только мы создаём платёж
-                    payment_data = {
-                        'user_id': user_id,
-                        'amount': 50,
-                    }
-                    
-                    await redis_cache.lpush("PAYMENT_QUEUE", json.dumps(payment_data)) # type: ignore
-                    logger.info(f"📤 Payment queued: user_id={user_id}, amount=50₽")
-                    
-                    # Ждём обработки (максимум 10 секунд)
-                    for _ in range(100):
-                        await asyncio.sleep(0.1)
-                        pay_data = await redis_cache.get(pay_str)
-                        if pay_data:
-                            logger.debug(f"✅ Payment processed: user_id={user_id}")
-                            break
-                    
-                    if pay_data is None:
-                        logger.warning(f"⏱️  Payment timeout: user_id={user_id}")
-                        return None
-            finally:
-                await redis_cache.delete(lock_key)
-                logger.debug(f"🔓 Payment lock released: user_id={user_id}")
-        else:
-            # Другой task создаёт платёж, ждём результата
-            logger.debug(f"⏳ Waiting for payment: user_id={user_id}")
-            for _ in range(100):
-                await asyncio.sleep(0.1)
-                pay_data = await redis_cache.get(pay_str)
-                if pay_data:
-                    break
-
-            if pay_data is None:
-                logger.warning(f"⏱️  Payment wait timeout: user_id={user_id}")
-                return None
-    else:
-        logger.debug(f"✅ Payment cache HIT: user_id={user_id}")
+        return None
     
     # Парсим и возвращаем URL
     pay_res = json.loads(pay_data)
     return pay_res['payment_url']
 
 
+async def _request_popular_payment(redis_cache: Redis, user_id: int) -> str | None:
+    """
+    Платёж из кеша или аренда на его создание (один Lua-вызов)
+
+    Значение пишет pub_listner через store_and_release - он же
+    снимает аренду и будит ожидающих.
+    """
+    pay_str = f"POP_PAY_CHOOSE:{user_id}"
+
+    pay_data, token = await get_or_lease(redis_cache, pay_str, lease_ttl_ms=60_000)
+
+    if pay_data is not None:
+        logger.debug(f"✅ Payment cache HIT: user_id={user_id}")
+        return pay_data
+
+    if token is None:
+        # Другой процесс создаёт платёж, ждём результата
+        logger.debug(f"⏳ Waiting for payment: user_id={user_id}")
+        pay_data = await wait_for_key(redis_cache, pay_str, timeout=10)
+
+        if pay_data is None:
+            logger.warning(f"⏱️  Payment wait timeout: user_id={user_id}")
+        return pay_data
+
+    logger.debug(f"🔒 Payment lease acquired: user_id={user_id}")
+    try:
+        # Только мы создаём платёж
+        payment_data = {
+            'user_id': user_id,
+            'amount': 50,
+        }
+        
+        await redis_cache.lpush("PAYMENT_QUEUE", json.dumps(payment_data)) # type: ignore
+        logger.info(f"📤 Payment queued: user_id={user_id}, amount=50₽")
+        
+        # Ждём обработки (максимум 10 секунд)
+        pay_data = await wait_for_key(redis_cache, pay_str, timeout=10)
+        
+        if pay_data is None:
+            logger.warning(f"⏱️  Payment timeout: user_id={user_id}")
+            return None
+        logger.debug(f"✅ Payment processed: user_id={user_id}")
+        return pay_data
+    finally:
+        # Обычно аренду уже снял pub_listner - тогда это no-op
+        await release_lease(redis_cache, pay_str, token)
+
+
 async def is_cached_payment(
     redis_cache: Redis,
     user_id: int,
@@ -463,8 +708,9 @@ async def pub_listner(redis_cli: Redis, data: dict):
     }
 
     web_wrk_label = f"YOO:{res[1]}"
-    await redis_cli.set(pay_str, json.dumps(data_for_load), ex=600)
     await redis_cli.set(web_wrk_label, json.dumps(data_for_webhook), ex=700)
+    # Ссылка + снятие аренды cache_popular_pay_time + "filled" - одним вызовом
+    await store_and_release(redis_cli, pay_str, json.dumps(data_for_load), ttl=600, token=None)
     logger.info(f"✅ Payment created: user_id={user_id}, payment_id={res[1]}")
 
 
@@ -487,7 +733,16 @@ async def trial_activation_worker(
     user = await repo.get_one(user_id=int(data["user_id"]))
     
     if not user:
-        user = await repo.create(user_id=int(data['user_id']))
+        # upsert: регистрация из /start могла успеть вставить строку
+        await repo.bulk_upsert(
+            [{"user_id": int(data['user_id']), "username": data.get('username')}],
+            conflict_keys=["user_id"],
+            update_fields=[]
+        )
+        user = await repo.get_one(user_id=int(data["user_id"]))
+        await forget_state(redis_cli, User, data['user_id'])
+        await clear_tombstones(redis_cli, f"USER_DATA:{data['user_id']}")
+        await publish_known(redis_cli, user_member(data['user_id']))
         logger.info(f"➕ User created: user_id={data['user_id']}")
     else:
         logger.debug(f"✅ User found: user_id={data['user_id']}")
@@ -532,9 +787,8 @@ async def trial_activation_worker(
     new_expire: datetime = max_val + timedelta(days=s.TRIAL_DAYS)
     data_marz['expire'] = int(new_expire.timestamp())
 
-    # Отправляем задачи
+    # Отправляем задачи (через outbox - одной транзакцией)
     logger.info(f"📤 Queueing Marzban task: user_id={user_id}, expire={new_expire}")
-    await redis_cli.lpush("MARZBAN", json.dumps(data_marz, sort_keys=True, default=str)) # type: ignore
 
     data_for_cache = {
         "user_id": user_id,
@@ -543,14 +797,21 @@ async def trial_activation_worker(
         "trial_used": True
     }
 
-    await redis_cli.lpush("DB", json.dumps({
-        "user_id": user_id,
-        "trial_used": True,
-        "model": "User",
-        "type": "create"
-    }, default=str, sort_keys=True)) # type: ignore
-
-    await redis_cli.set(f"USER_DATA:{user_id}", json.dumps(data_for_cache, default=str), ex=7200)
+    await enqueue_outbox(session, [
+        push_task("MARZBAN", data_marz, dedupe_key=f"trial:{user_id}:marzban"),
+        push_task("DB", {
+            "user_id": user_id,
+            "trial_used": True,
+            "model": "User",
+            "type": "create"
+        }, dedupe_key=f"trial:{user_id}:db"),
+        set_key(
+            f"USER_DATA:{user_id}",
+            encode_user(data_for_cache, soft_ttl=7200),
+            ttl=hard_ttl(7200),
+            dedupe_key=f"trial:{user_id}:cache"
+        ),
+    ])
     logger.info(f"✅ Trial activated: user_id={user_id}")
 
     # Уведомление пользователя
@@ -730,8 +991,6 @@ async def db_worker(
     
         logger.info(f"📥 DB task: model={data.get('model')}, type={data.get('type')}")
     
-        data = deserialize_data(data)
-    
         # ═══════════════════════════════════════════════════════════════
         # ЭТАП 1: Инициализация и валидация
         # ═══════════════════════════════════════════════════════════════
@@ -747,6 +1006,13 @@ async def db_worker(
 
         logger.info(f"✅ Model resolved: {model.__name__}")
 
+        try:
+            data = MODEL_DECODERS[data['model']](data)
+        except ValueError as e:
+            # Кривой payload не исправится от повторов
+            logger.error(f"❌ Invalid task payload: {e}")
+            raise SkipTask(f"Invalid task payload: {e}")
+
         repo = BaseRepository(session=session, model=model)
         data_type: str = data['type'].lower()
 
@@ -776,6 +1042,18 @@ async def db_worker(
                 raise SkipTask(f"{model.__name__} requires 'user_id' field")
             
             user_id = int(user_id)
+
+            # Быстрый путь: отпечатки последней записи в Redis, без похода в БД
+            new_fields = {k: v for k, v in db_data.items() if k != 'user_id'}
+            if new_fields and await is_unchanged(redis_cli, model, user_id, new_fields):
+                await incr_metric(redis_cli, "db_worker_nochange_hit")
+                logger.info(f"⏭️  No changes (state cache): model={model.__name__}, user_id={user_id}")
+
+                if process_once:
+                    return 'skipped'
+                raise SkipTask
+
+            await incr_metric(redis_cli, "db_worker_nochange_miss")
             logger.info(f"🔍 Checking existence: model={model.__name__}, user_id={user_id}")
             
             existing = await repo.get_one(user_id=user_id)
@@ -826,6 +1104,7 @@ async def db_worker(
                 if not has_changes:
                     logger.info(f"⏭️  No changes detected: model={model.__name__}, user_id={user_id}")
                     logger.debug(f"✓ All {len(new_data)} fields match existing record")
+                    await remember_state(redis_cli, model, user_id, existing.as_dict())
                     
                     if process_once:
                         logger.debug("🔄 Returning 'skipped' (process_once=True)")
@@ -899,16 +1178,26 @@ async def db_worker(
             logger.info(f"➕ Creating new {model.__name__} record")
             logger.debug(f"📦 Create data: {json.dumps(db_data, default=str, ensure_ascii=False)[:500]}...")
             
+            conflict_keys = IDEMPOTENT_CREATE_KEYS.get(model)
             try:
-                res = await repo.create(**db_data)
-                logger.info(f"✅ Successfully created {model.__name__}")
-                logger.debug(f"📊 Created record: {res}")
-                result_type = "create"
+                if conflict_keys:
+                    res = await repo.bulk_upsert([db_data], conflict_keys=conflict_keys, update_fields=[])
+                else:
+                    res = await repo.create(**db_data)
             except Exception as e:
                 logger.error(f"❌ Failed to create {model.__name__}: {type(e).__name__}: {e}")
                 logger.error(f"📦 Data that caused error: {json.dumps(db_data, default=str, ensure_ascii=False)}")
                 raise
 
+            if conflict_keys and not res:
+                key = {k: db_data.get(k) for k in conflict_keys}
+                logger.warning(f"⚠️ {model.__name__} already exists, redelivered task skipped: {key}")
+                raise SkipTask(f"{model.__name__} already exists: {key}")
+
+            logger.info(f"✅ Successfully created {model.__name__}")
+            logger.debug(f"📊 Created record: {res}")
+            result_type = "create"
+
         # ───────────────────────────────────────────────────────────
         # UPDATE
         # ───────────────────────────────────────────────────────────
@@ -965,10 +1254,17 @@ async def db_worker(
                 logger.error(f"❌ User not found after {result_type}: user_id={user_id}")
                 raise SkipTask(f"User {user_id} not found after operation")
             
-            user_data = user.as_dict()
             cache_key = f"USER_DATA:{user_id}"
-            await redis_cli.set(cache_key, json.dumps(user_data, default=str), ex=3600)
-            logger.debug(f"✅ Cached User data: key={cache_key}, ttl=3600s")
+            # Снимает и аренды фоновых обновлений: прочитанное до нашего коммита не запишется
+            await store_and_release(
+                redis_cli, cache_key, encode_user(user.as_dict(), soft_ttl=3600),
+                ttl=hard_ttl(3600), token=None, notify="del"
+            )
+            if result_type == "create":
+                await clear_tombstones(redis_cli, cache_key)
+                await publish_known(redis_cli, user_member(user_id))
+            await remember_state(redis_cli, User, int(user_id), user.as_dict())
+            logger.debug(f"✅ Cached User data: key={cache_key}, soft_ttl=3600s")
 
         elif model == UserLinks:
             user_id = db_data.get('user_id') or data.get('filter', {}).get('user_id')
@@ -983,8 +1279,15 @@ async def db_worker(
             user_data = user_links.as_dict()
             uuid_value = user_data['uuid']
             cache_key = f"USER_UUID:{user_id}"
-            await redis_cli.set(cache_key, json.dumps(uuid_value, default=str), ex=3600)
-            logger.debug(f"✅ Cached UserLinks UUID: key={cache_key}, uuid={uuid_value}, ttl=3600s")
+            await store_and_release(
+                redis_cli, cache_key, str(uuid_value),
+                ttl=USER_UUID_TTL, token=None, notify="del"
+            )
+            # uuid мог смениться и при update - новый тоже должен стать «известным»
+            await clear_tombstones(redis_cli, cache_key, f"SUB:{uuid_value}")
+            await publish_known(redis_cli, user_member(user_id), uuid_member(str(uuid_value)))
+            await remember_state(redis_cli, UserLinks, int(user_id), user_data)
+            logger.debug(f"✅ Cached UserLinks UUID: key={cache_key}, uuid={uuid_value}, ttl={USER_UUID_TTL}s")
 
         else:
             logger.debug(f"⏭️  No cache update needed for {model.__name__}")
@@ -1011,6 +1314,7 @@ async def db_worker(
 )
 async def payment_wrk(
     redis_cli: Redis,
+    session: AsyncSession,
     data: dict
 ):
     """Воркер для обработки успешных платежей"""
@@ -1056,19 +1360,6 @@ async def payment_wrk(
     
     mrzb_data['expire'] = int(inc_expire.timestamp())
     
-    # Отправляем в Marzban воркер
-    logger.debug(f"📤 Queueing Marzban task: type={mrzb_data['type']}, expire={inc_expire}")
-    await redis_cli.lpush(
-        "MARZBAN",
-        json.dumps(mrzb_data, sort_keys=True, default=str)
-    ) # type: ignore
-
-    queue_size = await redis_cli.llen("MARZBAN") # type: ignore
-    logger.info(f"📊 MARZBAN queue size after push: {queue_size}")
-
-    last_task = await redis_cli.lindex("MARZBAN", 0) # type: ignore
-    logger.debug(f"📝 Last MARZBAN task: {last_task}")
-    
     # Задачи в БД
     user_db: dict = {
         'model': "User",
@@ -1082,15 +1373,20 @@ async def payment_wrk(
         "type": "create",
         "payment_id": data['order_id'],
         'user_id': data['user_id'],
-        "amount": data['amount']
+        "amount": data['amount'],
+        # Часть уникального ключа платежа: повторная доставка из outbox несёт то же значение
+        "created_at": datetime.now()
     }
     
+    # Marzban + DB задачи через outbox - одной транзакцией, ровно один раз на заказ
+    order_id = data['order_id']
+    logger.debug(f"📤 Queueing Marzban task: type={mrzb_data['type']}, expire={inc_expire}")
     logger.debug(f"📤 Queueing DB tasks: User + PaymentData for user_id={data['user_id']}")
-    for db_op in (user_db, payment_db):
-        await redis_cli.lpush(
-            "DB",
-            json.dumps(db_op, sort_keys=True, default=str)
-        ) # type: ignore
+    await enqueue_outbox(session, [
+        push_task("MARZBAN", mrzb_data, dedupe_key=f"payment:{order_id}:marzban"),
+        push_task("DB", user_db, dedupe_key=f"payment:{order_id}:user"),
+        push_task("DB", payment_db, dedupe_key=f"payment:{order_id}:payment"),
+    ])
     
     logger.info(f"✅ Payment processed: user_id={data['user_id']}, amount={data['amount']}₽, order_id={data['order_id']}")
 
@@ -1108,81 +1404,512 @@ async def payment_wrk(
     )
 
 
-# --- Nightly Cache Refresh Worker ---
+# --- User Registration Worker ---
 
-async def nightly_cache_refresh_worker(
-    redis_cache: Redis,
-    session_maker
+async def register_batch(redis_cli: Redis, session_maker, messages: list[str]) -> int:
+    """Одна пачка USER_REGISTER: upsert DO NOTHING + сброс отпечатков DB_STATE"""
+    rows: dict[int, dict] = {}
+    for message in messages:
+        item = json.loads(message)
+        rows[int(item["user_id"])] = {
+            "user_id": int(item["user_id"]),
+            "username": item.get("username"),
+        }
+
+    async with session_maker() as session:
+        repo = BaseRepository(session=session, model=User)
+        inserted = await repo.bulk_upsert(
+            list(rows.values()),
+            conflict_keys=["user_id"],
+            update_fields=[]
+        )
+
+    await forget_state(redis_cli, User, *rows)
+    logger.info(f"✅ Registered batch: {len(rows)} user(s), {inserted} new")
+    return inserted
+
+
+async def registration_worker(
+    redis_cli: Redis,
+    session_maker,
+    timeout: int = 5
 ):
-    """Воркер для ночного обновления кешей всех пользователей"""
-    logger.info("🌙 Nightly refresh worker started")
-    
+    """
+    Воркер отложенной регистрации: пачки из USER_REGISTER в users
+
+    INSERT ... ON CONFLICT (user_id) DO NOTHING - повторы и гонка
+    с trial_activation_worker/db_worker ничего не ломают.
+    """
+    logger.info(f"🚀 registration_worker started (queue={REGISTER_QUEUE})")
+
     while True:
-        now = datetime.now()
-        target = now.replace(hour=3, minute=0, second=0, microsecond=0)
-        
-        if target <= now:
-            target += timedelta(days=1)
-        
-        sleep_seconds = (target - datetime.now()).total_seconds()
-        logger.info(f"🌙 Next refresh: {target} (in {sleep_seconds/3600:.1f}h)")
-        
-        await asyncio.sleep(sleep_seconds)
-        
-        logger.info("🌙 Starting nightly cache refresh...")
-        
+        result = await redis_cli.brpop(REGISTER_QUEUE, timeout=timeout) # type: ignore
+        if not result:
+            continue
+
+        messages = [result[1]]
+        more = await redis_cli.rpop(REGISTER_QUEUE, REGISTER_BATCH_SIZE - 1) # type: ignore
+        if more:
+            messages.extend(more)
+
         try:
-            async with session_maker() as session:                
-                offset = 0
-                batch_size = 100
-                total_refreshed = 0
-                
-                while True:
-                    stmt = select(User).offset(offset).limit(batch_size)
-                    result = await session.execute(stmt)
-                    users = result.scalars().all()
-                    
-                    if not users:
-                        break
-                    
-                    for user in users:
-                        try:
-                            await is_cached(
-                                redis_cache=redis_cache,
-                                user_id=user.user_id,
-                                session=session,
-                                force_refresh=True
-                            )
-                            total_refreshed += 1
-                            
-                            if total_refreshed % 100 == 0:
-                                logger.info(f"📊 Progress: {total_refreshed} users")
-                                
-                        except Exception as e:
-                            logger.error(f"❌ Refresh failed: user_id={user.user_id}, error={e}")
-                            continue
-                    
-                    offset += batch_size
-                    await asyncio.sleep(0.5)
-                
-                logger.info(f"✅ Nightly refresh complete: {total_refreshed} users")
-                
+            await register_batch(redis_cli, session_maker, messages)
+
+        except asyncio.CancelledError:
+            raise
         except Exception as e:
-            logger.error(f"❌ Nightly refresh error: {e}")
+            logger.error(f"❌ Registration batch failed ({len(messages)} msg): {e}")
+            # Возвращаем в хвост очереди (brpop берёт справа)
+            await redis_cli.rpush(REGISTER_QUEUE, *reversed(messages)) # type: ignore
+            await asyncio.sleep(1)
+
+
+# --- Guarded Cache Refresh ---
+
+_SNAPSHOT_BY_IDS_STMT = (
+    select(*(User.__table__.c[name] for name in USER_SNAPSHOT_COLUMNS))
+    .where(User.user_id.in_(bindparam("user_ids", expanding=True)))
+)
+
+_UUIDS_BY_IDS_STMT = (
+    select(UserLinks.user_id, UserLinks.uuid)
+    .where(UserLinks.user_id.in_(bindparam("user_ids", expanding=True)))
+)
+
+
+async def _refresh_leased(
+    redis_cache: Redis,
+    session_maker,
+    key_fmt: str,
+    stmt,
+    user_ids: list[int],
+    entry: Callable[[Any], tuple[str, str, int]]
+) -> tuple[list[str], list, list[int]]:
+    """
+    Переписывает ключи key_fmt пачки пользователей из primary под арендами
+
+    Аренды берутся до SELECT, запись - только там, где аренда ещё наша.
+    db_worker и outbox своей записью снимают аренду, поэтому строка,
+    прочитанная до их коммита, не затрёт более новое значение. Ключи,
+    которые сейчас заполняет промах, пропускаются.
+
+    Returns:
+        (записанные ключи, строки БД, user_id без строки в БД)
+    """
+    keys = {key_fmt.format(user_id): user_id for user_id in user_ids}
+    token, leased = await lease_many(redis_cache, list(keys))
+    if not leased:
+        return [], [], []
+
+    try:
+        # С реплики прочитали бы значение старее того, что уже записал db_worker
+        with use_primary():
+            async with session_maker() as session:
+                res = await session.execute(stmt, {"user_ids": [keys[key] for key in leased]})
+                rows = res.all()
+        stored = await store_many_if_leased(redis_cache, [entry(row) for row in rows], token)
+    finally:
+        await release_many(redis_cache, leased, token)
+
+    found = {row.user_id for row in rows}
+    return stored, rows, [keys[key] for key in leased if keys[key] not in found]
+
+
+async def refresh_users(
+    redis_cache: Redis,
+    session_maker,
+    user_ids: list[int],
+    soft_ttl: int,
+    jitter: int = 0
+) -> tuple[list[str], list[int]]:
+    """
+    USER_DATA пачки пользователей: один SELECT ... IN + один pipeline
+    + одна инвалидация L1 на пачку
+
+    jitter - случайная добавка к мягкому сроку, чтобы записанные вместе
+    ключи не устаревали в одну секунду.
+
+    Returns:
+        (записанные ключи, user_id без строки в БД)
+    """
+    def entry(row) -> tuple[str, str, int]:
+        ttl = soft_ttl + random.randint(0, jitter) if jitter else soft_ttl
+        return f"USER_DATA:{row.user_id}", encode_user(row._mapping, soft_ttl=ttl), hard_ttl(ttl)
+
+    stored, _, missing = await _refresh_leased(
+        redis_cache, session_maker, "USER_DATA:{}", _SNAPSHOT_BY_IDS_STMT, user_ids, entry
+    )
+    await publish_invalidation(redis_cache, *stored)
+    return stored, missing
+
+
+async def refresh_uuids(
+    redis_cache: Redis,
+    session_maker,
+    user_ids: list[int]
+) -> tuple[list[str], list[int]]:
+    """USER_UUID пачки пользователей + надгробия и Bloom-фильтр; возвращает как refresh_users"""
+    def entry(row) -> tuple[str, str, int]:
+        return f"USER_UUID:{row.user_id}", row.uuid, USER_UUID_TTL
+
+    stored, rows, missing = await _refresh_leased(
+        redis_cache, session_maker, "USER_UUID:{}", _UUIDS_BY_IDS_STMT, user_ids, entry
+    )
+    stored_keys = set(stored)
+    written = [row for row in rows if f"USER_UUID:{row.user_id}" in stored_keys]
+    await clear_tombstones(redis_cache, *(f"SUB:{row.uuid}" for row in written))
+    await publish_invalidation(redis_cache, *stored)
+    await publish_known(
+        redis_cache,
+        *(user_member(row.user_id) for row in written),
+        *(uuid_member(row.uuid) for row in written)
+    )
+    return stored, missing
+
+
+# --- Full Cache Rebuild ---
+
+REBUILD_CHUNK: int = 1000
+REBUILD_SOFT_TTL: int = 90000
+
+# Keyset-пагинация: WHERE user_id > последний из прошлой пачки (индекс, без OFFSET)
+_USER_IDS_CHUNK_STMT = (
+    select(User.user_id)
+    .where(User.user_id > bindparam("after"))
+    .order_by(User.user_id)
+    .limit(bindparam("limit"))
+)
+
+
+async def rebuild_user_cache(
+    redis_cache: Redis,
+    session_maker,
+    chunk_size: int = REBUILD_CHUNK
+) -> int:
+    """
+    Пересборка USER_DATA всех пользователей потоком - разово, например
+    после очистки Redis (python -m misc.rebuild_cache; регулярно обновляет
+    rolling_cache_refresh_worker)
+
+    Пачка = id по индексу + refresh_users (аренды, SELECT ... IN, один
+    pipeline) вместо lock/get_one/SET/DEL на каждого пользователя.
+    """
+    total = 0
+    after = -1
+    started = time.monotonic()
+
+    async with session_maker() as session:
+        while True:
+            res = await session.execute(_USER_IDS_CHUNK_STMT, {"after": after, "limit": chunk_size})
+            user_ids = list(res.scalars())
+            if not user_ids:
+                break
 
+            stored, _ = await refresh_users(redis_cache, session_maker, user_ids, soft_ttl=REBUILD_SOFT_TTL)
+            total += len(stored)
+            after = user_ids[-1]
 
-async def get_links_of_panels(uuid: str) -> list | None:
+            elapsed = time.monotonic() - started
+            logger.info(f"📊 Progress: {total} users, {total / elapsed:.0f} users/s")
+
+    elapsed = time.monotonic() - started
+    await set_metric(redis_cache, "cache_rebuild_users", total)
+    await set_metric(redis_cache, "cache_rebuild_seconds", round(elapsed, 3))
+    logger.info(f"✅ Cache rebuild complete: {total} users in {elapsed:.1f}s ({total / max(elapsed, 1e-9):.0f} users/s)")
+    return total
+
+
+# --- Rolling Cache Refresh Worker ---
+
+REFRESH_TICK: int = 60
+ROLLING_REFRESH_LEADER: str = "rolling_cache_refresh"
+# Лидерство живёт столько тиков без продления - пережить паузу GC/сети, но не простой
+LEADER_TTL_TICKS: int = 3
+# Запас мягкого срока сверх окна: активный пользователь обновится раньше, чем устареет
+REFRESH_SOFT_MARGIN: int = 3600
+
+async def refresh_users_slice(redis_cache: Redis, session_maker, user_ids: list[int], soft_ttl: int, jitter: int) -> int:
+    """Одна порция скользящего обновления (refresh_users); возвращает число записанных"""
+    if not user_ids:
+        return 0
+
+    stored, _ = await refresh_users(redis_cache, session_maker, user_ids, soft_ttl=soft_ttl, jitter=jitter)
+    return len(stored)
+
+
+async def rolling_cache_refresh_worker(
+    redis_cache: Redis,
+    session_maker,
+    window: int = s.CACHE_REFRESH_WINDOW,
+    active_days: int = s.ACTIVE_USER_DAYS,
+    tick: int = REFRESH_TICK
+):
+    """
+    Скользящее обновление USER_DATA вместо одного прохода в 03:00
+
+    Раз в window секунд берём активных за active_days (USER_LAST_SEEN,
+    свежие - первыми) и обновляем их равными порциями каждые tick секунд.
+    Мягкий срок = window + запас + случайная добавка до 10% окна - ключи
+    не устаревают разом и нагрузка на БД ровная. Спящие не обновляются:
+    их снимки доживают жёсткий TTL, а при возвращении заполняются промахом.
+
+    Работает один процесс - лидер ROLLING_REFRESH_LEADER; лидерство
+    продлевается каждый tick, в том числе в паузе между циклами, чтобы
+    другой процесс не начал следующий цикл раньше срока.
+    """
+    logger.info(f"🌙 Rolling refresh worker started (window={window}s, tick={tick}s)")
+    loop = asyncio.get_running_loop()
+
+    soft_ttl = window + REFRESH_SOFT_MARGIN
+    jitter = window // 10
+    leader_ttl = LEADER_TTL_TICKS * tick
+
+    try:
+        while True:
+            if not await hold_leadership(redis_cache, ROLLING_REFRESH_LEADER, leader_ttl):
+                await asyncio.sleep(tick)
+                continue
+
+            started = loop.time()
+            refreshed = 0
+
+            try:
+                user_ids = await active_user_ids(redis_cache, active_days * 86400)
+                ticks = max(1, window // tick)
+                per_tick = max(1, -(-len(user_ids) // ticks))
+                logger.info(f"🌙 Refresh cycle: {len(user_ids)} active users, {per_tick} per {tick}s")
+
+                for i, start in enumerate(range(0, len(user_ids), per_tick)):
+                    if i and not await hold_leadership(redis_cache, ROLLING_REFRESH_LEADER, leader_ttl):
+                        logger.warning("⚠️ Rolling refresh: leadership lost, cycle stopped")
+                        break
+
+                    try:
+                        refreshed += await refresh_users_slice(
+                            redis_cache,
+                            session_maker,
+                            user_ids[start:start + per_tick],
+                            soft_ttl=soft_ttl,
+                            jitter=jitter
+                        )
+                    except asyncio.CancelledError:
+                        raise
+                    except Exception as e:
+                        logger.error(f"❌ Refresh slice failed: offset={start}, error={e}")
+
+                    await asyncio.sleep(max(0.0, started + (i + 1) * tick - loop.time()))
+
+                await set_metric(redis_cache, "rolling_refresh_users", refreshed)
+                logger.info(f"✅ Refresh cycle complete: {refreshed} users in {loop.time() - started:.0f}s")
+
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Rolling refresh error: {e}")
+
+            next_cycle = max(loop.time() + tick, started + window)
+            while loop.time() < next_cycle:
+                await asyncio.sleep(min(float(tick), next_cycle - loop.time()))
+                if not await hold_leadership(redis_cache, ROLLING_REFRESH_LEADER, leader_ttl):
+                    break
+    finally:
+        await resign_leadership(redis_cache, ROLLING_REFRESH_LEADER)
+
+
+# --- Incremental Cache Refresh Worker ---
+
+INCREMENTAL_INTERVAL: int = 60
+INCREMENTAL_REFRESH_LEADER: str = "incremental_cache_refresh"
+INCREMENTAL_BATCH: int = 1000
+# Транзакция, начатая до водяного знака, может закоммитить строку с updated_at
+# меньше него - хвост перечитываем с запасом (перезапись идемпотентна)
+WATERMARK_OVERLAP: timedelta = timedelta(minutes=2)
+
+
+def _changed_stmt(table, columns: tuple[str, ...]):
+    """Keyset по (updated_at, id): пачки без OFFSET и без потерь на равных updated_at"""
+    return (
+        select(*(table.c[name] for name in columns), table.c.updated_at, table.c.id)
+        .where(tuple_(table.c.updated_at, table.c.id) > tuple_(bindparam("after_ts"), bindparam("after_id")))
+        .order_by(table.c.updated_at, table.c.id)
+        .limit(bindparam("limit"))
+    )
+
+
+async def refresh_changed_users(redis_cache: Redis, session_maker, user_ids: list[int]) -> tuple[list[str], list[int]]:
+    """refresh_users с мягким сроком скользящего обновления (инкрементальное и NOTIFY)"""
+    return await refresh_users(
+        redis_cache,
+        session_maker,
+        user_ids,
+        soft_ttl=s.CACHE_REFRESH_WINDOW + REFRESH_SOFT_MARGIN,
+        jitter=s.CACHE_REFRESH_WINDOW // 10
+    )
+
+
+# таблица -> (модель, обновление кеша по user_id)
+INCREMENTAL_TABLES: dict[str, tuple[Type, Any]] = {
+    "users": (User, refresh_changed_users),
+    "links": (UserLinks, refresh_uuids),
+}
+
+
+def _watermark_key(name: str) -> str:
+    return f"CACHE_WATERMARK:{name}"
+
+
+async def refresh_changed(
+    redis_cache: Redis,
+    session_maker,
+    name: str,
+    batch: int = INCREMENTAL_BATCH
+) -> int:
+    """
+    Переписывает кеш строк name, изменённых после водяного знака
+
+    Водяной знак (максимальный увиденный updated_at) хранится в Redis.
+    Первый запуск только ставит его на текущий максимум - всё, что
+    было раньше, уже покрывает rolling_cache_refresh_worker. Пустая таблица
+    даёт datetime.min: всё, что появится потом, - новое.
+    """
+    model, refresh = INCREMENTAL_TABLES[name]
+    table = model.__table__
+    key = _watermark_key(name)
+
+    stored = await redis_cache.get(key)
+    async with session_maker() as session:
+        if stored is None:
+            res = await session.execute(select(func.max(table.c.updated_at)))
+            latest = res.scalar() or datetime.min
+            await redis_cache.set(key, latest.isoformat())
+            logger.info(f"🔖 Watermark initialized: {name}={latest}")
+            return 0
+
+        watermark = datetime.fromisoformat(stored)
+        # datetime.min - WATERMARK_OVERLAP -> OverflowError
+        after_ts, after_id = max(watermark, datetime.min + WATERMARK_OVERLAP) - WATERMARK_OVERLAP, 0
+        stmt = _changed_stmt(table, ("user_id",))
+        total = 0
+
+        while True:
+            res = await session.execute(stmt, {"after_ts": after_ts, "after_id": after_id, "limit": batch})
+            rows = res.all()
+            if not rows:
+                break
+
+            await refresh(redis_cache, session_maker, [row.user_id for row in rows])
+            total += len(rows)
+            after_ts, after_id = rows[-1].updated_at, rows[-1].id
+
+    if after_ts > watermark:
+        await redis_cache.set(key, after_ts.isoformat())
+
+    if total:
+        logger.info(f"🔄 Incremental refresh: {name} {total} rows, watermark={max(after_ts, watermark)}")
+    return total
+
+
+async def incremental_cache_refresh_worker(
+    redis_cache: Redis,
+    session_maker,
+    interval: int = INCREMENTAL_INTERVAL
+):
+    """
+    Раз в interval секунд переписывает кеш изменённых users/links
+
+    Работает один процесс - лидер INCREMENTAL_REFRESH_LEADER: водяной знак
+    общий, параллельные проходы только удваивают запросы.
+    """
+    logger.info(f"🚀 incremental_cache_refresh_worker started (interval={interval}s)")
+    leader_ttl = LEADER_TTL_TICKS * interval
+
+    try:
+        while True:
+            if await hold_leadership(redis_cache, INCREMENTAL_REFRESH_LEADER, leader_ttl):
+                for name in INCREMENTAL_TABLES:
+                    try:
+                        changed = await refresh_changed(redis_cache, session_maker, name)
+                        await incr_metric(redis_cache, f"incremental_refresh_{name}", changed)
+                    except asyncio.CancelledError:
+                        raise
+                    except Exception as e:
+                        logger.error(f"❌ Incremental refresh error: {name}, error={e}")
+
+            await asyncio.sleep(interval)
+    finally:
+        await resign_leadership(redis_cache, INCREMENTAL_REFRESH_LEADER)
+
+
+async def get_links_of_panels(uuid: str, redis_cli: Redis | None = None) -> list | None:
     '''
     Эта функция принимает на вход uuid строку. 
     И возвращает списоков подписок для обеих панелей, 
     которые есть в таблице links для этого uuid.
+
+    Неизвестные uuid (сканеры /sub/<random>) отсекаются Bloom-фильтром,
+    а с redis_cli ещё и надгробием SUB:<uuid> на NEGATIVE_TTL.
     '''
-    async with async_session_maker() as session:
-        user_repo = BaseRepository(session=session, model=UserLinks)
-        res = await user_repo.get_one(uuid=uuid)
-        logger.debug(res)
+    if not known.might_contain(uuid_member(uuid)):
+        logger.debug(f"🚫 Unknown uuid (bloom): {uuid}")
+        return None
 
-        if res is None:
-            return None
-        
-        return [res.panel1, res.panel2]
\ No newline at end of file
+    neg_key = negative_key(f"SUB:{uuid}")
+    if redis_cli is not None and await redis_cli.exists(neg_key):
+        logger.debug(f"🪦 Negative cache HIT: uuid={uuid}")
+        return None
+
+    # Из primary: клиент приходит за подпиской сразу после создания ссылок,
+    # промах по реплике лёг бы надгробием SUB:<uuid>
+    with use_primary():
+        async with async_session_maker() as session:
+            user_repo = BaseRepository(session=session, model=UserLinks)
+            res = await user_repo.fetch_one(("panel1", "panel2"), uuid=uuid)
+            logger.debug(res)
+
+    if res is None:
+        if redis_cli is not None:
+            await redis_cli.set(neg_key, "1", ex=NEGATIVE_TTL)
+        return None
+
+    return [res.panel1, res.panel2]
+
+
+# --- Known IDs (Bloom filter) Worker ---
+
+KNOWN_REWARM_CHECK: int = 5
+
+
+async def warm_known_ids(engine: AsyncEngine, chunk_rows: int = 10_000) -> int:
+    """Заполняет Bloom-фильтр всеми user_id и uuid из БД (потоково)"""
+    total = 0
+    async with engine.connect() as conn:
+        for column, member in ((User.user_id, user_member), (UserLinks.uuid, uuid_member)):
+            result = await conn.stream(
+                select(column).where(column.is_not(None)).execution_options(yield_per=chunk_rows)
+            )
+            async for rows in result.partitions():
+                known.add(*(member(value) for (value,) in rows))
+                total += len(rows)
+    return total
+
+
+async def known_ids_worker(engine: AsyncEngine):
+    """
+    Прогрев Bloom-фильтра при старте и после каждого переподключения
+    invalidation_listener (тот сбрасывает known.ready)
+    """
+    logger.info("🚀 known_ids_worker started")
+
+    while True:
+        if not known.ready:
+            try:
+                started = time.monotonic()
+                total = await warm_known_ids(engine)
+                known.ready = True
+                logger.info(f"🌸 Bloom filter warmed: {total} ids in {time.monotonic() - started:.1f}s")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Bloom filter warm-up failed: {e}")
+
+        await asyncio.sleep(KNOWN_REWARM_CHECK)
\ No newline at end of file
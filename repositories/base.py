@@ -1,11 +1,60 @@
-from typing import TypeVar, Generic
+from typing import TypeVar, Generic, Any, Iterable
 from sqlalchemy.orm import DeclarativeBase
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, update
+from sqlalchemy import select, update, insert, bindparam, Row, Select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 
 
 T = TypeVar('T', bound=DeclarativeBase)
 
+CHUNK_SIZE: int = 500
+
+
+def _chunks(items: list, size: int):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+# (модель, имена фильтров) -> готовый select с bindparam'ами
+_LOOKUP_CACHE: dict[tuple[type, tuple[str, ...]], Select] = {}
+
+
+def _lookup_stmt(model: type, keys: tuple[str, ...]) -> Select:
+    """
+    Собранный один раз select(model).where(col == :f_col ...)
+
+    Запрос не пересобирается на каждый вызов get_one, а одинаковый
+    объект даёт стабильный ключ в compiled cache SQLAlchemy и
+    в кеше prepared statements asyncpg.
+    """
+    cache_key = (model, keys)
+    stmt = _LOOKUP_CACHE.get(cache_key)
+    if stmt is None:
+        stmt = select(model).where(
+            *(getattr(model, k) == bindparam(f"f_{k}") for k in keys)
+        )
+        _LOOKUP_CACHE[cache_key] = stmt
+    return stmt
+
+
+# (модель, колонки, имена фильтров) -> Core select только нужных колонок
+_ROW_CACHE: dict[tuple[type, tuple[str, ...], tuple[str, ...]], Select] = {}
+
+
+def _row_stmt(model: type, columns: tuple[str, ...], keys: tuple[str, ...]) -> Select:
+    """Как _lookup_stmt, но по колонкам таблицы - без ORM-сущностей"""
+    cache_key = (model, columns, keys)
+    stmt = _ROW_CACHE.get(cache_key)
+    if stmt is None:
+        table = model.__table__  # type: ignore
+        stmt = select(*(table.c[c] for c in columns)).where(
+            *(table.c[k] == bindparam(f"f_{k}") for k in keys)
+        )
+        _ROW_CACHE[cache_key] = stmt
+    return stmt
+
+
 class BaseRepository(Generic[T]):
     def __init__(self, session: AsyncSession, model: type[T]):
         self.session = session
@@ -13,11 +62,19 @@ class BaseRepository(Generic[T]):
     
 
     async def get_one(self, **filters):
-        stmt = (
-            select(self.model)
-            .filter_by(**filters)
-        )
-        res = await self.session.execute(stmt)
+        if None in filters.values():
+            # IS NULL не ложится на bindparam - обычный путь
+            stmt = (
+                select(self.model)
+                .filter_by(**filters)
+            )
+            res = await self.session.execute(stmt)
+        else:
+            keys = tuple(sorted(filters))
+            stmt = _lookup_stmt(self.model, keys)
+            res = await self.session.execute(
+                stmt, {f"f_{k}": filters[k] for k in keys}
+            )
         await self.session.commit()
         return res.scalar_one_or_none()
     
@@ -38,4 +95,120 @@ class BaseRepository(Generic[T]):
         )
         res = await self.session.execute(stmt)
         await self.session.commit()
-        return res.rowcount #type: ignore
\ No newline at end of file
+        return res.rowcount #type: ignore
+
+
+    async def fetch_one(self, columns: tuple[str, ...], **filters) -> Row | None:
+        """
+        Лёгкое чтение одной строки: только нужные колонки через Core select
+
+        Без identity map, без состояния инстанса и без session.refresh.
+        Для read-only горячих путей (кеш, /sub). Фильтры - только равенство
+        с не-None значениями.
+        """
+        keys = tuple(sorted(filters))
+        stmt = _row_stmt(self.model, tuple(columns), keys)
+        res = await self.session.execute(
+            stmt, {f"f_{k}": filters[k] for k in keys}
+        )
+        row = res.first()
+        await self.session.commit()
+        return row
+
+
+    async def get_many(self, columns: Iterable[str] | None = None, **filters) -> list[Row]:
+        """
+        Выборка многих строк одним запросом на чанк
+
+        Фильтры как у get_one, плюс `поле__in=[...]`.
+        Список значений режется на чанки по CHUNK_SIZE.
+        Возвращает Row (кортежи с доступом по имени), без ORM-объектов.
+        """
+        table = self.model.__table__  # type: ignore
+        cols = [table.c[name] for name in columns] if columns else list(table.columns)
+
+        in_key: str | None = None
+        in_values: list = []
+        conditions = []
+
+        for key, value in filters.items():
+            if key.endswith("__in"):
+                if in_key is not None:
+                    raise ValueError("Only one '__in' filter is supported")
+                in_key = key[:-4]
+                in_values = list(dict.fromkeys(value))
+            else:
+                conditions.append(table.c[key] == value)
+
+        base = select(*cols).where(*conditions)
+
+        if in_key is None:
+            res = await self.session.execute(base)
+            rows = list(res.all())
+        else:
+            rows = []
+            for chunk in _chunks(in_values, CHUNK_SIZE):
+                res = await self.session.execute(base.where(table.c[in_key].in_(chunk)))
+                rows.extend(res.all())
+
+        await self.session.commit()
+        return rows
+
+
+    async def bulk_create(self, rows: list[dict[str, Any]]) -> int:
+        """Вставка пачки строк (executemany по чанкам). Возвращает число строк"""
+        if not rows:
+            return 0
+
+        table = self.model.__table__  # type: ignore
+        for chunk in _chunks(rows, CHUNK_SIZE):
+            await self.session.execute(insert(table), chunk)
+
+        await self.session.commit()
+        return len(rows)
+
+
+    async def bulk_upsert(
+        self,
+        rows: list[dict[str, Any]],
+        conflict_keys: list[str],
+        update_fields: list[str] | None = None
+    ) -> int:
+        """
+        INSERT ... ON CONFLICT по чанкам
+
+        Args:
+            rows: строки для вставки
+            conflict_keys: колонки уникального индекса
+            update_fields: что обновлять при конфликте
+                (None - все поля кроме conflict_keys, [] - DO NOTHING)
+
+        Returns:
+            Количество затронутых строк
+        """
+        if not rows:
+            return 0
+
+        table = self.model.__table__  # type: ignore
+        dialect = self.session.get_bind().dialect.name
+        insert_fn = pg_insert if dialect == "postgresql" else sqlite_insert
+
+        if update_fields is None:
+            update_fields = [k for k in rows[0] if k not in conflict_keys]
+
+        affected = 0
+        for chunk in _chunks(rows, CHUNK_SIZE):
+            stmt = insert_fn(table).values(chunk)
+            if update_fields:
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=conflict_keys,
+                    set_={k: stmt.excluded[k] for k in update_fields}
+                )
+            else:
+                stmt = stmt.on_conflict_do_nothing(index_elements=conflict_keys)
+
+            res = await self.session.execute(stmt)
+            affected += res.rowcount or 0 #type: ignore
+
+        await self.session.commit()
+        return affected
@@ -1,11 +1,12 @@
-from pydantic import BaseModel, ConfigDict
+from pydantic import AliasChoices, BaseModel, ConfigDict, Field
 from datetime import datetime
 
 class UserModel(BaseModel):
-    user_id: int
-    username: str | None = None
-    trial_used: bool
-    subscription_end: datetime | None = None
+    # Второе имя - короткий ключ компактного снимка USER_DATA (cache/snapshot.py)
+    user_id: int = Field(validation_alias=AliasChoices("user_id", "i"))
+    username: str | None = Field(None, validation_alias=AliasChoices("username", "n"))
+    trial_used: bool = Field(validation_alias=AliasChoices("trial_used", "t"))
+    subscription_end: datetime | None = Field(None, validation_alias=AliasChoices("subscription_end", "e"))
 
 
 class PayDataModel(BaseModel):
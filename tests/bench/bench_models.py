@@ -0,0 +1,52 @@
+"""
+Бенчмарк сериализации строки для кеша: старый Base.as_dict vs предвычисленный
+
+Запуск: python -m tests.bench.bench_models
+"""
+import json
+import time
+from datetime import datetime
+
+from sqlalchemy.inspection import inspect
+
+from db.models import User
+
+N = 100000
+
+
+def legacy_as_dict(obj) -> dict:
+    """Старая реализация: inspect() внутри цикла по колонкам"""
+    result = {}
+    for c in obj.__table__.columns:
+        state = inspect(obj)
+        if c.key in state.dict:
+            result[c.name] = state.dict[c.key]
+        else:
+            result[c.name] = getattr(obj, c.key, None)
+    return result
+
+
+def bench(name: str, fn, obj) -> float:
+    start = time.perf_counter()
+    for _ in range(N):
+        fn(obj)
+    per_call = (time.perf_counter() - start) / N * 1e6
+    print(f"{name:<28} {per_call:6.2f} us/call")
+    return per_call
+
+
+if __name__ == "__main__":
+    user = User(
+        id=1,
+        user_id=123456789,
+        username="bench_user",
+        trial_used=True,
+        subscription_end=datetime(2030, 1, 1)
+    )
+    assert legacy_as_dict(user) == user.as_dict()
+
+    old = bench("legacy as_dict", legacy_as_dict, user)
+    new = bench("as_dict", User.as_dict, user)
+    bench("legacy as_dict + json", lambda u: json.dumps(legacy_as_dict(u), default=str), user)
+    bench("as_json", User.as_json, user)
+    print(f"speedup as_dict: x{old / new:.1f}")
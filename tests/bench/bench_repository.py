@@ -0,0 +1,70 @@
+"""
+Микробенчмарк get_one: пересборка select на каждый вызов vs закешированный
+
+Запуск: python -m tests.bench.bench_repository
+"""
+import asyncio
+import time
+
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from db.models import Base, User
+from repositories.base import BaseRepository, _lookup_stmt
+
+N = 20000
+
+
+def bench_build() -> None:
+    """Только построение запроса + ключ compiled cache (то, что делает execute)"""
+    dialect = postgresql.asyncpg.dialect() # type: ignore
+
+    start = time.perf_counter()
+    for i in range(N):
+        stmt = select(User).filter_by(user_id=i)
+        stmt._generate_cache_key()
+    old = (time.perf_counter() - start) / N * 1e6
+
+    start = time.perf_counter()
+    for i in range(N):
+        stmt = _lookup_stmt(User, ("user_id",))
+        stmt._generate_cache_key()
+    new = (time.perf_counter() - start) / N * 1e6
+
+    stmt.compile(dialect=dialect)
+    print(f"build+cache key: filter_by {old:.1f} us/call | cached {new:.1f} us/call")
+
+
+async def bench_get_one() -> None:
+    """Полный get_one на sqlite in-memory"""
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    session_maker = async_sessionmaker(engine, expire_on_commit=False)
+    n = N // 10
+
+    async with session_maker() as session:
+        repo = BaseRepository(session=session, model=User)
+        await repo.bulk_create([{"user_id": i} for i in range(100)])
+
+        start = time.perf_counter()
+        for i in range(n):
+            res = await session.execute(select(User).filter_by(user_id=i % 100))
+            await session.commit()
+            res.scalar_one_or_none()
+        old = (time.perf_counter() - start) / n * 1e6
+
+        start = time.perf_counter()
+        for i in range(n):
+            await repo.get_one(user_id=i % 100)
+        new = (time.perf_counter() - start) / n * 1e6
+
+    await engine.dispose()
+    print(f"get_one end-to-end: filter_by {old:.1f} us/call | cached {new:.1f} us/call")
+
+
+if __name__ == "__main__":
+    bench_build()
+    asyncio.run(bench_get_one())
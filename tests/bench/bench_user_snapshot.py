@@ -0,0 +1,109 @@
+"""
+Бенчмарк снимка USER_DATA: старый JSON (json.loads + UserModel(**dict))
+vs компактный JSON + model_validate_json (и model_construct для сравнения)
+
+- разбор на пути попадания (us/call)
+- MEMORY USAGE ключа в Redis на пользователя (если Redis доступен)
+
+Запуск: python -m tests.bench.bench_user_snapshot
+"""
+import asyncio
+import json
+import time
+from datetime import datetime
+
+from redis.asyncio import Redis
+
+from cache.snapshot import decode_user, encode_user
+from schemas.schem import UserModel
+
+N = 100000
+USERS = 1000
+
+ROW = {
+    "user_id": 123456789,
+    "username": "bench_user",
+    "trial_used": True,
+    "subscription_end": datetime(2030, 1, 1, 12, 30),
+}
+
+
+def legacy_encode(row: dict) -> str:
+    return json.dumps(row, default=str)
+
+
+def legacy_decode(raw: str) -> UserModel:
+    return UserModel(**json.loads(raw))
+
+
+def construct_decode(raw: str) -> UserModel:
+    """Доверенный разбор без валидации - на pydantic 2 медленнее model_validate_json"""
+    data = json.loads(raw)
+    sub_end = data.get("e")
+    return UserModel.model_construct(
+        user_id=data["i"],
+        username=data.get("n"),
+        trial_used=data["t"],
+        subscription_end=datetime.fromisoformat(sub_end) if sub_end is not None else None,
+    )
+
+
+def bench(name: str, fn, arg) -> float:
+    start = time.perf_counter()
+    for _ in range(N):
+        fn(arg)
+    per_call = (time.perf_counter() - start) / N * 1e6
+    print(f"{name:<28} {per_call:6.2f} us/call")
+    return per_call
+
+
+async def bench_memory() -> None:
+    redis = Redis(host="localhost", port=6379, decode_responses=True)
+    try:
+        await redis.ping()
+    except Exception as e:
+        print(f"memory: skipped (no Redis: {e})")
+        await redis.aclose()
+        return
+
+    try:
+        for name, encode in (("old json", legacy_encode), ("compact", encode_user)):
+            keys = [f"BENCH:USER_DATA:{i}" for i in range(USERS)]
+            async with redis.pipeline(transaction=False) as pipe:
+                for i, key in enumerate(keys):
+                    pipe.set(key, encode({**ROW, "user_id": 10**9 + i}), ex=3600)
+                await pipe.execute()
+
+            try:
+                async with redis.pipeline(transaction=False) as pipe:
+                    for key in keys:
+                        pipe.memory_usage(key)
+                    usage = await pipe.execute()
+            except Exception as e:
+                usage = [None]
+                print(f"memory: MEMORY USAGE failed ({e})")
+            finally:
+                await redis.delete(*keys)
+
+            if any(u is None for u in usage):
+                print("memory: MEMORY USAGE not supported by this server")
+                return
+            print(f"memory {name:<20} {sum(usage) / USERS:6.1f} bytes/user")
+    finally:
+        await redis.aclose()
+
+
+if __name__ == "__main__":
+    old_raw, new_raw = legacy_encode(ROW), encode_user(ROW)
+    assert legacy_decode(old_raw) == decode_user(new_raw)
+    print(f"payload: old json {len(old_raw)} B | compact {len(new_raw)} B")
+
+    bench("old json encode", legacy_encode, ROW)
+    bench("compact encode", encode_user, ROW)
+    old = bench("json.loads + UserModel(**)", legacy_decode, old_raw)
+    new = bench("compact validate_json", decode_user, new_raw)
+    bench("compact model_construct", construct_decode, new_raw)
+    bench("old format via decode_user", decode_user, old_raw)
+    print(f"speedup hit path: x{old / new:.1f}")
+
+    asyncio.run(bench_memory())
@@ -3,10 +3,12 @@ from config import settings
 
 settings.BOT_TOKEN = TEST_BOT_TOKEN
 
+import os
+
 import pytest
 import pytest_asyncio
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
-from sqlalchemy.pool import StaticPool
+from sqlalchemy.pool import NullPool, StaticPool
 from redis.asyncio import Redis
 from db.models import Base, User, UserLinks
 from repositories.base import BaseRepository
@@ -50,6 +52,18 @@ async def redis_client():
     await client.aclose()
 
 
+@pytest.fixture(autouse=True)
+def clear_l1():
+    """L1 и Bloom-фильтр живут на уровне модуля - сбрасываем между тестами"""
+    from cache import known, l1
+
+    l1.clear()
+    known.ready = False
+    yield
+    l1.clear()
+    known.ready = False
+
+
 @pytest_asyncio.fixture(autouse=True)
 async def clear_redis(redis_client):
     """Очищаем Redis перед каждым тестом"""
@@ -57,22 +71,40 @@ async def clear_redis(redis_client):
     yield
 
 
+# TEST_DATABASE_URL=postgresql+asyncpg://... - те же тесты на PostgreSQL
+# (планы запросов, миграции); схема public пересоздаётся на каждый тест
+TEST_DATABASE_URL = os.environ.get("TEST_DATABASE_URL")
+
+
+async def _reset_public_schema(engine):
+    async with engine.begin() as conn:
+        await conn.exec_driver_sql("DROP SCHEMA public CASCADE")
+        await conn.exec_driver_sql("CREATE SCHEMA public")
+
+
 @pytest_asyncio.fixture(scope="function")
 async def test_engine():
     """Движок для тестовой БД - новый для каждого теста"""
-    engine = create_async_engine(
-        "sqlite+aiosqlite:///:memory:",
-        poolclass=StaticPool,
-        echo=False
-    )
+    if TEST_DATABASE_URL:
+        engine = create_async_engine(TEST_DATABASE_URL, poolclass=NullPool)
+        await _reset_public_schema(engine)
+    else:
+        engine = create_async_engine(
+            "sqlite+aiosqlite:///:memory:",
+            poolclass=StaticPool,
+            echo=False
+        )
     
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
     
     yield engine
     
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.drop_all)
+    if TEST_DATABASE_URL:
+        await _reset_public_schema(engine)
+    else:
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.drop_all)
         
     await engine.dispose()
 
@@ -87,6 +119,15 @@ async def test_session_maker(test_engine):
     )
 
 
+@pytest_asyncio.fixture(autouse=True)
+async def own_session_maker(test_session_maker, monkeypatch):
+    """Задачи, открывающие свою сессию (is_cached, фоновые обновления), - в тестовую БД"""
+    import misc.utils as utils_module
+
+    monkeypatch.setattr(utils_module, "async_session_maker", test_session_maker)
+    yield
+
+
 @pytest_asyncio.fixture
 async def test_session(test_session_maker):
     """Одна сессия для теста"""
@@ -0,0 +1,87 @@
+import asyncio
+import json
+import os
+
+import pytest
+from sqlalchemy import text
+
+import misc.cache_notify as cache_notify
+from db.migrations import run_migrations
+from misc.cache_notify import cache_notify_listener, purge_deleted
+
+postgres_only = pytest.mark.skipif(
+    not os.environ.get("TEST_DATABASE_URL"),
+    reason="PostgreSQL only (TEST_DATABASE_URL)"
+)
+
+
+@pytest.mark.asyncio
+async def test_purge_deleted_drops_keys_of_missing_rows(redis_client, test_session_maker, create_user, create_user_in_links):
+    """Тест: полный проход убирает ключи удалённых строк (DELETE не оставляет updated_at)"""
+    await create_user(user_id=4800, username="kept")
+    await create_user_in_links(user_id=4800, uuid="uuid-4800")
+    await redis_client.set("USER_DATA:4800", json.dumps({"user_id": 4800}))
+    await redis_client.set("USER_UUID:4800", "uuid-4800")
+    await redis_client.set("USER_DATA:4801", json.dumps({"user_id": 4801}))
+    await redis_client.set("USER_UUID:4801", "uuid-4801")
+    await redis_client.set("USER_UUID:not-an-id", "x")
+
+    assert await purge_deleted(redis_client, test_session_maker, batch=1) == 2
+
+    assert await redis_client.exists("USER_DATA:4800", "USER_UUID:4800", "USER_UUID:not-an-id") == 3
+    assert await redis_client.exists("USER_DATA:4801", "USER_UUID:4801") == 0
+
+
+async def _listener_pid(engine) -> int | None:
+    async with engine.connect() as conn:
+        return await conn.scalar(text(
+            "SELECT pid FROM pg_stat_activity WHERE query LIKE 'LISTEN%' AND pid <> pg_backend_pid()"
+        ))
+
+
+async def _wait_for(check, timeout: float = 5.0):
+    for _ in range(int(timeout / 0.05)):
+        value = await check()
+        if value:
+            return value
+        await asyncio.sleep(0.05)
+    raise AssertionError("condition not met")
+
+
+@postgres_only
+@pytest.mark.asyncio
+async def test_listener_purges_on_connect_and_survives_killed_backend(
+    test_engine, test_session_maker, redis_client, monkeypatch
+):
+    """Тест: при подключении дочищает удалённых, после обрыва соединения переподключается"""
+    monkeypatch.setattr(cache_notify, "NOTIFY_IDLE_CHECK", 0.2)
+    monkeypatch.setattr(cache_notify, "NOTIFY_RECONNECT_DELAY", 0.1)
+    await run_migrations(test_engine)
+    await redis_client.set("USER_DATA:4901", json.dumps({"user_id": 4901}))  # удалён, пока не слушали
+
+    task = asyncio.create_task(cache_notify_listener(redis_client, test_engine, test_session_maker))
+    try:
+        first = await _wait_for(lambda: _listener_pid(test_engine))
+        await _wait_for(lambda: _is_gone(redis_client, "USER_DATA:4901"))
+
+        async with test_engine.connect() as conn:
+            await conn.execute(text("SELECT pg_terminate_backend(:pid)"), {"pid": first})
+
+        second = await _wait_for(lambda: _listener_pid(test_engine))
+        assert second != first
+
+        async with test_engine.begin() as conn:
+            await conn.execute(text("INSERT INTO users (user_id, username, trial_used) VALUES (4900, 'after', false)"))
+
+        raw = await _wait_for(lambda: redis_client.get("USER_DATA:4900"))
+        assert "after" in raw
+    finally:
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    assert await redis_client.get("LEADER:cache_notify") is None
+
+
+async def _is_gone(redis_client, key: str) -> bool:
+    return not await redis_client.exists(key)
@@ -0,0 +1,92 @@
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import insert, select, text, update
+
+import db.database as database
+from db.database import RoutingSession, use_primary
+from db.models import User
+
+
+PRIMARY = SimpleNamespace(sync_engine="primary")
+REPLICA = SimpleNamespace(sync_engine="replica")
+
+
+@pytest.fixture
+def routing(monkeypatch):
+    """RoutingSession с заглушками primary/реплики вместо настоящих движков"""
+    monkeypatch.setattr(database, "engine", PRIMARY)
+    monkeypatch.setattr(database, "replica_engine", REPLICA)
+    return RoutingSession()
+
+
+def test_select_goes_to_replica(routing):
+    assert routing.get_bind(clause=select(User)) == "replica"
+
+
+def test_dml_and_for_update_go_to_primary(routing):
+    assert routing.get_bind(clause=select(User).with_for_update()) == "primary"
+    assert routing.get_bind(clause=update(User).values(username="x")) == "primary"
+    assert routing.get_bind(clause=insert(User)) == "primary"
+
+
+def test_session_sticks_to_primary_after_write(routing):
+    assert routing.get_bind(clause=select(User)) == "replica"
+
+    routing.get_bind(clause=update(User).values(username="x"))
+
+    assert routing.info["wrote"] is True
+    assert routing.get_bind(clause=select(User)) == "primary"
+
+
+def test_text_and_bare_get_bind_do_not_pin_primary(routing):
+    assert routing.get_bind() == "primary"
+    assert routing.get_bind(clause=text("SELECT 1")) == "primary"
+
+    assert "wrote" not in routing.info
+    assert routing.get_bind(clause=select(User)) == "replica"
+
+
+def test_commit_and_rollback_unpin_primary(routing):
+    for finish in (routing.commit, routing.rollback):
+        routing.begin()
+        routing.get_bind(clause=update(User).values(username="x"))
+        assert routing.get_bind(clause=select(User)) == "primary"
+
+        finish()
+
+        assert routing.get_bind(clause=select(User)) == "replica"
+
+
+def test_use_primary_forces_reads_to_primary(routing):
+    with use_primary():
+        assert routing.get_bind(clause=select(User)) == "primary"
+
+    assert routing.get_bind(clause=select(User)) == "replica"
+    assert "wrote" not in routing.info
+
+
+def test_without_replica_everything_goes_to_primary(routing, monkeypatch):
+    monkeypatch.setattr(database, "replica_engine", None)
+
+    assert routing.get_bind(clause=select(User)) == "primary"
+
+
+@pytest.mark.asyncio
+async def test_is_cached_miss_reads_primary(redis_client, test_session_maker, create_user, monkeypatch):
+    """Тест: промах is_cached (его «нет в БД» кешируется надгробием) читает primary"""
+    import misc.utils as utils_module
+    from misc.utils import is_cached
+
+    await create_user(user_id=4300, username="routed")
+    forced = []
+
+    def session_maker():
+        forced.append(database._force_primary.get())
+        return test_session_maker()
+
+    monkeypatch.setattr(utils_module, "async_session_maker", session_maker)
+
+    user = await is_cached(redis_cache=redis_client, user_id=4300, session=None) # type: ignore
+    assert user is not None and user.username == "routed"
+    assert forced == [True]
@@ -0,0 +1,38 @@
+import csv
+import pytest
+from datetime import datetime, timedelta
+from db.export import export_table
+from db.models import PaymentData, User
+from repositories.base import BaseRepository
+
+
+@pytest.mark.asyncio
+async def test_export_streams_in_chunks_with_watermark(test_engine, test_session, tmp_path):
+    """Тест: выгрузка идёт пачками, --since отбирает только новые строки"""
+    base = datetime(2030, 1, 1)
+    await BaseRepository(session=test_session, model=User).bulk_create([
+        {"user_id": 1, "username": "payer"}
+    ])
+    await BaseRepository(session=test_session, model=PaymentData).bulk_create([
+        {"payment_id": f"pay-{i}", "user_id": 1, "amount": 50, "created_at": base + timedelta(days=i)}
+        for i in range(7)
+    ])
+
+    path, total, watermark = await export_table(test_engine, "payment_data", out_dir=str(tmp_path), chunk_rows=3)
+    with open(path, newline="", encoding="utf-8") as fh:
+        rows = list(csv.DictReader(fh))
+
+    assert total == 7
+    assert [r["payment_id"] for r in rows] == [f"pay-{i}" for i in range(7)]
+    assert watermark == base + timedelta(days=6)
+
+    _, total, _ = await export_table(
+        test_engine, "payment_data", out_dir=str(tmp_path), since=base + timedelta(days=4), chunk_rows=3
+    )
+    assert total == 2
+
+    # users/links - по updated_at
+    _, total, watermark = await export_table(test_engine, "users", out_dir=str(tmp_path), since=datetime(2000, 1, 1))
+    assert total == 1 and watermark is not None
+    _, total, _ = await export_table(test_engine, "users", out_dir=str(tmp_path), since=watermark)
+    assert total == 0
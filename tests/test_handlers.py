@@ -8,6 +8,7 @@ from datetime import datetime, timedelta
 from config import settings
 from redis.asyncio import Redis
 import asyncio, json
+from contextlib import suppress
 from misc.utils import pub_listner
 from core.yoomoney.payment import YooPay
 
@@ -107,16 +108,18 @@ async def test_start_command_says_hello(message, test_session: AsyncSession, red
     await start_command(message=msg, session=test_session, redis_cache=redis_client)
     msg.answer.assert_called_once()
 
-    repo = BaseRepository(session=test_session, model=User)
-    res = await repo.get_one(user_id=msg.from_user.id)
+    # Регистрация write-behind: снимок в кеше, вставка в БД - в очереди
+    cached = await redis_client.get(f"USER_DATA:{msg.from_user.id}")
+    queued = await redis_client.lrange("USER_REGISTER", 0, -1)
     
     # Проверяем только текст (игнорируем reply_markup)
     call_kwargs = msg.answer.call_args.kwargs
     assert call_kwargs['text'] == 'Привет!'
     assert 'Привет' in call_kwargs['text']
 
-    assert res is not None
-    assert res.user_id == msg.from_user.id
+    assert cached is not None
+    assert len(queued) == 1
+    assert json.loads(queued[0])['user_id'] == msg.from_user.id
 
 
 @pytest.mark.asyncio
@@ -335,4 +338,71 @@ async def test_if_payments_creates_link(callback_query, test_session: AsyncSessi
         assert len(buttons) == 2
 
         assert buttons_texts_should[0] in button_texts
-        assert buttons_texts_should[1] in button_texts
\ No newline at end of file
+        assert buttons_texts_should[1] in button_texts
+
+@pytest.mark.asyncio
+async def test_start_registration_write_behind(message, test_session_maker, redis_client):
+    """Тест: /start отвечает из кеша, а registration_worker вставляет пользователя пачкой"""
+    from handlers.start import start_command
+    from misc.utils import registration_worker
+
+    async with test_session_maker() as session:
+        for user_id in (501, 502, 501):
+            msg = message(user_id=user_id, username=f"user_{user_id}")
+            await start_command(message=msg, session=session, redis_cache=redis_client)
+            msg.answer.assert_called_once()
+
+    worker = asyncio.create_task(
+        registration_worker(redis_cli=redis_client, session_maker=test_session_maker, timeout=1)
+    )
+    await asyncio.sleep(0.5)
+    worker.cancel()
+    with suppress(asyncio.CancelledError):
+        await worker
+
+    async with test_session_maker() as session:
+        repo = BaseRepository(session=session, model=User)
+        rows = await repo.get_many(user_id__in=[501, 502])
+
+    assert sorted(r.user_id for r in rows) == [501, 502]
+    assert await redis_client.llen("USER_REGISTER") == 0 #type: ignore
+
+
+@pytest.mark.asyncio
+async def test_user_data_loader_single_query_and_memo(
+    test_session: AsyncSession,
+    create_user,
+    create_user_in_links,
+    redis_client
+):
+    """Тест: промахи loader'а идут через is_cached/get_uuid_cache, результат запоминается"""
+    from handlers.deps import UserDataLoader
+    from misc.utils import USER_UUID_TTL
+    from sqlalchemy import event
+
+    user_id = 777
+    await create_user(user_id=user_id, username="loader", subscription_end=datetime.now() + timedelta(days=3))
+    await create_user_in_links(user_id=user_id, uuid="loader-uuid", panel1="p1")
+
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+    sync_engine = test_session.bind.sync_engine #type: ignore
+    event.listen(sync_engine, "before_cursor_execute", listener)
+    try:
+        loader = UserDataLoader(redis_cache=redis_client, user_id=user_id, session=test_session)
+        user, uuid = await asyncio.gather(loader.user(), loader.uuid())
+        assert await loader.user() is user
+    finally:
+        event.remove(sync_engine, "before_cursor_execute", listener)
+
+    assert user is not None and user.username == "loader"
+    assert uuid == "loader-uuid"
+    # По запросу на ключ, каждый под своей арендой; записаны с TTL
+    assert len(statements) == 2
+    assert 0 < await redis_client.ttl(f"USER_DATA:{user_id}")
+    assert 0 < await redis_client.ttl(f"USER_UUID:{user_id}") <= USER_UUID_TTL
+
+    # Второй апдейт - всё из кеша
+    cached = UserDataLoader(redis_cache=redis_client, user_id=user_id, session=None)
+    assert (await cached.user()).user_id == user_id #type: ignore
+    assert await cached.uuid() == "loader-uuid"
@@ -80,6 +80,10 @@ async def test_full_trial_activation_flow(
             await task1
         except asyncio.CancelledError:
             pass
+
+        # Задачи воркера лежат в outbox - переносим их в Redis
+        from misc.outbox import relay_batch
+        await relay_batch(redis_client, test_session)
         
         # 3. Проверяем что задача попала в MARZBAN очередь
         marzban_queue_size = await redis_client.llen("MARZBAN") #type: ignore
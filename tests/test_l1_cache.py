@@ -0,0 +1,197 @@
+import asyncio
+from contextlib import suppress
+
+import pytest
+from cache import MISSING, L1Cache, invalidation_listener, l1, publish_invalidation
+from misc.utils import is_cached
+
+
+def test_l1_evicts_lru_and_expires(monkeypatch):
+    """Тест: L1 вытесняет самый старый ключ и забывает просроченные"""
+    import cache.memory as memory_module
+
+    now = [100.0]
+    monkeypatch.setattr(memory_module.time, "monotonic", lambda: now[0])
+
+    cache = L1Cache(maxsize=2, ttl=10)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1  # a стал свежее b
+    cache.set("c", 3)
+
+    assert cache.get("b") is MISSING
+    assert cache.get("a") == 1
+
+    now[0] += 11
+    assert cache.get("a") is MISSING
+    assert len(cache) == 1
+
+
+@pytest.mark.asyncio
+async def test_is_cached_served_from_l1_until_invalidated(redis_client, test_session):
+    """Тест: повторное чтение идёт из L1, сообщение инвалидации его сбрасывает"""
+    user_key = "USER_DATA:555"
+    await redis_client.set(user_key, '{"user_id": 555, "username": "l1", "trial_used": false}')
+
+    listener = asyncio.create_task(invalidation_listener(redis_client))
+    await asyncio.sleep(0.1)
+    try:
+        first = await is_cached(redis_cache=redis_client, user_id=555, session=test_session)
+        assert first is not None
+
+        # Redis поменялся без инвалидации - L1 ещё отдаёт старое
+        await redis_client.set(user_key, '{"user_id": 555, "username": "new", "trial_used": true}')
+        assert await is_cached(redis_cache=redis_client, user_id=555, session=test_session) is first
+
+        # Инвалидация из «другого процесса» - сразу в канал, минуя локальный delete
+        await redis_client.publish("CACHE_INVALIDATE", '{"op": "del", "keys": ["USER_DATA:555"]}')
+        for _ in range(20):
+            if l1.get(user_key) is MISSING:
+                break
+            await asyncio.sleep(0.05)
+
+        fresh = await is_cached(redis_cache=redis_client, user_id=555, session=test_session)
+        assert fresh is not None and fresh.username == "new"
+
+        await publish_invalidation(redis_client, user_key)
+        assert l1.get(user_key) is MISSING
+    finally:
+        listener.cancel()
+        with suppress(asyncio.CancelledError):
+            await listener
+
+
+@pytest.mark.asyncio
+async def test_singleflight_coalesces_concurrent_misses(redis_client, test_session, create_user):
+    """Тест: одновременные промахи в процессе дают один запрос в БД"""
+    from sqlalchemy import event
+
+    await create_user(user_id=556, username="flight")
+
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+    sync_engine = test_session.bind.sync_engine
+    event.listen(sync_engine, "before_cursor_execute", listener)
+    try:
+        users = await asyncio.gather(*(
+            is_cached(redis_cache=redis_client, user_id=556, session=test_session)
+            for _ in range(20)
+        ))
+    finally:
+        event.remove(sync_engine, "before_cursor_execute", listener)
+
+    assert all(u is not None and u.username == "flight" for u in users)
+    assert len(statements) == 1
+
+
+@pytest.mark.asyncio
+async def test_singleflight_survives_cancelled_leader(redis_client, test_session, create_user):
+    """Тест: отмена апдейта-лидера не ломает загрузку - у задачи своя сессия"""
+    await create_user(user_id=557, username="leader")
+
+    leader = asyncio.create_task(is_cached(redis_cache=redis_client, user_id=557, session=test_session))
+    await asyncio.sleep(0)
+    follower = asyncio.create_task(is_cached(redis_cache=redis_client, user_id=557, session=None)) # type: ignore
+
+    leader.cancel()
+    await test_session.close()
+
+    user = await follower
+    assert user is not None and user.username == "leader"
+
+
+@pytest.mark.asyncio
+async def test_wait_for_key_wakes_on_filled_message(redis_client):
+    """Тест: ожидающий просыпается по "filled" из канала, а не по таймеру"""
+    from cache import wait_for_key
+
+    listener = asyncio.create_task(invalidation_listener(redis_client))
+    await asyncio.sleep(0.1)
+    try:
+        waiter = asyncio.create_task(wait_for_key(redis_client, "POP_PAY_CHOOSE:7", timeout=5))
+        await asyncio.sleep(0.05)
+
+        # «Другой процесс»: записал ключ и опубликовал filled
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        await redis_client.set("POP_PAY_CHOOSE:7", '{"payment_url": "u"}')
+        await redis_client.publish("CACHE_INVALIDATE", '{"op": "filled", "keys": ["POP_PAY_CHOOSE:7"]}')
+
+        assert await waiter == '{"payment_url": "u"}'
+        assert loop.time() - started < 0.5  # раньше FILL_RECHECK
+    finally:
+        listener.cancel()
+        with suppress(asyncio.CancelledError):
+            await listener
+
+
+@pytest.mark.asyncio
+async def test_get_or_lease_and_store_and_release(redis_client):
+    """Тест: одна аренда на ключ, запись снимает её, чужой токен аренду не снимает"""
+    from cache import get_or_lease, lease_key, release_lease, store_and_release
+
+    value, token = await get_or_lease(redis_client, "USER_UUID:9")
+    assert value is None and token is not None
+
+    # Второй претендент ждёт, а не идёт в БД
+    assert await get_or_lease(redis_client, "USER_UUID:9") == (None, None)
+
+    await release_lease(redis_client, "USER_UUID:9", "not-mine")
+    assert await redis_client.get(lease_key("USER_UUID:9")) == token
+
+    await store_and_release(redis_client, "USER_UUID:9", "abc", ttl=60, token=token)
+    assert await redis_client.get(lease_key("USER_UUID:9")) is None
+    assert 0 < await redis_client.ttl("USER_UUID:9") <= 60
+    assert await get_or_lease(redis_client, "USER_UUID:9") == ("abc", None)
+
+    # refresh игнорирует текущее значение и берёт аренду
+    value, token = await get_or_lease(redis_client, "USER_UUID:9", refresh=True)
+    assert value is None and token is not None
+    await release_lease(redis_client, "USER_UUID:9", token)
+    assert await redis_client.get(lease_key("USER_UUID:9")) is None
+
+
+def test_user_snapshot_roundtrip_and_legacy():
+    """Тест: компактный снимок короче старого и читается так же, как старый JSON"""
+    import json
+    from datetime import datetime
+
+    from cache import decode_user, encode_user
+
+    row = {"user_id": 42, "username": "snap", "trial_used": True, "subscription_end": datetime(2030, 1, 1, 12, 30)}
+    legacy = json.dumps(row, default=str)
+    compact = encode_user(row)
+
+    assert len(compact) < len(legacy)
+    assert decode_user(compact) == decode_user(legacy)
+    assert decode_user(compact).subscription_end == row["subscription_end"]
+
+    # None-поля не пишутся, но возвращаются по умолчанию
+    minimal = encode_user({"user_id": 43, "username": None, "trial_used": False, "subscription_end": None})
+    assert minimal == '{"i":43,"t":false}'
+    assert decode_user(minimal).username is None
+
+
+@pytest.mark.asyncio
+async def test_stale_user_served_and_revalidated_in_background(redis_client, test_session, create_user):
+    """Тест: после мягкого срока отдаётся старый снимок, свежий догружается в фоне"""
+    from cache import encode_user, hard_ttl, is_stale
+
+    await create_user(user_id=560, username="fresh")
+
+    stale = encode_user({"user_id": 560, "username": "stale", "trial_used": False}, soft_ttl=-10)
+    assert is_stale(stale)
+    await redis_client.set("USER_DATA:560", stale, ex=hard_ttl(3600))
+
+    user = await is_cached(redis_cache=redis_client, user_id=560, session=test_session)
+    assert user is not None and user.username == "stale"
+
+    for _ in range(40):
+        raw = await redis_client.get("USER_DATA:560")
+        if not is_stale(raw):
+            break
+        await asyncio.sleep(0.05)
+
+    assert '"fresh"' in raw
+    user = await is_cached(redis_cache=redis_client, user_id=560, session=test_session)
+    assert user.username == "fresh"  # фоновое обновление заменило и L1
@@ -0,0 +1,30 @@
+import pytest
+
+from misc.leader import hold_leadership, leader_key, resign_leadership
+
+
+@pytest.mark.asyncio
+async def test_single_leader_renews_and_resigns(redis_client):
+    """Тест: лидер один, продлевает себя, после отставки ключ берёт другой"""
+    assert await hold_leadership(redis_client, "job", ttl=30, token="a")
+    assert not await hold_leadership(redis_client, "job", ttl=30, token="b")
+
+    await redis_client.expire(leader_key("job"), 5)
+    assert await hold_leadership(redis_client, "job", ttl=30, token="a")
+    assert 5 < await redis_client.ttl(leader_key("job")) <= 30
+
+    await resign_leadership(redis_client, "job", token="b")  # чужая отставка - no-op
+    assert await redis_client.get(leader_key("job")) == "a"
+
+    await resign_leadership(redis_client, "job", token="a")
+    assert await hold_leadership(redis_client, "job", ttl=30, token="b")
+
+
+@pytest.mark.asyncio
+async def test_expired_leader_is_replaced(redis_client):
+    """Тест: упавший лидер не продлевает ключ - по TTL задачу подхватывает следующий"""
+    assert await hold_leadership(redis_client, "job", ttl=30, token="a")
+    await redis_client.delete(leader_key("job"))  # как истечение TTL
+
+    assert await hold_leadership(redis_client, "job", ttl=30, token="b")
+    assert not await hold_leadership(redis_client, "job", ttl=30, token="a")
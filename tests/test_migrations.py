@@ -0,0 +1,51 @@
+"""
+Версионные миграции на PostgreSQL (TEST_DATABASE_URL), на sqlite пропускаются
+"""
+import os
+
+import pytest
+from sqlalchemy import text
+
+from db.migrations import load_migrations, run_migrations
+
+pytestmark = pytest.mark.skipif(
+    not os.environ.get("TEST_DATABASE_URL"),
+    reason="PostgreSQL only (TEST_DATABASE_URL)"
+)
+
+
+@pytest.mark.asyncio
+async def test_migrations_apply_once(test_engine):
+    versions = [m.VERSION for m in load_migrations()]
+
+    assert await run_migrations(test_engine) == versions
+    assert await run_migrations(test_engine) == []
+
+    async with test_engine.connect() as conn:
+        partitioned = await conn.scalar(text(
+            "SELECT count(*) FROM pg_partitioned_table p "
+            "JOIN pg_class c ON c.oid = p.partrelid WHERE c.relname = 'payment_data'"
+        ))
+        triggers = set(await conn.scalars(text(
+            "SELECT tgname FROM pg_trigger WHERE NOT tgisinternal"
+        )))
+
+    assert partitioned == 1
+    assert {"users_set_updated_at", "links_set_updated_at", "users_notify_cache", "links_notify_cache"} <= triggers
+
+
+@pytest.mark.asyncio
+async def test_hot_path_migration_stops_on_duplicate_links(test_engine):
+    """Тест: дубли в links (до m0001 уникальности не было) - понятная ошибка, а не сломанный индекс"""
+    async with test_engine.begin() as conn:
+        await conn.execute(text("DROP INDEX ix_links_uuid"))
+        await conn.execute(text("DROP INDEX ix_links_user_id"))
+        await conn.execute(text("INSERT INTO users (user_id, trial_used) VALUES (1, false), (2, false)"))
+        await conn.execute(text("INSERT INTO links (user_id, uuid) VALUES (1, 'dup'), (2, 'dup')"))
+
+    with pytest.raises(Exception, match="links has duplicate rows.*uuid=\\[dup \\(x2\\)\\]"):
+        await run_migrations(test_engine)
+
+    async with test_engine.connect() as conn:
+        applied = list(await conn.scalars(text("SELECT version FROM schema_version")))
+    assert applied == []
@@ -0,0 +1,93 @@
+import pytest
+from sqlalchemy import event
+
+from cache import BloomFilter, known, negative_key, user_member, uuid_member
+from misc.utils import UserLookupError, find_user, get_links_of_panels, is_cached, register_user
+
+
+def test_bloom_filter_has_no_false_negatives():
+    """Тест: добавленное всегда «может быть», до прогрева - всё «может быть»"""
+    bloom = BloomFilter(capacity=1000, error_rate=0.01)
+    members = [user_member(i) for i in range(1000)]
+    bloom.add(*members)
+
+    assert bloom.might_contain("user:unknown")  # не прогрет
+    bloom.ready = True
+    assert all(bloom.might_contain(m) for m in members)
+
+    false_positives = sum(bloom.might_contain(user_member(i)) for i in range(10_000, 20_000))
+    assert false_positives < 300
+
+    bloom.invalidate()
+    assert bloom.might_contain("user:unknown")
+
+
+@pytest.mark.asyncio
+async def test_unknown_user_tombstone_skips_db(redis_client, test_session):
+    """Тест: промах по БД оставляет надгробие, повторный запрос в БД не идёт"""
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+    sync_engine = test_session.bind.sync_engine
+    event.listen(sync_engine, "before_cursor_execute", listener)
+    try:
+        assert await is_cached(redis_cache=redis_client, user_id=777, session=test_session) is None
+        assert await is_cached(redis_cache=redis_client, user_id=777, session=test_session) is None
+    finally:
+        event.remove(sync_engine, "before_cursor_execute", listener)
+
+    assert len(statements) == 1
+    assert 0 < await redis_client.ttl(negative_key("USER_DATA:777")) <= 60
+
+    # /start регистрирует пользователя - надгробие снимается
+    await register_user(redis_client, user_id=777, username="late")
+    assert await redis_client.get(negative_key("USER_DATA:777")) is None
+    user = await is_cached(redis_cache=redis_client, user_id=777, session=test_session)
+    assert user is not None and user.username == "late"
+
+
+@pytest.mark.asyncio
+async def test_bloom_short_circuits_before_io(redis_client, test_session, create_user):
+    """Тест: прогретый фильтр отвечает про неизвестных без Redis и БД"""
+    await create_user(user_id=778, username="known")
+    known.add(user_member(778))
+    known.ready = True
+
+    assert await is_cached(redis_cache=redis_client, user_id=779, session=test_session) is None
+    assert await redis_client.keys("*") == []
+    assert await get_links_of_panels(uuid="not-a-real-uuid", redis_cli=redis_client) is None
+
+    user = await is_cached(redis_cache=redis_client, user_id=778, session=test_session)
+    assert user is not None and user.username == "known"
+
+
+@pytest.mark.asyncio
+async def test_find_user_rechecks_tombstone_and_bloom(redis_client, test_session, create_user):
+    """Тест: find_user (/start) не верит блуму и надгробию - «нет» только от БД"""
+    known.ready = True  # прогретый фильтр, 780 в нём нет
+    assert await is_cached(redis_cache=redis_client, user_id=780, session=test_session) is None
+    assert await find_user(redis_client, user_id=780) is None
+    assert await redis_client.exists(negative_key("USER_DATA:780"))
+
+    # Строку вставили мимо db_worker: надгробие и блум устарели
+    await create_user(user_id=780, username="inserted")
+
+    assert await is_cached(redis_cache=redis_client, user_id=780, session=test_session) is None
+    user = await find_user(redis_client, user_id=780)
+    assert user is not None and user.username == "inserted"
+
+
+@pytest.mark.asyncio
+async def test_find_user_db_error_is_not_a_miss(redis_client, test_session, monkeypatch):
+    """Тест: ошибка БД - UserLookupError, а не «не найден»: /start не регистрирует заново"""
+    from repositories.base import BaseRepository
+
+    async def broken(*args, **kwargs):
+        raise RuntimeError("connection reset")
+
+    monkeypatch.setattr(BaseRepository, "fetch_one", broken)
+
+    with pytest.raises(UserLookupError):
+        await find_user(redis_client, user_id=781)
+    assert await is_cached(redis_cache=redis_client, user_id=781, session=test_session) is None
+    # Ни надгробия, ни висящей аренды
+    assert await redis_client.keys("*") == []
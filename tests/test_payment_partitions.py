@@ -0,0 +1,94 @@
+import gzip
+import os
+import pytest
+from datetime import datetime, timedelta
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+from db.models import PaymentData, User
+import misc.payment_partitions as payment_partitions
+from db.migrations import run_migrations
+from misc.payment_partitions import PAYMENT_DEDUPE_WINDOW, _month_start, archive_payment_partitions, payment_exists
+from repositories.base import BaseRepository
+
+
+def test_month_start_shifts_across_years():
+    """Тест: границы секций считаются по календарным месяцам"""
+    assert _month_start(datetime(2030, 1, 15), -1) == datetime(2029, 12, 1)
+    assert _month_start(datetime(2030, 11, 30), 2) == datetime(2031, 1, 1)
+
+
+@pytest.mark.asyncio
+async def test_payment_dedupe_only_looks_at_recent_window(test_session: AsyncSession):
+    """Тест: дубликат ищется только среди платежей окна дедупликации"""
+    await BaseRepository(session=test_session, model=User).bulk_create([{"user_id": 1, "username": "payer"}])
+    await BaseRepository(session=test_session, model=PaymentData).bulk_create([
+        {"payment_id": "recent", "user_id": 1, "amount": 50, "created_at": datetime.now()},
+        {
+            "payment_id": "archived",
+            "user_id": 1,
+            "amount": 50,
+            "created_at": datetime.now() - PAYMENT_DEDUPE_WINDOW - timedelta(days=1),
+        },
+    ])
+
+    assert await payment_exists(test_session, payment_id="recent")
+    assert not await payment_exists(test_session, payment_id="archived")
+    assert not await payment_exists(test_session, payment_id="missing")
+
+
+postgres_only = pytest.mark.skipif(
+    not os.environ.get("TEST_DATABASE_URL"),
+    reason="PostgreSQL only (TEST_DATABASE_URL)"
+)
+
+
+async def _old_partition(engine) -> str:
+    """Секция январь 2020 с двумя платежами"""
+    await run_migrations(engine)
+    async with engine.begin() as conn:
+        await conn.execute(text("INSERT INTO users (user_id, trial_used) VALUES (1, false)"))
+        name = await conn.scalar(text("SELECT payment_data_ensure_partition('2020-01-01')"))
+        await conn.execute(text(
+            "INSERT INTO payment_data (payment_id, user_id, amount, created_at) "
+            "VALUES ('old-1', 1, 50, '2020-01-05'), ('old-2', 1, 100, '2020-01-06')"
+        ))
+    return name
+
+
+async def _partition_exists(engine, name: str) -> bool:
+    async with engine.connect() as conn:
+        return await conn.scalar(text("SELECT to_regclass(:name) IS NOT NULL"), {"name": name})
+
+
+@postgres_only
+@pytest.mark.asyncio
+async def test_archive_writes_file_then_drops_partition(test_engine, tmp_path):
+    """Тест: секция удаляется только после записанного архива со всеми строками"""
+    name = await _old_partition(test_engine)
+
+    assert await archive_payment_partitions(test_engine, retention_months=1, archive_dir=str(tmp_path)) == [name]
+
+    with gzip.open(tmp_path / f"{name}.csv.gz", "rt") as fh:
+        lines = fh.read().splitlines()
+    assert len(lines) == 3  # заголовок + 2 платежа
+    assert not await _partition_exists(test_engine, name)
+    assert list(tmp_path.iterdir()) == [tmp_path / f"{name}.csv.gz"]
+
+
+@postgres_only
+@pytest.mark.asyncio
+async def test_archive_keeps_partition_when_file_fails(test_engine, tmp_path, monkeypatch):
+    """Тест: не удалось положить архив - секция и её строки на месте, tmp убран"""
+    name = await _old_partition(test_engine)
+
+    def broken_replace(src, dst):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(payment_partitions.os, "replace", broken_replace)
+
+    assert await archive_payment_partitions(test_engine, retention_months=1, archive_dir=str(tmp_path)) == []
+
+    assert await _partition_exists(test_engine, name)
+    async with test_engine.connect() as conn:
+        assert await conn.scalar(text("SELECT count(*) FROM payment_data WHERE created_at < '2020-02-01'")) == 2
+    assert list(tmp_path.iterdir()) == []
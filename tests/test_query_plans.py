@@ -0,0 +1,95 @@
+"""
+EXPLAIN горячих запросов на засеянной БД
+
+Падает, если запрос идёт полным сканом таблицы вместо индекса.
+Работает и на тестовом sqlite (EXPLAIN QUERY PLAN), и на PostgreSQL
+(TEST_DATABASE_URL, схема после миграций). Планировщик не подталкиваем
+(enable_seqscan не трогаем): строк засеяно столько, что без индекса
+Postgres сам выбрал бы Seq Scan. Seq Scan по пустым секциям payment_data
+(будущие месяцы, default) - нормальный план и ошибкой не считается.
+"""
+import json
+import pytest
+from datetime import datetime, timedelta
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from db.models import User, UserLinks, PaymentData
+from db.migrations import run_migrations
+from misc.payment_partitions import payment_exists_stmt
+from repositories.base import BaseRepository
+
+
+HOT_QUERIES = {
+    "sub_by_uuid": select(UserLinks).filter_by(uuid="uuid-77"),
+    "links_by_user_id": select(UserLinks).filter_by(user_id=1077),
+    "user_by_user_id": select(User).filter_by(user_id=1077),
+    "payment_dedupe": payment_exists_stmt("pay-77", since=datetime.now() - timedelta(days=62)),
+    "payments_by_user_id": select(PaymentData).filter_by(user_id=1077),
+    "users_expiring": select(User.user_id).where(
+        User.subscription_end.between(datetime(2030, 1, 1), datetime(2030, 1, 2))
+    ),
+}
+
+
+async def _seed(session: AsyncSession, count: int = 5000):
+    now = datetime(2030, 1, 1)
+    await BaseRepository(session, User).bulk_create([
+        {
+            "user_id": 1000 + i,
+            "username": f"user_{i}",
+            "subscription_end": now + timedelta(hours=i) if i % 2 else None,
+        }
+        for i in range(count)
+    ])
+    await BaseRepository(session, UserLinks).bulk_create([
+        {"user_id": 1000 + i, "uuid": f"uuid-{i}", "panel1": f"https://dns1/{i}"}
+        for i in range(count)
+    ])
+    await BaseRepository(session, PaymentData).bulk_create([
+        {"payment_id": f"pay-{i}", "user_id": 1000 + i, "amount": 50}
+        for i in range(count)
+    ])
+
+    if session.get_bind().dialect.name == "postgresql":
+        for table in ("users", "links", "payment_data"):
+            await session.execute(text(f"ANALYZE {table}"))
+
+
+def _plan_nodes(node: dict):
+    yield node
+    for child in node.get("Plans", ()):
+        yield from _plan_nodes(child)
+
+
+async def _plan(session: AsyncSession, stmt) -> tuple[str, list[str]]:
+    """Текст плана и полные сканы непустых таблиц"""
+    dialect = session.get_bind().dialect
+    sql = str(stmt.compile(dialect=dialect, compile_kwargs={"literal_binds": True}))
+
+    if dialect.name == "postgresql":
+        res = await session.execute(text(f"EXPLAIN (FORMAT JSON) {sql}"))
+        root = res.scalar_one()[0]["Plan"]
+        scanned = [n["Relation Name"] for n in _plan_nodes(root) if n["Node Type"] == "Seq Scan"]
+        full_scans = []
+        for name in scanned:
+            rows = (await session.execute(text(f'SELECT count(*) FROM "{name}"'))).scalar_one()
+            if rows:
+                full_scans.append(f"{name} ({rows} rows)")
+        return json.dumps(root, indent=1), full_scans
+
+    res = await session.execute(text(f"EXPLAIN QUERY PLAN {sql}"))
+    plan = "\n".join(row[-1] for row in res)
+    return plan, [line for line in plan.splitlines() if "SCAN " in line]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("name", list(HOT_QUERIES))
+async def test_hot_query_uses_index(test_engine, test_session: AsyncSession, name: str):
+    # На PostgreSQL - схема после миграций (секции payment_data, индексы m0001)
+    await run_migrations(test_engine)
+    await _seed(test_session)
+
+    plan, full_scans = await _plan(test_session, HOT_QUERIES[name])
+
+    assert not full_scans, f"{name}: {full_scans}\n{plan}"
+    assert "Index" in plan or "INDEX" in plan, f"{name}: {plan}"
@@ -0,0 +1,61 @@
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession
+from db.models import User
+from repositories.base import BaseRepository
+import repositories.base as base_module
+
+
+@pytest.mark.asyncio
+async def test_get_many_in_filter_chunked(test_session: AsyncSession, monkeypatch):
+    """Тест: get_many с __in режет список на чанки и отдаёт Row"""
+    monkeypatch.setattr(base_module, "CHUNK_SIZE", 2)
+
+    repo = BaseRepository(session=test_session, model=User)
+    await repo.bulk_create([
+        {"user_id": 1000 + i, "username": f"user_{i}"} for i in range(5)
+    ])
+
+    rows = await repo.get_many(
+        columns=("user_id", "username"),
+        user_id__in=[1000, 1001, 1003, 1004, 9999]
+    )
+
+    assert sorted(r.user_id for r in rows) == [1000, 1001, 1003, 1004]
+    assert {r.username for r in rows} == {"user_0", "user_1", "user_3", "user_4"}
+
+
+@pytest.mark.asyncio
+async def test_bulk_upsert_updates_and_skips(test_session: AsyncSession):
+    """Тест: bulk_upsert обновляет существующие строки, [] - DO NOTHING"""
+    repo = BaseRepository(session=test_session, model=User)
+    await repo.bulk_create([{"user_id": 1, "username": "old"}])
+
+    await repo.bulk_upsert(
+        [{"user_id": 1, "username": "new"}, {"user_id": 2, "username": "second"}],
+        conflict_keys=["user_id"]
+    )
+    await repo.bulk_upsert(
+        [{"user_id": 1, "username": "ignored"}],
+        conflict_keys=["user_id"],
+        update_fields=[]
+    )
+
+    rows = await repo.get_many(user_id__in=[1, 2])
+    assert {r.user_id: r.username for r in rows} == {1: "new", 2: "second"}
+
+
+@pytest.mark.asyncio
+async def test_get_one_reuses_cached_statement(test_session: AsyncSession):
+    """Тест: get_one использует один и тот же select для одной формы фильтра"""
+    from repositories.base import _lookup_stmt
+
+    repo = BaseRepository(session=test_session, model=User)
+    await repo.create(user_id=42, username="cached")
+
+    user = await repo.get_one(user_id=42)
+    assert user is not None and user.username == "cached"
+    assert _lookup_stmt(User, ("user_id",)) is _lookup_stmt(User, ("user_id",))
+
+    # None идёт обычным путём (IS NULL)
+    user = await repo.get_one(user_id=42, subscription_end=None)
+    assert user is not None
@@ -0,0 +1,36 @@
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession
+from db.models import User
+from db.slow_queries import SlowQueryLog, query_caller, _param_shape
+from repositories.base import BaseRepository
+
+
+def test_param_shape_hides_values():
+    """Тест: в лог попадают типы параметров, а не значения"""
+    assert _param_shape((1, "secret", None), False) == "(int, str, NoneType)"
+    assert _param_shape({"user_id": 1}, False) == "{user_id: int}"
+    assert _param_shape([(1, "a"), (2, "b")], True) == "2x(int, str)"
+
+
+@pytest.mark.asyncio
+async def test_slow_query_logged_and_explained_once(test_engine, test_session: AsyncSession, tmp_path, caplog):
+    """Тест: запрос дольше порога логируется, EXPLAIN снимается один раз на текст запроса"""
+    plans = tmp_path / "plans.log"
+    slow_log = SlowQueryLog(test_engine, threshold_ms=0, explain_path=str(plans)).install()
+    token = query_caller.set("test_handler")
+
+    try:
+        repo = BaseRepository(session=test_session, model=User)
+        await repo.fetch_one(("user_id",), user_id=1)
+        await repo.fetch_one(("user_id",), user_id=2)
+
+        assert len(slow_log._pending) == 1
+        assert await slow_log.explain_pending() == 1
+    finally:
+        query_caller.reset(token)
+        slow_log.uninstall()
+
+    content = plans.read_text(encoding="utf-8")
+    assert "caller=test_handler" in content
+    assert content.count("FROM users") == 1
+    assert "SEARCH" in content or "SCAN" in content
@@ -7,7 +7,7 @@ from repositories.base import BaseRepository
 from datetime import datetime, timedelta
 from config import settings
 from redis.asyncio import Redis
-import asyncio, json
+import asyncio, json, time
 from misc.utils import pub_listner, is_cached, worker_exsists
 from core.yoomoney.payment import YooPay
 from schemas.schem import UserModel
@@ -438,9 +438,13 @@ async def test_cache_with_ttl_1_hour(redis_client: Redis, test_session: AsyncSes
     assert user is not None
     assert user.username == "test"
     
-    # Проверяем TTL (должен быть ~3600 секунд)
+    # Мягкий срок ~3600 секунд - в значении, ключ живёт ещё STALE_GRACE
+    from cache import hard_ttl
+
     ttl = await redis_client.ttl("USER_DATA:1234")
-    assert 3550 < ttl <= 3600  # С небольшим запасом на выполнение
+    assert hard_ttl(3600) - 50 < ttl <= hard_ttl(3600)  # С небольшим запасом на выполнение
+    soft = json.loads(await redis_client.get("USER_DATA:1234"))["s"]
+    assert 3550 < soft - time.time() <= 3600
 
 
 @pytest.mark.asyncio
@@ -452,9 +456,13 @@ async def test_force_refresh_with_ttl_25_hours(redis_client: Redis, test_session
     user = await is_cached(redis_client, 1234, test_session, force_refresh=True)
     assert user is not None
     
-    # Проверяем TTL (должен быть ~90000 секунд = 25 часов)
+    # Мягкий срок ~90000 секунд = 25 часов, ключ живёт ещё STALE_GRACE
+    from cache import hard_ttl
+
     ttl = await redis_client.ttl("USER_DATA:1234")
-    assert 89900 < ttl <= 90000
+    assert hard_ttl(90000) - 100 < ttl <= hard_ttl(90000)
+    soft = json.loads(await redis_client.get("USER_DATA:1234"))["s"]
+    assert 89900 < soft - time.time() <= 90000
 
 
 @pytest.mark.asyncio
@@ -510,7 +518,390 @@ async def test_nightly_worker_refreshes_all_users(redis_client: Redis, test_sess
     
     assert refreshed == 5
     
-    # Проверяем что все кеши созданы с правильным TTL
+    # Проверяем что все кеши созданы с правильным мягким сроком
     for i in range(5):
-        ttl = await redis_client.ttl(f"USER_DATA:{1000 + i}")
-        assert 89900 < ttl <= 90000  # 25 часов
\ No newline at end of file
+        soft = json.loads(await redis_client.get(f"USER_DATA:{1000 + i}"))["s"]
+        assert 89900 < soft - time.time() <= 90000  # 25 часов
+
+@pytest.mark.asyncio
+async def test_state_cache_detects_no_changes(redis_client: Redis):
+    """Тест: отпечатки последней записи позволяют пропустить задачу без БД"""
+    from misc.utils import is_unchanged, remember_state
+    from misc.metrics import get_metrics, incr_metric
+
+    sub_end = datetime(2030, 1, 1, 12, 0)
+    await remember_state(redis_client, User, 1234, {
+        "id": 1,
+        "user_id": 1234,
+        "username": "test",
+        "trial_used": True,
+        "subscription_end": sub_end
+    })
+
+    assert await is_unchanged(redis_client, User, 1234, {"username": "test", "trial_used": True})
+    assert await is_unchanged(redis_client, User, 1234, {"subscription_end": sub_end})
+    assert not await is_unchanged(redis_client, User, 1234, {"username": "other"})
+    assert not await is_unchanged(redis_client, User, 4321, {"username": "test"})
+
+    await incr_metric(redis_client, "db_worker_nochange_hit")
+    await incr_metric(redis_client, "db_worker_nochange_miss")
+    metrics = await get_metrics(redis_client)
+    assert metrics["db_worker_nochange_hit_rate"] == 0.5
+
+
+@pytest.mark.asyncio
+async def test_db_worker_state_cache_skip_and_reset(redis_client: Redis, test_session: AsyncSession, test_session_maker, create_user):
+    """Тест: db_worker пропускает задачу по отпечаткам, а запись мимо него сбрасывает их"""
+    from sqlalchemy import delete
+    from misc.utils import db_worker, register_batch
+
+    async def run_update(username: str):
+        task = {"type": "update", "model": "User", "filter": {"user_id": 4400}, "username": username}
+        await redis_client.lpush("DB", json.dumps(task, sort_keys=True)) # type: ignore
+        return await db_worker(redis_cli=redis_client, session=test_session, process_once=True)
+
+    async def username() -> str:
+        async with test_session_maker() as session:
+            return (await session.execute(select(User.username).filter_by(user_id=4400))).scalar_one()
+
+    await create_user(user_id=4400, username="old")
+
+    assert await run_update("old") == "skipped"   # сравнение с БД, отпечатки записаны
+    assert await run_update("old") == "skipped"   # быстрый путь
+    assert await redis_client.hget("METRICS", "db_worker_nochange_hit") == "1"
+
+    # Строку пересоздали мимо db_worker (регистрация после удаления)
+    async with test_session_maker() as session:
+        await session.execute(delete(User).filter_by(user_id=4400))
+        await session.commit()
+    await register_batch(redis_client, test_session_maker, [json.dumps({"user_id": 4400, "username": "new"})])
+    assert await username() == "new"
+
+    # Отпечаток «old» сброшен - задача идёт в БД и применяется
+    await run_update("old")
+    assert await redis_client.hget("METRICS", "db_worker_nochange_hit") == "1"
+    assert await username() == "old"
+
+
+@pytest.mark.asyncio
+async def test_db_worker_payment_redelivery_inserts_once(redis_client: Redis, test_session: AsyncSession, test_session_maker, create_user):
+    """Тест: повторная доставка задачи платежа из outbox не даёт второй строки"""
+    from sqlalchemy import func
+    from db.models import PaymentData
+    from misc.utils import db_worker
+
+    await create_user(user_id=4500, username="payer")
+    task = {
+        "model": "PaymentData", "type": "create", "payment_id": "order-1",
+        "user_id": 4500, "amount": 100, "created_at": datetime(2030, 1, 1, 12, 0)
+    }
+    payload = json.dumps(task, sort_keys=True, default=str)
+
+    for _ in range(2):
+        await redis_client.lpush("DB", payload) # type: ignore
+        await db_worker(redis_cli=redis_client, session=test_session, process_once=True)
+
+    async with test_session_maker() as session:
+        count = await session.scalar(select(func.count()).select_from(PaymentData).filter_by(payment_id="order-1"))
+    assert count == 1
+
+
+def test_task_decoder_only_converts_datetime_columns():
+    """Тест: декодер задач DB трогает только datetime-колонки и режет чужие поля"""
+    from db.decoders import TaskDecoder, UnknownFieldsError
+
+    decoder = TaskDecoder(User)
+    data = decoder({
+        "model": "User",
+        "type": "update",
+        "filter": {"user_id": 1234},
+        "username": "2030-01-01",
+        "subscription_end": "2030-01-01 12:00:00"
+    })
+
+    assert data["username"] == "2030-01-01"
+    assert data["subscription_end"] == datetime(2030, 1, 1, 12, 0)
+
+    with pytest.raises(UnknownFieldsError):
+        decoder({"model": "User", "type": "create", "user_id": 1, "password": "x"})
+
+    with pytest.raises(UnknownFieldsError):
+        decoder({"model": "User", "type": "update", "filter": {"uuid": "x"}})
+
+
+@pytest.mark.asyncio
+async def test_outbox_relay_pushes_batch_once(redis_client: Redis, test_session: AsyncSession):
+    """Тест: outbox отправляет пачку в Redis один раз, повторы по dedupe_key не дублируют"""
+    from misc.outbox import enqueue_outbox, push_task, set_key, relay_batch
+
+    messages = [
+        push_task("MARZBAN", {"type": "create", "user_id": "1234"}, dedupe_key="trial:1234:marzban"),
+        push_task("DB", {"model": "User", "type": "create", "user_id": "1234"}, dedupe_key="trial:1234:db"),
+        set_key("USER_DATA:1234", '{"user_id": 1234}', ttl=7200, dedupe_key="trial:1234:cache"),
+    ]
+    await enqueue_outbox(test_session, messages)
+    await enqueue_outbox(test_session, messages)  # повтор цепочки
+
+    assert await relay_batch(redis_client, test_session) == 3
+    assert await relay_batch(redis_client, test_session) == 0
+
+    assert await redis_client.llen("MARZBAN") == 1 #type: ignore
+    assert await redis_client.llen("DB") == 1 #type: ignore
+    assert 7100 < await redis_client.ttl("USER_DATA:1234") <= 7200
+
+
+@pytest.mark.asyncio
+async def test_worker_session_expunges_and_rotates(test_session_maker, redis_client):
+    """Тест: WorkerSession чистит identity map по размеру и пересоздаётся по возрасту"""
+    from db.worker_session import WorkerSession
+    from misc.metrics import get_metrics
+
+    async with test_session_maker() as session:
+        await BaseRepository(session=session, model=User).bulk_create([
+            {"user_id": 3000 + i, "username": f"bounded_{i}"} for i in range(5)
+        ])
+
+    ws = WorkerSession(test_session_maker, name="test_wrk", max_identity_map=3)
+    try:
+        res = await ws.execute(select(User).where(User.user_id >= 3000))
+        users = res.scalars().all()  # держим ссылки - identity map слабая
+        assert len(users) == 5
+        assert ws.identity_map_size == 5
+
+        await ws.maintain(redis_client)
+        assert ws.identity_map_size == 0
+
+        first = ws._session
+        ws.max_age = 0
+        await ws.maintain(redis_client)
+        assert ws._session is not first
+    finally:
+        await ws.close()
+
+    metrics = await get_metrics(redis_client)
+    assert metrics["test_wrk_session_expunges"] == 1
+    assert metrics["test_wrk_session_rotations"] == 1
+    assert metrics["test_wrk_session_identity_map"] == 0
+
+
+@pytest.mark.asyncio
+async def test_rebuild_user_cache_streams_chunks(redis_client: Redis, test_session_maker, create_user):
+    """Тест: пересборка идёт пачками по user_id: id по индексу + один SELECT ... IN на пачку"""
+    from sqlalchemy import event
+    from misc.utils import rebuild_user_cache
+
+    for i in range(7):
+        await create_user(user_id=2000 + i, username=f"bulk_{i}", trial_used=bool(i % 2))
+
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+    async with test_session_maker() as probe:
+        sync_engine = probe.bind.sync_engine
+    event.listen(sync_engine, "before_cursor_execute", listener)
+    try:
+        total = await rebuild_user_cache(redis_client, test_session_maker, chunk_size=3)
+    finally:
+        event.remove(sync_engine, "before_cursor_execute", listener)
+
+    assert total == 7
+    selects = [s for s in statements if s.lstrip().upper().startswith("SELECT")]
+    assert len(selects) == 7  # id: 3 + 3 + 1 + пустая, снимки: 3 пачки
+
+    user = await is_cached(redis_client, 2003, None) # type: ignore
+    assert user is not None and user.username == "bulk_3" and user.trial_used is True
+    soft = json.loads(await redis_client.get("USER_DATA:2006"))["s"]
+    assert 89900 < soft - time.time() <= 90000
+
+
+@pytest.mark.asyncio
+async def test_rolling_refresh_only_active_users_with_jitter(redis_client: Redis, test_session_maker, create_user):
+    """Тест: обновляются только недавно активные, мягкие сроки разнесены"""
+    from cache import LAST_SEEN_KEY, active_user_ids, touch_user
+    from misc.utils import refresh_users_slice
+
+    for i in range(20):
+        await create_user(user_id=3000 + i, username=f"active_{i}")
+    await create_user(user_id=3999, username="dormant")
+
+    for i in range(20):
+        await touch_user(redis_client, 3000 + i)
+    await redis_client.zadd(LAST_SEEN_KEY, {"3999": int(time.time()) - 90 * 86400})
+
+    user_ids = await active_user_ids(redis_client, 30 * 86400)
+    assert sorted(user_ids) == [3000 + i for i in range(20)]
+    assert await redis_client.zscore(LAST_SEEN_KEY, "3999") is None  # спящий вычищен
+
+    refreshed = await refresh_users_slice(redis_client, test_session_maker, user_ids, soft_ttl=86400, jitter=3600)
+    assert refreshed == 20
+    assert await redis_client.get("USER_DATA:3999") is None
+
+    softs = {json.loads(await redis_client.get(f"USER_DATA:{3000 + i}"))["s"] for i in range(20)}
+    assert len(softs) > 1
+    assert all(86300 < soft - time.time() <= 86400 + 3600 for soft in softs)
+
+
+@pytest.mark.asyncio
+async def test_rolling_refresh_runs_only_on_leader(redis_client: Redis, test_session_maker, create_user):
+    """Тест: скользящее обновление работает в одном процессе - пока лидер другой, не пишет"""
+    from cache import touch_user
+    from misc.leader import leader_key
+    from misc.utils import ROLLING_REFRESH_LEADER, rolling_cache_refresh_worker
+
+    await create_user(user_id=3500, username="active")
+    await touch_user(redis_client, 3500)
+    await redis_client.set(leader_key(ROLLING_REFRESH_LEADER), "other-process", ex=30)
+
+    task = asyncio.create_task(rolling_cache_refresh_worker(redis_client, test_session_maker, window=1, tick=1))
+    try:
+        await asyncio.sleep(0.3)
+        assert await redis_client.get("USER_DATA:3500") is None
+
+        # Лидер ушёл - задачу подхватывает этот процесс
+        await redis_client.delete(leader_key(ROLLING_REFRESH_LEADER))
+        for _ in range(30):
+            await asyncio.sleep(0.1)
+            if await redis_client.get("USER_DATA:3500") is not None:
+                break
+        assert await redis_client.get("USER_DATA:3500") is not None
+        assert await redis_client.get(leader_key(ROLLING_REFRESH_LEADER)) not in (None, "other-process")
+    finally:
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    assert await redis_client.get(leader_key(ROLLING_REFRESH_LEADER)) is None
+
+
+@pytest.mark.asyncio
+async def test_refresh_does_not_overwrite_newer_db_worker_write(redis_client: Redis, test_session_maker, create_user, monkeypatch):
+    """Тест: снимок, прочитанный до записи db_worker, её не затирает"""
+    import misc.utils as utils_module
+    from cache import decode_user, encode_user, store_and_release
+    from misc.utils import refresh_users_slice
+
+    await create_user(user_id=4600, username="old")
+    store_many_if_leased = utils_module.store_many_if_leased
+
+    async def db_worker_writes_first(redis_cli, entries, token):
+        # db_worker закоммитил и записал между SELECT обновления и его записью
+        newer = encode_user({"user_id": 4600, "username": "new", "trial_used": False}, soft_ttl=3600)
+        await store_and_release(redis_cli, "USER_DATA:4600", newer, ttl=7200, token=None, notify="del")
+        return await store_many_if_leased(redis_cli, entries, token)
+
+    monkeypatch.setattr(utils_module, "store_many_if_leased", db_worker_writes_first)
+
+    assert await refresh_users_slice(redis_client, test_session_maker, [4600], soft_ttl=86400, jitter=0) == 0
+    assert decode_user(await redis_client.get("USER_DATA:4600")).username == "new"
+    assert await redis_client.keys("LEASE:*") == []
+
+
+@pytest.mark.asyncio
+async def test_incremental_refresh_rewrites_changed_rows(redis_client: Redis, test_session_maker, create_user, create_user_in_links):
+    """Тест: опрос по updated_at переписывает кеш изменённых строк и двигает водяной знак"""
+    from misc.utils import refresh_changed
+
+    await create_user(user_id=4000, username="before")
+    await create_user_in_links(user_id=4000, uuid="uuid-4000")
+
+    # Первый запуск только ставит водяной знак
+    assert await refresh_changed(redis_client, test_session_maker, "users") == 0
+    assert await refresh_changed(redis_client, test_session_maker, "links") == 0
+    assert await redis_client.get("CACHE_WATERMARK:users") is not None
+
+    async with test_session_maker() as session:
+        await BaseRepository(session=session, model=User).update(data={"username": "after"}, user_id=4000)
+
+    assert await refresh_changed(redis_client, test_session_maker, "users") >= 1
+    user = await is_cached(redis_client, 4000, None) # type: ignore
+    assert user is not None and user.username == "after"
+
+    assert await refresh_changed(redis_client, test_session_maker, "links") >= 1
+    assert await redis_client.get("USER_UUID:4000") == "uuid-4000"
+
+
+@pytest.mark.asyncio
+async def test_user_uuid_has_one_encoding(redis_client: Redis, test_session: AsyncSession, test_session_maker, create_user, create_user_in_links):
+    """Тест: db_worker и обновления кеша пишут USER_UUID одинаково - uuid без кавычек, с TTL"""
+    from misc.utils import USER_UUID_TTL, db_worker, refresh_uuids
+
+    await create_user(user_id=4700, username="links")
+    task = {"model": "UserLinks", "type": "create", "user_id": 4700, "uuid": "uuid-4700"}
+    await redis_client.lpush("DB", json.dumps(task, sort_keys=True)) # type: ignore
+    await db_worker(redis_cli=redis_client, session=test_session, process_once=True)
+
+    from_worker = await redis_client.get("USER_UUID:4700")
+    assert 0 < await redis_client.ttl("USER_UUID:4700") <= USER_UUID_TTL
+
+    await redis_client.delete("USER_UUID:4700")
+    await refresh_uuids(redis_client, test_session_maker, [4700])
+
+    assert from_worker == await redis_client.get("USER_UUID:4700") == "uuid-4700"
+
+
+@pytest.mark.asyncio
+async def test_incremental_refresh_runs_only_on_leader(redis_client: Redis, test_session_maker, create_user):
+    """Тест: инкрементальное обновление не работает, пока лидер - другой процесс"""
+    from misc.leader import leader_key
+    from misc.utils import INCREMENTAL_REFRESH_LEADER, incremental_cache_refresh_worker
+
+    await redis_client.set(leader_key(INCREMENTAL_REFRESH_LEADER), "other-process", ex=30)
+
+    task = asyncio.create_task(incremental_cache_refresh_worker(redis_client, test_session_maker, interval=1))
+    try:
+        await asyncio.sleep(0.3)
+        assert await redis_client.get("CACHE_WATERMARK:users") is None
+
+        await redis_client.delete(leader_key(INCREMENTAL_REFRESH_LEADER))
+        for _ in range(30):
+            await asyncio.sleep(0.1)
+            if await redis_client.get("CACHE_WATERMARK:users") is not None:
+                break
+        assert await redis_client.get("CACHE_WATERMARK:users") is not None
+    finally:
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+
+@pytest.mark.asyncio
+async def test_incremental_refresh_starts_from_empty_table(redis_client: Redis, test_session_maker, create_user):
+    """Тест: водяной знак пустой таблицы не ломает опрос, новые строки подхватываются"""
+    from misc.utils import refresh_changed
+
+    assert await refresh_changed(redis_client, test_session_maker, "users") == 0
+
+    await create_user(user_id=4200, username="first")
+
+    assert await refresh_changed(redis_client, test_session_maker, "users") == 1
+    user = await is_cached(redis_client, 4200, None) # type: ignore
+    assert user is not None and user.username == "first"
+    assert await refresh_changed(redis_client, test_session_maker, "users") >= 0
+
+
+@pytest.mark.asyncio
+async def test_cache_notify_batch_refreshes_and_deletes(redis_client: Redis, test_session_maker, create_user, create_user_in_links):
+    """Тест: пачка NOTIFY переписывает изменённых, удалённых убирает из кеша"""
+    from misc.cache_notify import apply_cache_changes
+    from misc.utils import is_unchanged, remember_state
+
+    await create_user(user_id=4100, username="fresh")
+    await create_user_in_links(user_id=4100, uuid="uuid-4100")
+    await redis_client.set("USER_DATA:4101", json.dumps({"user_id": 4101, "username": "gone"}))
+    await redis_client.set("USER_UUID:4101", "uuid-4101")
+    await remember_state(redis_client, User, 4100, {"user_id": 4100, "username": "stale"})
+    await remember_state(redis_client, UserLinks, 4101, {"user_id": 4101, "uuid": "uuid-4101"})
+
+    changed = await apply_cache_changes(
+        redis_client,
+        test_session_maker,
+        ["users:4100", "users:4100", "links:4100", "users:4101", "links:4101", "bogus", "users:x"]
+    )
+
+    assert changed == 4
+    user = await is_cached(redis_client, 4100, None) # type: ignore
+    assert user is not None and user.username == "fresh"
+    assert await redis_client.get("USER_UUID:4100") == "uuid-4100"
+    assert await redis_client.exists("USER_DATA:4101", "USER_UUID:4101") == 0
+    # Строки менялись мимо db_worker - быстрый путь по отпечаткам не должен сработать
+    assert await redis_client.exists("DB_STATE:User:4100", "DB_STATE:UserLinks:4101") == 0
+    assert not await is_unchanged(redis_client, User, 4100, {"username": "stale"})